@@ -20,6 +20,8 @@
 
 from typing import Any, List, Tuple
 
+from gi.repository import Gio
+
 
 class IDisconnectable:
     """
@@ -30,6 +32,9 @@ class IDisconnectable:
     - Data bindings (stored in self.bindings)
     - Child disconnectable widgets (stored in self.disconnectables)
 
+    It also holds a Gio.Cancellable (self.cancellable) that is cancelled on
+    disconnection, pass it to asynchronous operations like image loading.
+
     Usage:
     ------
     1. Inherit from IDisconnectable alongside your main class:
@@ -60,6 +65,7 @@ class IDisconnectable:
         self.signals: List[Tuple[Any, int]] = []
         self.bindings: List[Any] = []
         self.disconnectables: List["IDisconnectable"] = []
+        self.cancellable: Gio.Cancellable = Gio.Cancellable.new()
 
     def connect_signal(
         self, g_object: Any, signal_name: str, callback_func: Any, *args
@@ -81,9 +87,11 @@ class IDisconnectable:
         """Disconnect all tracked signals and child disconnectable objects.
 
         This method should be called when the widget is being removed to ensure
-        proper cleanup. It disconnects all tracked signal connections and
-        recursively calls disconnect_all on child disconnectable objects.
+        proper cleanup. It disconnects all tracked signal connections, cancels
+        pending operations and recursively calls disconnect_all on child
+        disconnectable objects.
         """
+        self.cancellable.cancel()
 
         for obj, signal_id in self.signals:
             if obj.handler_is_connected(signal_id):
@@ -107,6 +115,7 @@ class IDisconnectable:
         self.signals = []
         self.bindings = []
         self.disconnectables = []
+        self.cancellable = Gio.Cancellable.new()
 
     def __repr__(self, *args) -> str | None:
         return self.__gtype_name__ if self.__gtype_name__ else None
@@ -1,5 +1,6 @@
 from .cache import HTCache
 from .discord_rpc import *
 from .player_object import PlayerObject, RepeatType
+from .queue_snapshot import HTQueueSnapshot
 from .secret_storage import SecretStore
 from .utils import *
@@ -0,0 +1,189 @@
+# blocked_list.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from collections.abc import MutableSequence
+from itertools import chain
+from typing import Any, Generic, Iterable, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class HTBlockedList(MutableSequence, Generic[T]):
+    """A list stored in blocks of bounded size, for inserts at any position.
+
+    Inserting or removing an item only shifts the items of its block. The
+    block holding a position is found in O(log n) with a Fenwick tree over
+    the block sizes, which is rebuilt when blocks are split or dropped. Since
+    blocks hold at most 2 * LOAD items, getting, inserting and removing at
+    any position is O(log n), and the ends are about as cheap as a deque.
+    """
+
+    # The number of items of a block after a split
+    LOAD: int = 256
+
+    def __init__(self, items: Iterable[T] = ()) -> None:
+        """
+        Args:
+            items: The initial items
+        """
+        items = list(items)
+        self._blocks: List[List[T]] = [
+            items[start : start + self.LOAD]
+            for start in range(0, len(items), self.LOAD)
+        ]
+        self._len = len(items)
+        self._tree: List[int] = []
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        """Build the Fenwick tree of the block sizes in O(number of blocks)"""
+        tree = [0] * (len(self._blocks) + 1)
+        for i, block in enumerate(self._blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _update(self, block_index: int, delta: int) -> None:
+        i = block_index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _locate(self, index: int) -> Tuple[int, int]:
+        """Get the block holding an index and the offset in the block"""
+        # The ends are used the most, like by a queue
+        if index < len(self._blocks[0]):
+            return 0, index
+        last = len(self._blocks) - 1
+        if index >= self._len - len(self._blocks[last]):
+            return last, index - self._len + len(self._blocks[last])
+
+        position = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            next_position = position + step
+            if next_position < len(self._tree) and self._tree[next_position] <= index:
+                position = next_position
+                index -= self._tree[next_position]
+            step >>= 1
+        return position, index
+
+    def _check_index(self, index: int) -> int:
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("list index out of range")
+        return index
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[T]:
+        return chain.from_iterable(self._blocks)
+
+    def __reversed__(self) -> Iterator[T]:
+        for block in reversed(self._blocks):
+            yield from reversed(block)
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return list(self)[index]
+        block_index, offset = self._locate(self._check_index(index))
+        return self._blocks[block_index][offset]
+
+    def __setitem__(self, index: int, value: T) -> None:
+        block_index, offset = self._locate(self._check_index(index))
+        self._blocks[block_index][offset] = value
+
+    def __delitem__(self, index: int) -> None:
+        self.pop(index)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)!r})"
+
+    def insert(self, index: int, value: T) -> None:
+        """Insert an item before an index, like list.insert.
+
+        Args:
+            index (int): The position of the new item
+            value: The item
+        """
+        if index < 0:
+            index = max(0, index + self._len)
+        index = min(index, self._len)
+
+        if not self._blocks:
+            self._blocks.append([value])
+            self._len = 1
+            self._rebuild()
+            return
+
+        if index == self._len:
+            block_index = len(self._blocks) - 1
+            offset = len(self._blocks[block_index])
+        else:
+            block_index, offset = self._locate(index)
+
+        block = self._blocks[block_index]
+        block.insert(offset, value)
+        self._len += 1
+        if len(block) > 2 * self.LOAD:
+            self._blocks[block_index : block_index + 1] = [
+                block[: self.LOAD],
+                block[self.LOAD :],
+            ]
+            self._rebuild()
+        else:
+            self._update(block_index, 1)
+
+    def pop(self, index: int = -1) -> T:
+        """Remove and return the item at an index, the last one by default.
+
+        Raises:
+            IndexError: If the list is empty or the index out of range
+        """
+        block_index, offset = self._locate(self._check_index(index))
+        block = self._blocks[block_index]
+        value = block.pop(offset)
+        self._len -= 1
+        if block:
+            self._update(block_index, -1)
+        else:
+            del self._blocks[block_index]
+            self._rebuild()
+        return value
+
+    def appendleft(self, value: T) -> None:
+        """Add an item at the start."""
+        self.insert(0, value)
+
+    def popleft(self) -> T:
+        """Remove and return the first item.
+
+        Raises:
+            IndexError: If the list is empty
+        """
+        return self.pop(0)
+
+    def clear(self) -> None:
+        self._blocks = []
+        self._len = 0
+        self._rebuild()
@@ -17,24 +17,558 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from typing import Any, Dict
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, List, Tuple, TypeVar
 
 from tidalapi.album import Album
 from tidalapi.artist import Artist
 from tidalapi.mix import Mix
 from tidalapi.playlist import Playlist
 from tidalapi.media import Track
+from tidalapi.types import ItemOrder, OrderDirection
+from tidalapi.user import Favorites, LoggedInUser
 
+from .metadata_store import HTMetadataStore
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Flight:
+    """A fetch in progress that other callers can wait on."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class HTSingleFlight:
+    """Coalesces concurrent calls for the same key into a single call.
+
+    The first caller for a key runs the function, every caller arriving while
+    it is running waits for it and gets the same result, or the same exception.
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, function: Callable[[], T]) -> T:
+        """Run function for key, or wait for the call already running for key.
+
+        Args:
+            key: The key identifying the call
+            function: The function to run if no call is running for key
+
+        Returns:
+            The value returned by the function
+
+        Raises:
+            The exception raised by the function, to every waiting caller
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.calls += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result
+
+    def stats(self) -> Dict[str, int]:
+        """Get the call counters.
+
+        Returns:
+            dict: The number of calls made and of calls saved by coalescing
+        """
+        return {"calls": self.calls, "coalesced": self.coalesced}
+
+
+class HTCacheStore(Generic[T]):
+    """A bounded, thread-safe LRU cache with an optional time to live.
+
+    Entries are evicted in least recently used order once ``max_size`` is
+    exceeded and are dropped on access once they are older than ``ttl`` seconds.
+    Concurrent misses on the same key share a single fetch.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float | None = None) -> None:
+        """
+        Args:
+            max_size (int): The maximum number of entries to keep
+            ttl (float): Seconds after which an entry expires, None to never expire
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._entries: OrderedDict[Hashable, Tuple[T, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = HTSingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def _lookup(self, key: Hashable) -> Tuple[T, float] | None:
+        """Return the entry for key, dropping it if expired. Needs self._lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> T | Any:
+        """Get a value from the cache.
+
+        Args:
+            key: The key to look up
+            default: The value returned on a miss
+
+        Returns:
+            The cached value, or default if missing or expired
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: T) -> None:
+        """Insert or replace a value, evicting the least recently used entries.
+
+        Args:
+            key: The key to store the value under
+            value: The value to store
+        """
+        with self._lock:
+            self._insert(key, value)
+
+    def _insert(self, key: Hashable, value: T) -> None:
+        """Store a value and evict the oldest entries. Needs self._lock"""
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Remove a key from the cache if present.
+
+        Args:
+            key: The key to remove
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_fetch(self, key: Hashable, fetch: Callable[[], T]) -> T:
+        """Get a value from the cache, calling fetch on a miss.
+
+        Callers missing on the same key while a fetch is running wait for it
+        and get its result or its exception.
+
+        Args:
+            key: The key to look up
+            fetch: A function returning the value to cache on a miss
+
+        Returns:
+            The cached or freshly fetched value
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        def _fetch() -> T:
+            # Another flight may have stored the value since the lookup above
+            with self._lock:
+                entry = self._lookup(key)
+            if entry is not None:
+                return entry[0]
+
+            value = fetch()
+            with self._lock:
+                # A value stored during the fetch, like by a background
+                # refresh, is newer
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry[0]
+                self._insert(key, value)
+            return value
+
+        return self._flight.do(key, _fetch)
+
+    def stats(self) -> Dict[str, int]:
+        """Get the cache counters.
+
+        Returns:
+            dict: The size, hits, misses, evictions, expirations and
+                coalesced fetches counts
+        """
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "coalesced": self._flight.coalesced,
+        }
 
-class HTCache:
-    artists: Dict[str, Artist] = {}
-    albums: Dict[str, Album] = {}
-    tracks: Dict[str, Track] = {}
-    playlists: Dict[str, Playlist] = {}
-    mixes: Dict[str, Mix] = {}
+
+class _RecordingSession:
+    """Forwards to a tidalapi session, recording the JSON of what it parses.
+
+    The tidalapi user and favorites classes are given this session, so their
+    own requests and parsers are used while the JSON of every item they
+    parse is kept to be saved.
+    """
 
     def __init__(self, session: Any) -> None:
+        self._session = session
+        # The name of the parser and the JSON of every item parsed
+        self.items: List[Tuple[str, Any]] = []
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._session, name)
+        if name.startswith("parse_"):
+            return self._recording(name, attribute)
+        return attribute
+
+    def playlist(self, *args, **kwargs) -> Playlist:
+        playlist = self._session.playlist(*args, **kwargs)
+        playlist.parse_factory = self._recording(
+            "parse_factory", playlist.parse_factory
+        )
+        return playlist
+
+    def _recording(self, name: str, parse: Callable[[Any], Any]) -> Callable:
+        def _parse(json_obj: Any) -> Any:
+            self.items.append((name, json_obj))
+            return parse(json_obj)
+
+        return _parse
+
+
+class HTCache:
+    """Caches TIDAL objects by type and id.
+
+    Every type has its own bounded store, the sizes and time to live can be
+    overridden per type with the max_sizes and ttls arguments.
+
+    If a metadata store is given, artists, albums, tracks and playlists are read
+    from it before going to the network, and stale entries are served while
+    being refreshed in background.
+    """
+
+    # API endpoint of each type that can be persisted in the metadata store
+    ENDPOINTS: Dict[str, str] = {
+        "artist": "artists/{}",
+        "album": "albums/{}",
+        "track": "tracks/{}",
+        "playlist": "playlists/{}",
+    }
+
+    DEFAULT_MAX_SIZES: Dict[str, int] = {
+        "artists": 500,
+        "albums": 1000,
+        "tracks": 2000,
+        "playlists": 200,
+        "mixes": 100,
+    }
+
+    # Playlists and mixes are edited or regenerated, so refresh them sooner
+    DEFAULT_TTLS: Dict[str, float | None] = {
+        "artists": 60 * 60,
+        "albums": 60 * 60,
+        "tracks": 60 * 60,
+        "playlists": 10 * 60,
+        "mixes": 10 * 60,
+    }
+
+    def __init__(
+        self,
+        session: Any,
+        store: HTMetadataStore | None = None,
+        max_sizes: Dict[str, int] | None = None,
+        ttls: Dict[str, float | None] | None = None,
+    ) -> None:
         self.session = session
+        self.store = store
+
+        self._refreshing: set = set()
+        self._refreshing_lock = threading.Lock()
+
+        max_sizes = {**self.DEFAULT_MAX_SIZES, **(max_sizes or {})}
+        ttls = {**self.DEFAULT_TTLS, **(ttls or {})}
+
+        self.artists: HTCacheStore[Artist] = HTCacheStore(
+            max_sizes["artists"], ttls["artists"]
+        )
+        self.albums: HTCacheStore[Album] = HTCacheStore(
+            max_sizes["albums"], ttls["albums"]
+        )
+        self.tracks: HTCacheStore[Track] = HTCacheStore(
+            max_sizes["tracks"], ttls["tracks"]
+        )
+        self.playlists: HTCacheStore[Playlist] = HTCacheStore(
+            max_sizes["playlists"], ttls["playlists"]
+        )
+        self.mixes: HTCacheStore[Mix] = HTCacheStore(
+            max_sizes["mixes"], ttls["mixes"]
+        )
+
+        self._stores: Dict[str, HTCacheStore] = {
+            "artist": self.artists,
+            "album": self.albums,
+            "track": self.tracks,
+            "playlist": self.playlists,
+        }
+
+    def _parse(self, kind: str, payload: Any, etag: str | None) -> Any:
+        if kind == "artist":
+            return self.session.parse_artist(payload)
+        if kind == "album":
+            return self.session.parse_album(payload)
+        if kind == "track":
+            return self.session.parse_track(payload)
+
+        playlist = self.session.parse_playlist(payload)
+        playlist._etag = etag
+        return playlist
+
+    def _fetch(self, kind: str, item_id: str) -> Any:
+        response = self.session.request.request(
+            "GET", self.ENDPOINTS[kind].format(item_id)
+        )
+        payload = response.json()
+        etag = response.headers.get("etag")
+        if self.store is not None:
+            self.store.put(kind, item_id, payload, etag)
+        return self._parse(kind, payload, etag)
+
+    def _load(self, kind: str, item_id: str) -> Any:
+        """Load an object from the metadata store, or from the network."""
+        if self.store is None:
+            return self._fetch(kind, item_id)
+
+        stored = self.store.get(kind, item_id)
+        if stored is not None:
+            payload, etag, fresh = stored
+            try:
+                item = self._parse(kind, payload, etag)
+            except Exception:
+                logger.exception(f"Could not parse stored {kind} {item_id}")
+                self.store.delete(kind, item_id)
+            else:
+                if not fresh:
+                    self._refresh_in_background(kind, item_id)
+                return item
+
+        return self._fetch(kind, item_id)
+
+    def _refresh_in_background(self, kind: str, item_id: str) -> None:
+        with self._refreshing_lock:
+            if (kind, item_id) in self._refreshing:
+                return
+            self._refreshing.add((kind, item_id))
+
+        def _refresh():
+            try:
+                self._stores[kind].put(item_id, self._fetch(kind, item_id))
+            except Exception:
+                logger.exception(f"Could not refresh {kind} {item_id}")
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard((kind, item_id))
+
+        threading.Thread(target=_refresh).start()
+
+    def get_cached(self, kind: str, item_id: str) -> Any | None:
+        """Get an object only if it is in memory or in the metadata store.
+
+        Args:
+            kind (str): One of "artist", "album", "track" or "playlist"
+            item_id (str): The TIDAL id of the object
+
+        Returns:
+            The object, or None if getting it would need a network request
+        """
+        cache_store = self._stores[kind]
+        item = cache_store.get(item_id)
+        if item is not None or self.store is None:
+            return item
+
+        stored = self.store.get(kind, item_id)
+        if stored is None:
+            return None
+        try:
+            item = self._parse(kind, stored[0], stored[1])
+        except Exception:
+            logger.exception(f"Could not parse stored {kind} {item_id}")
+            return None
+        cache_store.put(item_id, item)
+        return item
+
+    def fetch_favourites(self, user: Any) -> Dict[str, List[Any]]:
+        """Fetch the lists of favourites of a user and save them.
+
+        The lists are fetched with the tidalapi user and favorites methods,
+        and the JSON of every item they parse is written to the metadata
+        store, so get_cached_favourites can restore them without any request.
+
+        Args:
+            user: The logged in tidalapi user
+
+        Returns:
+            dict: The favourite artists, tracks, albums, playlists, mixes, the
+                playlists of the user and the playlists of the user with the
+                favourite ones, by list name
+        """
+        recorder = _RecordingSession(self.session)
+        favorites = Favorites(recorder, user.id)
+        recording_user = LoggedInUser(recorder, user.id)
+
+        def _playlist_and_favorite_playlists() -> List[Any]:
+            count = favorites.get_playlists_count()
+            return [
+                playlist
+                for offset in range(0, count, 50)
+                for playlist in recording_user.playlist_and_favorite_playlists(
+                    offset=offset
+                )
+            ]
+
+        lists: Dict[str, Callable[[], List[Any]]] = {
+            "artists": favorites.artists,
+            "tracks": lambda: favorites.tracks(
+                order=ItemOrder.Date, order_direction=OrderDirection.Descending
+            ),
+            "albums": favorites.albums,
+            "playlists": favorites.playlists,
+            "mixes": favorites.mixes,
+            "user_playlists": recording_user.playlists,
+            "playlist_and_favorite_playlists": _playlist_and_favorite_playlists,
+        }
+
+        favourites: Dict[str, List[Any]] = {}
+        items: Dict[str, List[Tuple[str, Any]]] = {}
+        for name, fetch in lists.items():
+            recorder.items = []
+            favourites[name] = fetch()
+            items[name] = recorder.items
+
+        if self.store is not None:
+            self.store.put(
+                "favourites",
+                str(user.id),
+                {"items": items, "ids": self.favourite_ids(favourites)},
+            )
+        return favourites
+
+    def get_cached_favourites(self, user_id: str) -> Dict[str, List[Any]] | None:
+        """Get the lists of favourites saved by fetch_favourites.
+
+        Args:
+            user_id (str): The id of the user
+
+        Returns:
+            dict: The lists like fetch_favourites returns them, None if none
+                are saved
+        """
+        if self.store is None:
+            return None
+        stored = self.store.get("favourites", str(user_id))
+        if stored is None or "items" not in stored[0]:
+            return None
+
+        favourites: Dict[str, List[Any]] = {}
+        for name, items in stored[0]["items"].items():
+            favourites[name] = []
+            for parser, payload in items:
+                try:
+                    favourites[name].append(self._parse_with(parser, payload))
+                except Exception:
+                    logger.exception(f"Could not parse an item of the {name}")
+        return favourites
+
+    def _parse_with(self, parser: str, payload: Any) -> Any:
+        """Parse the JSON of an item with the parser recorded with it."""
+        if parser == "parse_factory":
+            return self.session.playlist().parse_factory(payload)
+        if not parser.startswith("parse_"):
+            raise ValueError(f"Unknown parser {parser}")
+        return getattr(self.session, parser)(payload)
+
+    @staticmethod
+    def favourite_ids(favourites: Dict[str, List[Any]]) -> Dict[str, List[str]]:
+        """Get the ids of the favourites by type.
+
+        Args:
+            favourites (dict): The lists returned by fetch_favourites
+
+        Returns:
+            dict: The ids of the favourite artists, tracks, albums, playlists
+                and mixes
+        """
+        kinds = {
+            "artist": "artists",
+            "track": "tracks",
+            "album": "albums",
+            "playlist": "playlists",
+            "mix": "mixes",
+        }
+        return {
+            kind: [str(item.id) for item in favourites[name]]
+            for kind, name in kinds.items()
+        }
 
     def get_artist(self, artist_id: str) -> Artist:
         """Get an artist from cache or fetch from TIDAL API if not cached.
@@ -45,11 +579,9 @@ class HTCache:
         Returns:
             Artist: The artist object from TIDAL API
         """
-        if artist_id in self.artists:
-            return self.artists[artist_id]
-        artist = Artist(self.session, artist_id)
-        self.artists[artist_id] = artist
-        return artist
+        return self.artists.get_or_fetch(
+            artist_id, lambda: self._load("artist", artist_id)
+        )
 
     def get_album(self, album_id: str) -> Album:
         """Get an album from cache or fetch from TIDAL API if not cached.
@@ -60,11 +592,7 @@ class HTCache:
         Returns:
             Album: The album object from TIDAL API
         """
-        if album_id in self.albums:
-            return self.albums[album_id]
-        album = Album(self.session, album_id)
-        self.albums[album_id] = album
-        return album
+        return self.albums.get_or_fetch(album_id, lambda: self._load("album", album_id))
 
     def get_track(self, track_id: str) -> Track:
         """Get a track from cache or fetch from TIDAL API if not cached.
@@ -75,11 +603,7 @@ class HTCache:
         Returns:
             Track: The track object from TIDAL API
         """
-        if track_id in self.tracks:
-            return self.tracks[track_id]
-        track = Track(self.session, track_id)
-        self.tracks[track_id] = track
-        return track
+        return self.tracks.get_or_fetch(track_id, lambda: self._load("track", track_id))
 
     def get_playlist(self, playlist_id: str) -> Playlist:
         """Get a playlist from cache or fetch from TIDAL API if not cached.
@@ -90,11 +614,9 @@ class HTCache:
         Returns:
             Playlist: The playlist object from TIDAL API
         """
-        if playlist_id in self.playlists:
-            return self.playlists[playlist_id]
-        playlist = Playlist(self.session, playlist_id)
-        self.playlists[playlist_id] = playlist
-        return playlist
+        return self.playlists.get_or_fetch(
+            playlist_id, lambda: self._load("playlist", playlist_id)
+        )
 
     def get_mix(self, mix_id: str) -> Mix:
         """Get a mix from cache or fetch from TIDAL API if not cached.
@@ -105,8 +627,18 @@ class HTCache:
         Returns:
             Mix: The mix object from TIDAL API
         """
-        if mix_id in self.mixes:
-            return self.mixes[mix_id]
-        mix = Mix(self.session, mix_id)
-        self.mixes[mix_id] = mix
-        return mix
+        return self.mixes.get_or_fetch(mix_id, lambda: Mix(self.session, mix_id))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Get the counters of every type store.
+
+        Returns:
+            dict: The counters of each store keyed by type
+        """
+        return {
+            "artists": self.artists.stats(),
+            "albums": self.albums.stats(),
+            "tracks": self.tracks.stats(),
+            "playlists": self.playlists.stats(),
+            "mixes": self.mixes.stats(),
+        }
@@ -0,0 +1,288 @@
+# cache_index.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Set
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of the table changes, the index is then rebuilt
+SCHEMA_VERSION = 2
+
+
+class HTCacheIndex:
+    """Keeps track of the files of a cache directory in a SQLite database.
+
+    Each entry records the size of a file, the last time the app used it and
+    whether it is pinned. Access times are recorded by the app itself, so they
+    don't depend on the atime of the filesystem, and the total size is kept
+    up to date, so eviction only reads the entries it deletes.
+
+    The parts directories of partially streamed tracks are indexed as one
+    entry holding the size of their files, and evicted as a whole.
+
+    The directory is only scanned when the index is created. Accesses are
+    buffered in memory and written in batches, so a cache hit doesn't cost a
+    transaction.
+    """
+
+    # Number of buffered accesses that triggers a write
+    TOUCH_BATCH: int = 256
+
+    def __init__(self, path: Path | str, cache_dir: Path) -> None:
+        """
+        Args:
+            path: The database file, or ":memory:" for a temporary index
+            cache_dir (Path): The directory holding the indexed files
+        """
+        self.cache_dir = cache_dir
+
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        # The names of the pinned files, also the ones not cached yet
+        self._pinned: Set[str] = set()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+
+        with self._lock, self._db:
+            rebuild = (
+                self._db.execute("PRAGMA user_version").fetchone()[0]
+                != SCHEMA_VERSION
+            )
+            if rebuild:
+                self._db.execute("DROP TABLE IF EXISTS entries")
+                self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " name TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " pinned INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS entries_lru"
+                " ON entries (pinned, last_access)"
+            )
+            # Pins only last for the session that set them
+            self._db.execute("UPDATE entries SET pinned = 0 WHERE pinned = 1")
+
+        if rebuild:
+            self._scan()
+
+        with self._lock:
+            self._total = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()[0]
+
+    @staticmethod
+    def _size(file_path: Path) -> int:
+        """Get the size of a file, or of the files of a parts directory."""
+        if not file_path.is_dir():
+            return file_path.stat().st_size
+        size = 0
+        with os.scandir(file_path) as entries:
+            for entry in entries:
+                try:
+                    size += entry.stat().st_size
+                except FileNotFoundError:
+                    pass
+        return size
+
+    def _scan(self) -> None:
+        """Index the files already in the directory, starting from their atime."""
+        rows = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".tmp"):
+                    continue
+                if not entry.is_file() and not entry.name.endswith(".parts"):
+                    continue
+                try:
+                    stat = entry.stat()
+                    size = self._size(Path(entry.path))
+                except FileNotFoundError:
+                    continue
+                rows.append((entry.name, size, stat.st_atime))
+
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries (name, size, last_access)"
+                " VALUES (?, ?, ?)",
+                rows,
+            )
+        logger.info(f"Indexed {len(rows)} files of {self.cache_dir}")
+
+    def add(self, file_path: Path) -> None:
+        """Record a file written to the cache, keeping its pin.
+
+        A file pinned by set_pinned before it was written is pinned too.
+
+        Args:
+            file_path (Path): The file or parts directory in the cache directory
+        """
+        try:
+            size = self._size(file_path)
+        except FileNotFoundError:
+            return
+
+        with self._lock, self._db:
+            self._touched.pop(file_path.name, None)
+            row = self._db.execute(
+                "SELECT size FROM entries WHERE name = ?", (file_path.name,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT INTO entries (name, size, last_access, pinned)"
+                " VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (name) DO UPDATE"
+                " SET size = excluded.size, last_access = excluded.last_access,"
+                " pinned = MAX(pinned, excluded.pinned)",
+                (file_path.name, size, time.time(), file_path.name in self._pinned),
+            )
+            self._total += size - (row[0] if row else 0)
+
+    def touch(self, file_path: Path) -> None:
+        """Record that a cached file was used.
+
+        Args:
+            file_path (Path): The file in the cache directory
+        """
+        with self._lock:
+            self._touched[file_path.name] = time.time()
+            if len(self._touched) < self.TOUCH_BATCH:
+                return
+        self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered accesses to the database."""
+        with self._lock, self._db:
+            touched, self._touched = self._touched, {}
+            self._db.executemany(
+                "UPDATE entries SET last_access = ? WHERE name = ?",
+                [(last_access, name) for name, last_access in touched.items()],
+            )
+
+    def remove(self, file_path: Path) -> None:
+        """Forget a file deleted outside of the index.
+
+        Args:
+            file_path (Path): The file in the cache directory
+        """
+        with self._lock, self._db:
+            self._touched.pop(file_path.name, None)
+            row = self._db.execute(
+                "SELECT size FROM entries WHERE name = ?", (file_path.name,)
+            ).fetchone()
+            if row:
+                self._db.execute(
+                    "DELETE FROM entries WHERE name = ?", (file_path.name,)
+                )
+                self._total -= row[0]
+
+    def set_pinned(self, file_paths: Iterable[Path]) -> None:
+        """Pin the given files and unpin all the others.
+
+        Pinned files are never evicted. Paths that are not cached yet are
+        pinned when they are added.
+
+        Args:
+            file_paths: The files to keep
+        """
+        names = {file_path.name for file_path in file_paths}
+        with self._lock, self._db:
+            self._pinned = names
+            self._db.execute("UPDATE entries SET pinned = 0 WHERE pinned = 1")
+            self._db.executemany(
+                "UPDATE entries SET pinned = 1 WHERE name = ?",
+                [(name,) for name in names],
+            )
+
+    def total_size(self) -> int:
+        """Get the size of the indexed files.
+
+        Returns:
+            int: The size in bytes
+        """
+        return self._total
+
+    def evict(self, max_bytes: int, batch_size: int = 64) -> List[str]:
+        """Delete the least recently used unpinned files until the total fits.
+
+        Only the entries being deleted are read from the database.
+
+        Args:
+            max_bytes (int): The maximum size of the indexed files
+            batch_size (int): The number of entries deleted per transaction
+
+        Returns:
+            list: The names of the deleted files
+        """
+        evicted: List[str] = []
+        self.flush()
+
+        while self._total > max_bytes:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT name, size FROM entries WHERE pinned = 0"
+                    " ORDER BY last_access LIMIT ?",
+                    (batch_size,),
+                ).fetchall()
+
+            if not rows:
+                logger.warning(f"Cannot evict from {self.cache_dir}, all pinned")
+                break
+
+            removed = []
+            remaining = self._total
+            for name, size in rows:
+                if remaining <= max_bytes:
+                    break
+                path = Path(self.cache_dir, name)
+                try:
+                    if path.is_dir():
+                        shutil.rmtree(path)
+                    else:
+                        os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not evict {name}: {e}")
+                    continue
+                removed.append((name, size))
+                remaining -= size
+
+            if not removed:
+                break
+
+            with self._lock, self._db:
+                self._db.executemany(
+                    "DELETE FROM entries WHERE name = ?",
+                    [(name,) for name, _size in removed],
+                )
+                self._total -= sum(size for _name, size in removed)
+
+            evicted.extend(name for name, _size in removed)
+            logger.info(f"Evicted {len(removed)} files from {self.cache_dir}")
+            time.sleep(0.05)
+
+        return evicted
@@ -0,0 +1,314 @@
+# dash.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+import math
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urljoin
+
+from .http_client import HTHttpClient
+
+logger = logging.getLogger(__name__)
+
+_DURATION_RE = re.compile(
+    r"P(?:(?P<d>[\d.]+)D)?(?:T(?:(?P<h>[\d.]+)H)?(?:(?P<m>[\d.]+)M)?(?:(?P<s>[\d.]+)S)?)?"
+)
+_TEMPLATE_RE = re.compile(r"\$(Number|Time|RepresentationID|Bandwidth)(%0(\d+)d)?\$")
+_SEGMENT_TEMPLATE_RE = re.compile(r"<(?:\w+:)?SegmentTemplate\b[^>]*>")
+
+
+def _attribute_re(name: str) -> re.Pattern:
+    return re.compile(rf'\b{name}="[^"]*"')
+
+
+class DashError(Exception):
+    pass
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _parse_duration(value: str | None) -> float:
+    """Parse an ISO 8601 duration like PT3M32.5S to seconds."""
+    match = _DURATION_RE.fullmatch(value or "")
+    if not value or not match:
+        return 0.0
+    parts = {k: float(v) if v else 0.0 for k, v in match.groupdict().items()}
+    return parts["d"] * 86400 + parts["h"] * 3600 + parts["m"] * 60 + parts["s"]
+
+
+def _fill_template(template: str, values: Dict[str, str | int]) -> str:
+    def replace(match: re.Match) -> str:
+        value = values[match.group(1)]
+        if match.group(3):
+            return f"{int(value):0{int(match.group(3))}d}"
+        return str(value)
+
+    return _TEMPLATE_RE.sub(replace, template).replace("$$", "$")
+
+
+def _base_url(base: str, element: ET.Element) -> str:
+    base_url = element.find("BaseURL")
+    if base_url is not None and base_url.text:
+        return urljoin(base, base_url.text.strip())
+    return base
+
+
+def parse_mpd(data: str, base_url: str = "") -> List[str]:
+    """Get the segment URLs of the best audio representation of an MPD manifest.
+
+    Supports SegmentTemplate addressing, with a SegmentTimeline or a fixed
+    segment duration, and BaseURL elements.
+
+    Args:
+        data (str): The MPD manifest
+        base_url (str): The URL relative segment URLs are resolved against
+
+    Returns:
+        list: The URL of the initialization segment followed by the media
+            segments, in order
+    """
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError as e:
+        raise DashError(f"Invalid MPD manifest: {e}") from e
+
+    # Manifests may or may not use the DASH namespace
+    for element in root.iter():
+        element.tag = element.tag.rpartition("}")[2]
+
+    total_duration = _parse_duration(root.get("mediaPresentationDuration"))
+    base = _base_url(base_url, root)
+
+    period = root.find("Period")
+    if period is None:
+        raise DashError("No Period in MPD manifest")
+    base = _base_url(base, period)
+    total_duration = _parse_duration(period.get("duration")) or total_duration
+
+    representations = []
+    for adaptation_set in period.findall("AdaptationSet"):
+        for representation in adaptation_set.findall("Representation"):
+            representations.append((adaptation_set, representation))
+    if not representations:
+        raise DashError("No Representation in MPD manifest")
+
+    adaptation_set, representation = max(
+        representations, key=lambda r: int(r[1].get("bandwidth", 0))
+    )
+    base = _base_url(_base_url(base, adaptation_set), representation)
+
+    template = representation.find("SegmentTemplate")
+    if template is None:
+        template = adaptation_set.find("SegmentTemplate")
+    if template is None:
+        raise DashError("Only SegmentTemplate addressing is supported")
+
+    values: Dict[str, str | int] = {
+        "RepresentationID": representation.get("id", ""),
+        "Bandwidth": representation.get("bandwidth", "0"),
+        "Number": 0,
+        "Time": 0,
+    }
+    timescale = int(template.get("timescale", 1))
+    number = int(template.get("startNumber", 1))
+    media = template.get("media")
+    if not media:
+        raise DashError("SegmentTemplate without media attribute")
+
+    urls = []
+    initialization = template.get("initialization")
+    if initialization:
+        urls.append(urljoin(base, _fill_template(initialization, values)))
+
+    timeline = template.find("SegmentTimeline")
+    if timeline is not None:
+        end = total_duration * timescale
+        current = 0
+        for segment in timeline.findall("S"):
+            current = int(segment.get("t", current))
+            duration = int(segment.get("d"))
+            repeat = int(segment.get("r", 0))
+            if repeat < 0:
+                repeat = max(0, math.ceil((end - current) / duration) - 1)
+            for _i in range(repeat + 1):
+                values.update(Number=number, Time=current)
+                urls.append(urljoin(base, _fill_template(media, values)))
+                number += 1
+                current += duration
+    elif template.get("duration"):
+        duration = int(template.get("duration"))
+        count = math.ceil(total_duration * timescale / duration)
+        for index in range(count):
+            values.update(Number=number + index, Time=index * duration)
+            urls.append(urljoin(base, _fill_template(media, values)))
+    else:
+        raise DashError("SegmentTemplate without SegmentTimeline or duration")
+
+    return urls
+
+
+def rewrite_mpd(data: str, initialization: str, media: str) -> Tuple[str, int] | None:
+    """Point the segment template of an MPD manifest to other URLs.
+
+    Only manifests with a single SegmentTemplate with an initialization segment
+    and numbered media segments are supported, which is what TIDAL serves.
+
+    Args:
+        data (str): The MPD manifest
+        initialization (str): The new URL of the initialization segment
+        media (str): The new URL template of the media segments, using $Number$
+
+    Returns:
+        tuple: The new manifest and the number of the first media segment, or
+            None if the manifest can't be rewritten
+    """
+    templates = _SEGMENT_TEMPLATE_RE.findall(data)
+    if (
+        len(templates) != 1
+        or "$Number" not in templates[0]
+        or "initialization=" not in templates[0]
+    ):
+        return None
+
+    def replace(match: re.Match) -> str:
+        tag = match.group(0)
+        tag = _attribute_re("initialization").sub(
+            f'initialization="{initialization}"', tag
+        )
+        return _attribute_re("media").sub(f'media="{media}"', tag)
+
+    start = re.search(r'startNumber="(\d+)"', templates[0])
+    return (
+        _SEGMENT_TEMPLATE_RE.sub(replace, data),
+        int(start.group(1)) if start else 1,
+    )
+
+
+class HTDashFetcher:
+    """Downloads the segments of a DASH stream into a single MP4 file.
+
+    Segments are downloaded concurrently over the pooled connections of the
+    shared HTTP client and written to the file in order as soon as they are
+    complete, so the initialization segment followed by the media segments
+    forms a fragmented MP4. At most a few segments are held in memory.
+    """
+
+    def __init__(self, http_client: HTHttpClient, workers: int = 4) -> None:
+        """
+        Args:
+            http_client: The client used for the segment requests
+            workers (int): The number of segments downloaded at once
+        """
+        self.http_client = http_client
+        self.workers = workers
+
+        self._lock = threading.Lock()
+        self.segments = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def _get_segment(self, url: str, cancelled: threading.Event | None) -> bytes:
+        if cancelled and cancelled.is_set():
+            raise _Cancelled()
+        response = self.http_client.get(url)
+        if response.status_code != 200:
+            raise DashError(f"HTTP {response.status_code} for segment {url}")
+        return response.content
+
+    def fetch(
+        self,
+        urls: List[str],
+        path: Path,
+        progress: Callable[[float], None] | None = None,
+        cancelled: threading.Event | None = None,
+    ) -> bool:
+        """Download segments and write them to a file, in order.
+
+        Args:
+            urls: The segment URLs, initialization segment first
+            path (Path): The file to write, overwritten if it exists
+            progress: Called with the fraction of segments written
+            cancelled: Stops the download when set
+
+        Returns:
+            bool: True if every segment was written, False if cancelled
+        """
+        start = time.monotonic()
+        written = 0
+
+        # Bounds the number of downloaded segments waiting to be written
+        window = self.workers * 2
+        futures: Dict[int, Future] = {}
+
+        with ThreadPoolExecutor(self.workers) as executor, open(path, "wb") as f:
+            try:
+                for index in range(len(urls)):
+                    if cancelled and cancelled.is_set():
+                        raise _Cancelled()
+                    while len(futures) < window and index + len(futures) < len(urls):
+                        next_index = index + len(futures)
+                        futures[next_index] = executor.submit(
+                            self._get_segment, urls[next_index], cancelled
+                        )
+
+                    data = futures.pop(index).result()
+                    f.write(data)
+                    written += len(data)
+                    if progress:
+                        progress((index + 1) / len(urls))
+            except _Cancelled:
+                return False
+            finally:
+                for future in futures.values():
+                    future.cancel()
+
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self.segments += len(urls)
+            self.bytes += written
+            self.seconds += elapsed
+
+        logger.info(
+            f"Fetched {len(urls)} segments, {written / 1e6:.1f} MB in {elapsed:.1f}s"
+            f" ({written * 8 / 1e6 / max(elapsed, 1e-6):.1f} Mbit/s)"
+        )
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        """Get the throughput counters of every completed download.
+
+        Returns:
+            dict: The number of segments and bytes fetched, the time spent and
+                the average throughput in bytes per second
+        """
+        with self._lock:
+            return {
+                "segments": self.segments,
+                "bytes": self.bytes,
+                "seconds": self.seconds,
+                "throughput": self.bytes / self.seconds if self.seconds else 0.0,
+            }
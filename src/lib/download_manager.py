@@ -0,0 +1,281 @@
+# download_manager.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+import threading
+from collections import OrderedDict, deque
+from enum import IntEnum
+from pathlib import Path
+from typing import Deque, Hashable, Iterable, List, Tuple
+
+from gi.repository import GLib, GObject
+
+from tidalapi.media import ManifestMimeType, Track
+
+from . import utils
+from .dash import HTDashFetcher, parse_mpd
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadState(IntEnum):
+    QUEUED = 0
+    RUNNING = 1
+    DONE = 2
+    FAILED = 3
+    CANCELLED = 4
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class HTDownloadJob:
+    """The download of a track to the music cache."""
+
+    def __init__(
+        self,
+        track: Track,
+        quality: str,
+        mime_type: ManifestMimeType,
+        source: str,
+    ) -> None:
+        """
+        Args:
+            track: The track
+            quality (str): The audio quality of the stream
+            mime_type: The manifest type of the stream
+            source (str): The MPD manifest, or the URL of a BTS stream
+        """
+        self.track = track
+        self.quality = quality
+        self.key: Tuple[int, str] = (track.id, quality)
+        self.mime_type = mime_type
+        self.source = source
+        self.path: Path = utils.MUSIC_DIR / f"{track.id}_{quality}.m4a"
+
+        self.state = DownloadState.QUEUED
+        self.progress = 0.0
+        self.error: str | None = None
+
+        self._cancelled = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.state >= DownloadState.DONE
+
+
+class HTDownloadManager(GObject.GObject):
+    """Downloads tracks to the music cache with a limited concurrency.
+
+    Jobs are queued and started in order, at most max_concurrent at a time, so
+    the downloads don't compete with the playing stream. A track is downloaded
+    only once per quality, submitting it again returns the existing job.
+
+    The job-changed signal is emitted on the main thread when the state or the
+    progress of a job changes.
+    """
+
+    __gsignals__ = {
+        "job-changed": (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+    }
+
+    # Number of finished jobs kept for reporting
+    MAX_FINISHED = 50
+
+    def __init__(self, max_concurrent: int = 1) -> None:
+        """
+        Args:
+            max_concurrent (int): The number of downloads running at once
+        """
+        GObject.GObject.__init__(self)
+
+        self.max_concurrent = max_concurrent
+
+        self._lock = threading.Lock()
+        self._pending: Deque[HTDownloadJob] = deque()
+        self._jobs: OrderedDict[Hashable, HTDownloadJob] = OrderedDict()
+        self._running = 0
+
+        self.dash_fetcher = HTDashFetcher(utils.http_client)
+
+    def submit(
+        self,
+        track: Track,
+        quality: str,
+        mime_type: ManifestMimeType,
+        source: str,
+    ) -> HTDownloadJob | None:
+        """Queue the download of a track, unless it is cached or queued already.
+
+        Args:
+            track: The track
+            quality (str): The audio quality of the stream
+            mime_type: The manifest type of the stream
+            source (str): The MPD manifest, or the URL of a BTS stream
+
+        Returns:
+            HTDownloadJob: The new or existing job, None if already cached
+        """
+        job = HTDownloadJob(track, quality, mime_type, source)
+
+        with self._lock:
+            existing = self._jobs.get(job.key)
+            if existing and not existing.finished:
+                return existing
+            if job.path.exists():
+                return None
+
+            self._jobs.pop(job.key, None)
+            self._jobs[job.key] = job
+            self._pending.append(job)
+            self._prune()
+            self._start_next()
+
+        self._notify(job)
+        return job
+
+    def cancel(self, key: Hashable) -> None:
+        """Cancel a queued or running job.
+
+        Args:
+            key: The (track id, quality) of the job
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+        if job:
+            self._cancel(job)
+
+    def cancel_except(self, keys: Iterable[Hashable]) -> None:
+        """Cancel every unfinished job except the given ones.
+
+        Args:
+            keys: The (track id, quality) of the jobs to keep
+        """
+        keep = set(keys)
+        with self._lock:
+            jobs = [
+                job
+                for key, job in self._jobs.items()
+                if key not in keep and not job.finished
+            ]
+        for job in jobs:
+            self._cancel(job)
+
+    def _cancel(self, job: HTDownloadJob) -> None:
+        job._cancelled.set()
+
+        with self._lock:
+            if job.state != DownloadState.QUEUED:
+                return
+            job.state = DownloadState.CANCELLED
+        logger.info(f"Cancelled download of {job.track.id}")
+        self._notify(job)
+
+    def jobs(self) -> List[HTDownloadJob]:
+        """Get the queued, running and recently finished jobs.
+
+        Returns:
+            list: The jobs, oldest first
+        """
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs. Needs self._lock"""
+        finished = [key for key, job in self._jobs.items() if job.finished]
+        for key in finished[: max(0, len(finished) - self.MAX_FINISHED)]:
+            del self._jobs[key]
+
+    def _start_next(self) -> None:
+        """Start queued jobs while there are free slots. Needs self._lock"""
+        while self._running < self.max_concurrent and self._pending:
+            job = self._pending.popleft()
+            if job.state != DownloadState.QUEUED:
+                continue
+            job.state = DownloadState.RUNNING
+            self._running += 1
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _run(self, job: HTDownloadJob) -> None:
+        self._notify(job)
+        tmp = job.path.with_suffix(".tmp")
+
+        try:
+            logger.info(f"Caching track: {job.track.id}")
+            if job.mime_type == ManifestMimeType.MPD:
+                self._download_mpd(job, tmp)
+            else:
+                self._download_bts(job, tmp)
+
+            tmp.rename(job.path)
+            utils.music_cache_index.add(job.path)
+            job.progress = 1.0
+            job.state = DownloadState.DONE
+            logger.info(f"Cached track: {job.track.id}")
+        except _Cancelled:
+            job.state = DownloadState.CANCELLED
+            logger.info(f"Cancelled download of {job.track.id}")
+        except Exception as e:
+            job.state = DownloadState.FAILED
+            job.error = str(e)
+            logger.warning(f"Failed to cache track {job.track.id}: {e}")
+        finally:
+            tmp.unlink(missing_ok=True)
+            with self._lock:
+                self._running -= 1
+                self._start_next()
+            self._notify(job)
+
+    def _set_progress(self, job: HTDownloadJob, progress: float) -> None:
+        """Update the progress, notifying only steps of at least 1%"""
+        progress = min(progress, 1.0)
+        if progress - job.progress >= 0.01:
+            job.progress = progress
+            self._notify(job)
+
+    def _download_mpd(self, job: HTDownloadJob, tmp: Path) -> None:
+        urls = parse_mpd(job.source)
+        completed = self.dash_fetcher.fetch(
+            urls,
+            tmp,
+            progress=lambda progress: self._set_progress(job, progress),
+            cancelled=job._cancelled,
+        )
+        if not completed:
+            raise _Cancelled()
+
+    def _download_bts(self, job: HTDownloadJob, tmp: Path) -> None:
+        with utils.http_client.get(job.source, stream=True) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+
+            total = int(response.headers.get("Content-Length") or 0)
+            written = 0
+            with open(tmp, "wb") as f:
+                for chunk in response.iter_content(chunk_size=65536):
+                    if job._cancelled.is_set():
+                        raise _Cancelled()
+                    f.write(chunk)
+                    written += len(chunk)
+                    if total:
+                        self._set_progress(job, written / total)
+
+    def _notify(self, job: HTDownloadJob) -> None:
+        GLib.idle_add(self.emit, "job-changed", job)
@@ -0,0 +1,115 @@
+# http_client.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+from typing import Any, Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class HTHttpClient:
+    """A connection pooled HTTP client shared by every download.
+
+    All requests go through the same adapter, so connections to a host are
+    kept alive and reused. The adapter can also be mounted on other sessions,
+    like the one of tidalapi, to share the pools and the retry policy.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 8,
+        pool_maxsize: int = 16,
+        timeout: Tuple[float, float] = (5.0, 30.0),
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+    ) -> None:
+        """
+        Args:
+            pool_connections (int): The number of hosts to keep pools for
+            pool_maxsize (int): The number of connections kept per host
+            timeout (tuple): The default connect and read timeouts in seconds
+            retries (int): How many times a failed request is retried
+            backoff_factor (float): The base of the exponential retry delay
+        """
+        self.timeout = timeout
+
+        retry = Retry(
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry,
+        )
+
+        self.session = requests.Session()
+        self.mount(self.session)
+
+    def mount(self, session: requests.Session) -> None:
+        """Make a session use the shared connection pools and retry policy.
+
+        Args:
+            session: The requests session
+        """
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        """Send a GET request using the shared pools.
+
+        Args:
+            url (str): The URL
+            **kwargs: Passed to requests, timeout defaults to the client one
+
+        Returns:
+            requests.Response: The response, close it when streaming
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Get the connection counters of every pooled host.
+
+        Returns:
+            dict: For each host the number of requests, of connections opened
+                and of requests that reused an open connection
+        """
+        stats: Dict[str, Dict[str, int]] = {}
+        pools = self.adapter.poolmanager.pools
+        with pools.lock:
+            pool_list = list(pools._container.values())
+
+        for pool in pool_list:
+            host_stats = stats.setdefault(
+                pool.host, {"requests": 0, "connections": 0, "reused": 0}
+            )
+            host_stats["requests"] += pool.num_requests
+            host_stats["connections"] += pool.num_connections
+            host_stats["reused"] += max(0, pool.num_requests - pool.num_connections)
+
+        return stats
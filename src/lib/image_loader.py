@@ -0,0 +1,229 @@
+# image_loader.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import itertools
+import logging
+import queue
+import threading
+from enum import IntEnum
+from typing import Any, Callable, Dict, Hashable, List
+
+from gi.repository import Gio, GLib
+
+logger = logging.getLogger(__name__)
+
+
+class ImagePriority(IntEnum):
+    """Lower values are loaded first"""
+
+    PLAYER = 0
+    VISIBLE = 1
+    HIDDEN = 2
+
+
+class _ImageRequest:
+    """A widget waiting for an image."""
+
+    def __init__(
+        self,
+        callback: Callable[[str | None], None],
+        cancellable: Gio.Cancellable,
+        widget: Any | None,
+    ) -> None:
+        self.callback = callback
+        self.cancellable = cancellable
+        self.widget = widget
+        self.map_handler: int | None = None
+
+
+class _ImageJob:
+    """A single download shared by every request for the same key."""
+
+    def __init__(self, key: Hashable, item: Any, dimensions: int) -> None:
+        self.key = key
+        self.item = item
+        self.dimensions = dimensions
+        self.priority = ImagePriority.HIDDEN
+        self.started = False
+        self.requests: List[_ImageRequest] = []
+
+
+class HTImageLoader:
+    """Loads images with a fixed pool of worker threads.
+
+    Requests are served by priority: the player first, then widgets that are
+    on screen, then the others. A request for a widget that is not mapped yet is
+    promoted when the widget gets mapped. Requests for the same item and size
+    share one download, and jobs whose requests were all cancelled are skipped.
+
+    The public methods have to be called from the main thread.
+    """
+
+    def __init__(
+        self, fetch: Callable[[Any, int], str | None], workers: int = 4
+    ) -> None:
+        """
+        Args:
+            fetch: A function returning the local path of the image of an item
+                at the given dimensions, it runs in the worker threads
+            workers (int): The number of worker threads
+        """
+        self.fetch = fetch
+        self.n_workers = workers
+
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._jobs: Dict[Hashable, _ImageJob] = {}
+        self._lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+
+        self.requested = 0
+        self.deduplicated = 0
+        self.cancelled = 0
+        self.loaded = 0
+
+    def request(
+        self,
+        item: Any,
+        dimensions: int,
+        callback: Callable[[str | None], None],
+        cancellable: Gio.Cancellable | None = None,
+        widget: Any | None = None,
+        priority: ImagePriority | None = None,
+    ) -> None:
+        """Request the image of an item, callback is called on the main thread.
+
+        Args:
+            item: A TIDAL object with image data
+            dimensions (int): The image dimensions
+            callback: Called with the local path of the image, or None on failure
+            cancellable: Cancels the request, the callback won't be called
+            widget: The widget showing the image, used to compute the priority
+            priority: Overrides the priority computed from the widget
+        """
+        if cancellable is None:
+            cancellable = Gio.Cancellable.new()
+
+        if priority is None:
+            if widget is not None and widget.get_mapped():
+                priority = ImagePriority.VISIBLE
+            else:
+                priority = ImagePriority.HIDDEN
+
+        request = _ImageRequest(callback, cancellable, widget)
+        key = (getattr(item, "id", None) or id(item), dimensions)
+
+        with self._lock:
+            self.requested += 1
+            job = self._jobs.get(key)
+            if job is None:
+                job = _ImageJob(key, item, dimensions)
+                self._jobs[key] = job
+                self._push(job, priority, new=True)
+            else:
+                self.deduplicated += 1
+                self._push(job, priority)
+            job.requests.append(request)
+
+        if widget is not None and priority == ImagePriority.HIDDEN:
+            request.map_handler = widget.connect(
+                "map", lambda *_: self._promote(job, request)
+            )
+
+        self._start_workers()
+
+    def _push(
+        self, job: _ImageJob, priority: ImagePriority, new: bool = False
+    ) -> None:
+        """Queue a job if it is new or the priority is higher than its current one.
+
+        Older queue entries of a promoted job are skipped by the workers.
+        Needs self._lock.
+        """
+        if job.started or (not new and priority >= job.priority):
+            return
+        job.priority = priority
+        self._queue.put((priority, next(self._counter), job))
+
+    def _promote(self, job: _ImageJob, request: _ImageRequest) -> None:
+        self._disconnect_map(request)
+        with self._lock:
+            self._push(job, ImagePriority.VISIBLE)
+
+    def _disconnect_map(self, request: _ImageRequest) -> None:
+        if request.map_handler is None:
+            return
+        if request.widget.handler_is_connected(request.map_handler):
+            request.widget.disconnect(request.map_handler)
+        request.map_handler = None
+
+    def _start_workers(self) -> None:
+        while len(self._workers) < self.n_workers:
+            worker = threading.Thread(target=self._work, daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _work(self) -> None:
+        while True:
+            priority, _count, job = self._queue.get()
+
+            with self._lock:
+                # Stale entry of a promoted or finished job
+                if job.started or priority != job.priority:
+                    continue
+                job.started = True
+                if all(r.cancellable.is_cancelled() for r in job.requests):
+                    del self._jobs[job.key]
+                    self.cancelled += 1
+                    GLib.idle_add(self._finish, job.requests, None)
+                    continue
+
+            try:
+                file_path = self.fetch(job.item, job.dimensions)
+            except Exception:
+                logger.exception("Could not load image")
+                file_path = None
+
+            with self._lock:
+                del self._jobs[job.key]
+                self.loaded += 1
+
+            GLib.idle_add(self._finish, job.requests, file_path)
+
+    def _finish(self, requests: List[_ImageRequest], file_path: str | None) -> None:
+        for request in requests:
+            self._disconnect_map(request)
+            if file_path and not request.cancellable.is_cancelled():
+                request.callback(file_path)
+
+    def stats(self) -> Dict[str, int]:
+        """Get the loader counters.
+
+        Returns:
+            dict: The number of requests, of requests served by an already
+                queued job, of jobs skipped because cancelled, of jobs loaded and
+                of jobs still pending
+        """
+        return {
+            "requested": self.requested,
+            "deduplicated": self.deduplicated,
+            "cancelled": self.cancelled,
+            "loaded": self.loaded,
+            "pending": len(self._jobs),
+        }
@@ -0,0 +1,164 @@
+# metadata_store.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import tidalapi
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of the table or of the stored payloads changes
+SCHEMA_VERSION = 1
+
+
+class HTMetadataStore:
+    """Persists raw TIDAL API responses in a SQLite database.
+
+    Rows are keyed by type and id and store the JSON body of the response, so
+    objects can be parsed again with the session parsers on the next launch
+    without any network request. Each row records the tidalapi version it was
+    written with, rows from other versions are ignored.
+    """
+
+    # Seconds after which a payload is still served but refreshed in background
+    DEFAULT_TTLS: Dict[str, float] = {
+        "artist": 24 * 60 * 60,
+        "album": 7 * 24 * 60 * 60,
+        "track": 7 * 24 * 60 * 60,
+        "playlist": 60 * 60,
+        "favourites": 0,
+    }
+
+    # Seconds after which a payload is not served anymore
+    MAX_AGE: float = 30 * 24 * 60 * 60
+
+    def __init__(
+        self, path: Path | str, ttls: Dict[str, float] | None = None
+    ) -> None:
+        """
+        Args:
+            path: The database file, or ":memory:" for a temporary store
+            ttls (dict): Overrides of the refresh interval per type
+        """
+        self.ttls = {**self.DEFAULT_TTLS, **(ttls or {})}
+        self.version = f"{SCHEMA_VERSION}:{tidalapi.__version__}"
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+
+        with self._lock, self._db:
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self._db.execute("DROP TABLE IF EXISTS metadata")
+                self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                " kind TEXT NOT NULL,"
+                " id TEXT NOT NULL,"
+                " version TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " etag TEXT,"
+                " payload TEXT NOT NULL,"
+                " PRIMARY KEY (kind, id))"
+            )
+
+    def get(self, kind: str, item_id: str) -> Tuple[Any, str | None, bool] | None:
+        """Get a stored payload.
+
+        Args:
+            kind (str): The type of the object, like "album"
+            item_id (str): The TIDAL id of the object
+
+        Returns:
+            tuple: The decoded payload, its etag and whether it is still fresh,
+                or None if nothing usable is stored
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version, fetched_at, etag, payload FROM metadata"
+                " WHERE kind = ? AND id = ?",
+                (kind, str(item_id)),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        version, fetched_at, etag, payload = row
+        age = time.time() - fetched_at
+        if version != self.version or age > self.MAX_AGE:
+            return None
+
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Dropping corrupted {kind} {item_id} from metadata store")
+            self.delete(kind, item_id)
+            return None
+
+        return data, etag, age <= self.ttls.get(kind, 0)
+
+    def put(
+        self, kind: str, item_id: str, payload: Any, etag: str | None = None
+    ) -> None:
+        """Store a payload, replacing the previous one.
+
+        Args:
+            kind (str): The type of the object, like "album"
+            item_id (str): The TIDAL id of the object
+            payload: JSON serializable data
+            etag (str): The etag of the response, if any
+        """
+        data = json.dumps(payload, separators=(",", ":"))
+        try:
+            with self._lock, self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?)",
+                    (kind, str(item_id), self.version, time.time(), etag, data),
+                )
+        except sqlite3.Error:
+            logger.exception(f"Could not store {kind} {item_id}")
+
+    def delete(self, kind: str, item_id: str) -> None:
+        """Remove a payload from the store.
+
+        Args:
+            kind (str): The type of the object, like "album"
+            item_id (str): The TIDAL id of the object
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM metadata WHERE kind = ? AND id = ?", (kind, str(item_id))
+            )
+
+    def clear(self, kind: str | None = None) -> None:
+        """Remove every payload, or only the ones of a type.
+
+        Args:
+            kind (str): The type to clear, None to clear everything
+        """
+        with self._lock, self._db:
+            if kind is None:
+                self._db.execute("DELETE FROM metadata")
+            else:
+                self._db.execute("DELETE FROM metadata WHERE kind = ?", (kind,))
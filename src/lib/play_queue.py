@@ -0,0 +1,629 @@
+# play_queue.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import random
+from bisect import bisect_left, insort
+from collections import deque
+from collections.abc import Sequence
+from enum import IntFlag
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, Iterator, List, Set, Tuple, Union
+
+from gi.repository import GLib, GObject
+
+from tidalapi.media import Track
+
+from .blocked_list import HTBlockedList
+from .track_source import HTTrackSource
+
+
+class QueuePart(IntFlag):
+    HISTORY = 1
+    QUEUE = 2
+    UPCOMING = 4
+
+
+class _LinearOrder:
+    """The source positions in order, starting from the anchor and wrapping
+    around to the ones before it."""
+
+    def __init__(self, size: int, anchor: int) -> None:
+        self.size = size
+        self.anchor = anchor
+
+    def position(self, step: int) -> int:
+        return (self.anchor + step) % self.size
+
+    def step_of(self, position: int) -> int:
+        return (position - self.anchor) % self.size
+
+
+class _ShuffleOrder:
+    """A random permutation of the source positions, starting from the anchor.
+
+    The permutation is generated lazily with the Fisher–Yates algorithm, one
+    step at a time in O(1). Only the swapped slots are stored, not a shuffled
+    copy of the source, and the same seed and anchor always give the same
+    order.
+    """
+
+    def __init__(self, size: int, anchor: int, seed: int) -> None:
+        self.size = size
+        self.anchor = anchor
+        self.seed = seed
+
+        self._random = random.Random(seed)
+        # The slots of the positions not generated yet that were swapped
+        self._swaps: Dict[int, int] = {}
+        self._positions: List[int] = []
+        self._steps: Dict[int, int] = {}
+
+        self._swap(0, anchor)
+
+    def _swap(self, i: int, j: int) -> None:
+        self._swaps[i], self._swaps[j] = (
+            self._swaps.get(j, j),
+            self._swaps.get(i, i),
+        )
+
+    def position(self, step: int) -> int:
+        while len(self._positions) <= step:
+            slot = len(self._positions)
+            # The anchor is always first
+            if slot:
+                self._swap(slot, self._random.randrange(slot, self.size))
+            position = self._swaps.pop(slot, slot)
+            self._steps[position] = slot
+            self._positions.append(position)
+        return self._positions[step]
+
+    def step_of(self, position: int) -> int:
+        while position not in self._steps:
+            self.position(len(self._positions))
+        return self._steps[position]
+
+
+class _Upcoming(Sequence):
+    """A read-only view of the upcoming tracks of a HTPlayQueue"""
+
+    def __init__(self, play_queue: "HTPlayQueue") -> None:
+        self._play_queue = play_queue
+
+    def __len__(self) -> int:
+        play_queue = self._play_queue
+        return len(play_queue._pushed) + play_queue._order.size - play_queue._cursor
+
+    def __iter__(self) -> Iterator[Track]:
+        """Iterate over the upcoming tracks, stopping at the first one that
+        isn't loaded yet"""
+        play_queue = self._play_queue
+        yield from play_queue._pushed
+        for step in range(play_queue._cursor, play_queue._order.size):
+            track = play_queue._get(play_queue._order.position(step))
+            if track is None:
+                return
+            yield track
+
+    def __getitem__(self, index: int) -> Track:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("upcoming track index out of range")
+        track = next(islice(self, index, None), None)
+        if track is None:
+            raise IndexError("upcoming track not loaded yet")
+        return track
+
+
+class HTPlayQueue(GObject.GObject):
+    """The played, queued and upcoming tracks of the player.
+
+    The history is a deque, the queue a HTBlockedList and the upcoming tracks
+    are a cursor over an order of the source positions, so moving to the next
+    or previous track is O(1) whatever the length of the source, and tracks
+    are inserted in or removed from the queue in O(log n). When shuffled, the order
+    is a permutation generated lazily from a seed, which can be saved to
+    restore the same order later. The position of a track in the source is
+    looked up by id in a dict built once when the source is set.
+
+    The source can be a HTTrackSource, which is indexed as its pages load.
+    The pages of the next upcoming tracks are loaded in background.
+
+    The changed signal is emitted after every change with the `QueuePart`
+    flags of the parts that changed, load-failed when a page of the source
+    could not be loaded.
+    """
+
+    __gsignals__ = {
+        "changed": (GObject.SignalFlags.RUN_FIRST, None, (int,)),
+        "load-failed": (GObject.SignalFlags.RUN_FIRST, None, ()),
+    }
+
+    # The number of upcoming tracks whose pages are loaded in advance
+    PREFETCH_AHEAD: int = 20
+
+    def __init__(self) -> None:
+        GObject.GObject.__init__(self)
+
+        self._source: Union[List[Track], HTTrackSource] = []
+        self._source_handlers: List[int] = []
+        self._id_index: Dict[int, int] = {}
+        # The positions of the available tracks of the source, in order
+        self._available: List[int] = []
+        # The offsets of the pages of a HTTrackSource already indexed
+        self._indexed: Set[int] = set()
+
+        self._history: Deque[Track] = deque()
+        self._queue: HTBlockedList[Track] = HTBlockedList()
+
+        self._order: _LinearOrder | _ShuffleOrder = _LinearOrder(0, 0)
+        # The number of steps of the order already played
+        self._cursor = 0
+        # Tracks put back before the rest of the order
+        self._pushed: Deque[Track] = deque()
+        self._upcoming = _Upcoming(self)
+
+    @property
+    def source(self) -> Union[List[Track], HTTrackSource]:
+        """The tracks of the played source, in their original order"""
+        return self._source
+
+    @property
+    def history(self) -> Deque[Track]:
+        """The played tracks, the most recent last"""
+        return self._history
+
+    @property
+    def queue(self) -> HTBlockedList[Track]:
+        """The tracks added by the user, played before the upcoming ones"""
+        return self._queue
+
+    @property
+    def upcoming(self) -> _Upcoming:
+        """The tracks to play from the source, shuffled if shuffle is on"""
+        return self._upcoming
+
+    @property
+    def shuffled(self) -> bool:
+        return isinstance(self._order, _ShuffleOrder)
+
+    def set_source(
+        self, tracks: Union[List[Track], HTTrackSource], start: int = 0
+    ) -> None:
+        """Replace the tracks to play and clear the history.
+
+        The tracks are played from the first available one from start and
+        continue from the beginning of the list after the last one. The queue
+        is kept, the tracks are not shuffled until set_shuffle is called.
+
+        Args:
+            tracks: The tracks of the source
+            start (int): The position of the first track to play
+        """
+        for handler in self._source_handlers:
+            self._source.disconnect(handler)
+        self._source_handlers = []
+
+        self._source = tracks
+        self._id_index = {}
+        self._available = []
+        self._indexed = set()
+        if isinstance(tracks, HTTrackSource):
+            for offset, page in tracks.loaded_pages():
+                self._index(offset, page)
+            self._source_handlers = [
+                tracks.connect("page-loaded", self._on_page_loaded),
+                tracks.connect("size-changed", self._on_size_changed),
+                tracks.connect("load-failed", self._on_load_failed),
+            ]
+        else:
+            self._index(0, tracks)
+
+        anchor = self.next_available(start)
+        if anchor is None:
+            # No track is available, or the page of the next one is loading
+            anchor = start % len(tracks) if len(tracks) else 0
+        self._order = _LinearOrder(len(tracks), anchor)
+        self._cursor = 0
+        self._pushed.clear()
+        self._history.clear()
+
+        self._prefetch()
+        self._changed(QueuePart.HISTORY | QueuePart.UPCOMING)
+
+    def index_of(self, track_id: int) -> int | None:
+        """Get the position of a track in the source.
+
+        Args:
+            track_id (int): The id of the track
+
+        Returns:
+            int: The position of the first track with this id, None if missing
+        """
+        return self._id_index.get(track_id)
+
+    def next_available(self, position: int) -> int | None:
+        """Get the position of the first available track from a position.
+
+        The pages of a HTTrackSource are searched in order until the first
+        one that isn't loaded, which the source then loads in background.
+
+        Args:
+            position (int): The position in the source to start from, wrapping
+                around to the beginning after the last track
+
+        Returns:
+            int: The position of the available track, None if there are none
+                or the search reached a page that isn't loaded
+        """
+        if isinstance(self._source, HTTrackSource):
+            return self._source.first_available(position)
+        if not self._available:
+            return None
+        index = bisect_left(self._available, position % len(self._source))
+        return self._available[index % len(self._available)]
+
+    def next_loaded(self, queued: bool = True) -> bool:
+        """Whether pop_next can return without loading a page of the source.
+
+        Args:
+            queued (bool): Whether the track would be taken from the queue
+
+        Returns:
+            bool: False if the page of the next upcoming track isn't loaded
+        """
+        if (queued and self._queue) or self._pushed:
+            return True
+        if self._cursor >= self._order.size:
+            return True
+        position = self._order.position(self._cursor)
+        return self._get(position) is not None or self._is_missing(position)
+
+    def load_next(self, callback: Callable[..., Any], *args: Any) -> None:
+        """Load the page of the next upcoming track in background.
+
+        Args:
+            callback: Called with args in the main loop once it is loaded
+            *args: The arguments of callback
+        """
+        if isinstance(self._source, HTTrackSource) and not self.next_loaded():
+            position = self._order.position(self._cursor)
+            self._source.prefetch([position], callback, *args)
+        else:
+            GLib.idle_add(callback, *args)
+
+    def pop_next(self, queued: bool = True) -> Track | None:
+        """Remove and return the next track, queued tracks first.
+
+        Blocks if the page of the track isn't loaded, see next_loaded.
+
+        Args:
+            queued (bool): Whether to take the track from the queue if any
+
+        Returns:
+            Track: The next track, None if there are no more tracks
+        """
+        if queued and self._queue:
+            track = self._queue.popleft()
+            self._changed(QueuePart.QUEUE)
+            return track
+
+        if self._pushed:
+            track = self._pushed.popleft()
+        else:
+            track = None
+            cursor = self._cursor
+            while track is None and self._cursor < self._order.size:
+                position = self._order.position(self._cursor)
+                self._cursor += 1
+                # Skip the tracks a short page of the source turned out not
+                # to have, until the source shrinks
+                if not self._is_missing(position):
+                    track = self._source[position]
+            if self._cursor == cursor:
+                return None
+            self._prefetch()
+
+        self._changed(QueuePart.UPCOMING)
+        return track
+
+    def push_front(self, track: Track) -> None:
+        """Put a track back before the upcoming tracks.
+
+        Args:
+            track: The track
+        """
+        self._pushed.appendleft(track)
+        self._changed(QueuePart.UPCOMING)
+
+    def add(self, track: Track) -> None:
+        """Add a track to the end of the queue.
+
+        Args:
+            track: The track
+        """
+        self._queue.append(track)
+        self._changed(QueuePart.QUEUE)
+
+    def add_next(self, track: Track) -> None:
+        """Add a track to the start of the queue.
+
+        Args:
+            track: The track
+        """
+        self._queue.appendleft(track)
+        self._changed(QueuePart.QUEUE)
+
+    def insert(self, position: int, track: Track) -> None:
+        """Insert a track in the queue.
+
+        Args:
+            position (int): The position of the track in the queue
+            track: The track
+        """
+        self._queue.insert(position, track)
+        self._changed(QueuePart.QUEUE)
+
+    def remove(self, position: int) -> Track:
+        """Remove a track from the queue.
+
+        Args:
+            position (int): The position of the track in the queue
+
+        Returns:
+            Track: The removed track
+
+        Raises:
+            IndexError: If there is no track at this position
+        """
+        track = self._queue.pop(position)
+        self._changed(QueuePart.QUEUE)
+        return track
+
+    def add_played(self, track: Track) -> None:
+        """Add a track to the end of the history.
+
+        Args:
+            track: The track that was played
+        """
+        self._history.append(track)
+        self._changed(QueuePart.HISTORY)
+
+    def pop_played(self) -> Track | None:
+        """Remove and return the most recently played track.
+
+        Returns:
+            Track: The track, None if the history is empty
+        """
+        if not self._history:
+            return None
+        track = self._history.pop()
+        self._changed(QueuePart.HISTORY)
+        return track
+
+    def restart(self) -> None:
+        """Play the source again, like when repeating the list.
+
+        The whole source becomes upcoming again, so the history is cleared.
+        A shuffled source gets a new order.
+        """
+        self._cursor = 0
+        self._pushed.clear()
+        self._history.clear()
+        if self.shuffled and self._order.size:
+            self._order = _ShuffleOrder(
+                self._order.size,
+                random.randrange(self._order.size),
+                random.randrange(2**31),
+            )
+        self._prefetch()
+        self._changed(QueuePart.HISTORY | QueuePart.UPCOMING)
+
+    def set_shuffle(
+        self, shuffle: bool, seed: int | None = None, anchor: int | None = None
+    ) -> None:
+        """Shuffle the upcoming tracks or go back to their order.
+
+        The order starts from the last played track of the source, which
+        keeps its place: turning shuffle off continues after it in the
+        original order.
+
+        Args:
+            shuffle (bool): Whether to shuffle
+            seed (int): The seed of the shuffled order, random by default
+            anchor (int): The source position the shuffled order starts from,
+                to restore an order saved with shuffle_state
+        """
+        size = self._order.size
+        current = self._order.position(self._cursor - 1) if self._cursor else None
+        if anchor is None:
+            anchor = current if current is not None else self._next_position()
+
+        if not size:
+            self._order = _ShuffleOrder(0, 0, 0) if shuffle else _LinearOrder(0, 0)
+        elif shuffle:
+            if seed is None:
+                seed = random.randrange(2**31)
+            self._order = _ShuffleOrder(size, anchor, seed)
+        else:
+            self._order = _LinearOrder(size, anchor)
+
+        self._cursor = self._order.step_of(current) + 1 if current is not None else 0
+        self._prefetch()
+        self._changed(QueuePart.UPCOMING)
+
+    def shuffle_state(self) -> Tuple[int, int] | None:
+        """Get what set_shuffle needs to restore the shuffled order.
+
+        Returns:
+            tuple: The seed and the anchor of the order, None if not shuffled
+        """
+        if isinstance(self._order, _ShuffleOrder):
+            return self._order.seed, self._order.anchor
+        return None
+
+    def get_state(self) -> Tuple[Dict[str, Any], Dict[int, Track]]:
+        """Get the state of the queue to save it, with tracks referenced by id.
+
+        Only the loaded pages of a HTTrackSource are included.
+
+        Returns:
+            tuple: The JSON serializable state and the tracks it references
+        """
+        if isinstance(self._source, HTTrackSource):
+            page_size = self._source.page_size
+            pages = self._source.loaded_pages()
+        else:
+            page_size = None
+            pages = [(0, self._source)]
+
+        tracks: Dict[int, Track] = {}
+
+        def _ids(items) -> List[int]:
+            for track in items:
+                tracks[track.id] = track
+            return [track.id for track in items]
+
+        shuffle_state = self.shuffle_state()
+        state = {
+            "size": len(self._source),
+            "page_size": page_size,
+            "pages": [[offset, _ids(page)] for offset, page in pages],
+            "seed": shuffle_state[0] if shuffle_state else None,
+            "anchor": self._order.anchor,
+            "cursor": self._cursor,
+            "pushed": _ids(self._pushed),
+            "queue": _ids(self._queue),
+            "history": _ids(self._history),
+        }
+        return state, tracks
+
+    def restore_state(
+        self,
+        state: Dict[str, Any],
+        tracks: Dict[int, Track],
+        fetch: Callable[..., List[Track]] | None = None,
+    ) -> None:
+        """Restore a state saved with get_state.
+
+        Args:
+            state (dict): The saved state
+            tracks (dict): The tracks referenced by the state, by id
+            fetch: The function loading the missing pages of a paginated
+                source, like Playlist.tracks
+
+        Raises:
+            ValueError: If the source is paginated and fetch is missing
+        """
+        pages = [
+            (offset, [tracks[track_id] for track_id in ids])
+            for offset, ids in state["pages"]
+        ]
+
+        source: Union[List[Track], HTTrackSource]
+        if state["page_size"]:
+            if fetch is None:
+                raise ValueError("A paginated source needs a fetch function")
+            source = HTTrackSource(fetch, state["size"], state["page_size"])
+            for offset, page in pages:
+                source.add_page(offset, page)
+        else:
+            source = [track for _, page in pages for track in page]
+
+        self._queue = HTBlockedList(tracks[track_id] for track_id in state["queue"])
+        self.set_source(source)
+
+        size = len(source)
+        if state["seed"] is not None and size:
+            self._order = _ShuffleOrder(size, state["anchor"], state["seed"])
+        elif size:
+            self._order = _LinearOrder(size, state["anchor"])
+        self._cursor = min(state["cursor"], size)
+        self._pushed = deque(tracks[track_id] for track_id in state["pushed"])
+        self._history = deque(tracks[track_id] for track_id in state["history"])
+
+        self._prefetch()
+        self._changed(QueuePart.HISTORY | QueuePart.QUEUE | QueuePart.UPCOMING)
+
+    def _index(self, offset: int, tracks: List[Track]) -> None:
+        for index, track in enumerate(tracks, offset):
+            self._id_index.setdefault(track.id, index)
+            if track.available:
+                insort(self._available, index)
+        self._indexed.add(offset)
+
+    def _on_page_loaded(self, source: HTTrackSource, offset: int) -> None:
+        if source is not self._source or offset in self._indexed:
+            return
+        self._index(offset, source.get_page(offset))
+        self._changed(QueuePart.UPCOMING)
+
+    def _on_size_changed(self, source: HTTrackSource, size: int) -> None:
+        if source is not self._source:
+            return
+        current = self._order.position(self._cursor - 1) if self._cursor else None
+        if current is not None and current >= size:
+            current = None
+        anchor = self._order.anchor if self._order.anchor < size else 0
+
+        # Rebuild the order over the tracks the source really has
+        if isinstance(self._order, _ShuffleOrder):
+            self._order = _ShuffleOrder(size, anchor, self._order.seed)
+        else:
+            self._order = _LinearOrder(size, anchor)
+        self._cursor = self._order.step_of(current) + 1 if current is not None else 0
+
+        self._available = self._available[: bisect_left(self._available, size)]
+        self._id_index = {
+            track_id: index
+            for track_id, index in self._id_index.items()
+            if index < size
+        }
+        self._prefetch()
+        self._changed(QueuePart.UPCOMING)
+
+    def _on_load_failed(self, source: HTTrackSource, offset: int) -> None:
+        if source is self._source:
+            self.emit("load-failed")
+
+    def _is_missing(self, position: int) -> bool:
+        return isinstance(self._source, HTTrackSource) and self._source.is_missing(
+            position
+        )
+
+    def _get(self, position: int) -> Track | None:
+        if isinstance(self._source, HTTrackSource):
+            return self._source.get(position)
+        return self._source[position]
+
+    def _prefetch(self) -> None:
+        if not isinstance(self._source, HTTrackSource):
+            return
+        end = min(self._cursor + self.PREFETCH_AHEAD, self._order.size)
+        self._source.prefetch(
+            self._order.position(step) for step in range(self._cursor, end)
+        )
+
+    def _next_position(self) -> int:
+        if self._cursor < self._order.size:
+            return self._order.position(self._cursor)
+        return 0
+
+    def _changed(self, parts: QueuePart) -> None:
+        self.emit("changed", int(parts))
@@ -19,14 +19,18 @@
 
 import logging
 import random
+import re
 import threading
-import base64
+import time
+from collections import deque
+from collections.abc import Sequence
 from enum import IntEnum
+from itertools import islice
 from gettext import gettext as _
 from pathlib import Path
-from typing import Any, List, Union
+from typing import Any, Deque, Dict, List, Tuple, Union
 
-from gi.repository import GLib, GObject, Gst, Gio
+from gi.repository import GLib, GObject, Gst, GstController, Gio
 
 from tidalapi.album import Album
 from tidalapi.artist import Artist
@@ -35,9 +39,26 @@ from tidalapi.playlist import Playlist
 from tidalapi.media import Track, ManifestMimeType
 
 from . import discord_rpc, utils
+from .blocked_list import HTBlockedList
+from .cache import HTCacheStore
+from .download_manager import HTDownloadManager
+from .play_queue import HTPlayQueue
+from .prefetcher import HTPrefetcher
+from .stream_cache import HTStreamCache
+from .track_source import HTTrackSource
 
 logger = logging.getLogger(__name__)
 
+# souphttpsrc reports HTTP errors as "<reason> (<status>), URL: <url>, ..."
+_HTTP_STATUS_RE = re.compile(r"\((\d{3})\), URL: ")
+
+# Statuses of the CDN for a signed stream URL that expired
+_REFUSED_HTTP_STATUSES = (401, 403, 410)
+
+# How long before the overlap a crossfade is set up, more than the main loop
+# can be late
+_CROSSFADE_LEAD = 300 * Gst.MSECOND
+
 
 class RepeatType(IntEnum):
     NONE = 0
@@ -61,6 +82,9 @@ class PlayerObject(GObject.GObject):
     can_go_next = GObject.Property(type=bool, default=True)
     can_go_prev = GObject.Property(type=bool, default=True)
 
+    # Number of upcoming tracks whose cached files are kept from eviction
+    PINNED_AHEAD = 10
+
     __gsignals__ = {
         "songs-list-changed": (GObject.SignalFlags.RUN_FIRST, None, (int,)),
         "update-slider": (GObject.SignalFlags.RUN_FIRST, None, ()),
@@ -69,6 +93,7 @@ class PlayerObject(GObject.GObject):
         "duration-changed": (GObject.SignalFlags.RUN_FIRST, None, ()),
         "volume-changed": (GObject.SignalFlags.RUN_FIRST, None, (float,)),
         "buffering": (GObject.SignalFlags.RUN_FIRST, None, (int,)),
+        "output-changed": (GObject.SignalFlags.RUN_FIRST, None, ()),
     }
 
     def __init__(
@@ -77,6 +102,7 @@ class PlayerObject(GObject.GObject):
         alsa_device: str = "default",
         normalize: bool = False,
         quadratic_volume: bool = False,
+        bit_perfect: bool = False,
     ) -> None:
         GObject.GObject.__init__(self)
 
@@ -85,55 +111,67 @@ class PlayerObject(GObject.GObject):
         version_str = Gst.version_string()
         logger.info(f"GStreamer version: {version_str}")
 
-        self.pipeline = Gst.Pipeline.new("dash-player")
-
-        self.playbin = Gst.ElementFactory.make("playbin3", "playbin")
-        if self.playbin:
-            self.playbin.connect("about-to-finish", self.play_next_gapless)
-            self.gapless_enabled = True
-        else:
-            logger.error("Could not create playbin3 element, trying playbin...")
-            self.playbin = Gst.ElementFactory.make("playbin", "playbin")
-            self.gapless_enabled = False
-
-        if preferred_sink == AudioSink.PIPEWIRE:
-            self.gapless_enabled = False
+        self.pipeline, self.playbin = self._create_pipeline()
+        self.gapless_enabled = self.playbin.get_factory().get_name() == "playbin3"
 
         self.use_about_to_finish = True
 
-        self.pipeline.add(self.playbin)
+        # The next track is prerolled in a second pipeline, which replaces the
+        # playing one when the track is skipped
+        self._spare_pipeline, self._spare_playbin = self._create_pipeline()
+        self._preroll_track: Track | None = None
+        self._preroll_stream: Any | None = None
+        self._preroll_manifest: Any | None = None
+        self._preroll_ready = False
+        # Bytes of the stream buffered by the prerolled pipeline, 0 to disable
+        self.preroll_buffer_size = 0
+
+        # Seconds from a track change request to the audio playing
+        self._skip_started: float | None = None
+        self._skip_prerolled = False
+        self.skip_latencies: Deque[Tuple[float, bool]] = deque(maxlen=50)
+
+        # Seconds the end of a track overlaps the next one, 0 to disable
+        self.crossfade_duration = 0
+        self._crossfade_timer: int | None = None
+        # Whether the track change in progress is a crossfade
+        self._crossfading = False
+        # Set while the previous track fades out in the spare pipeline
+        self._fade_out_timer: int | None = None
 
         self.normalize = normalize
         self.quadratic_volume = quadratic_volume
+        self.bit_perfect = bit_perfect
+        # The format of the audio sent to the sink, like S24LE 96.0 kHz
+        self.output_format: str | None = None
+        # Whether the audio reaches the sink without any conversion
+        self.output_unconverted = False
         self.most_recent_rg_tags = ""
 
         self.discord_rpc_enabled = True
 
         self.alsa_device: str = alsa_device
+        self.sink_type: AudioSink = preferred_sink
         # Configure audio sink
         self._setup_audio_sink(preferred_sink)
 
         # Set up message bus
-        self._bus = self.pipeline.get_bus()
-        self._bus.add_signal_watch()
-        self._bus.connect("message::eos", self._on_bus_eos)
-        self._bus.connect("message::error", self._on_bus_error)
-        self._bus.connect("message::buffering", self._on_buffering_message)
-        self._bus.connect("message::stream-start", self._on_track_start)
+        self._bus = self._watch_bus(self.pipeline)
+        self._spare_bus = self._watch_bus(self._spare_pipeline)
 
         # Initialize state utils
         self._shuffle = False
         self._playing = False
         self._repeat_type = RepeatType.NONE
 
-        self.id_list: List[str] = []
-
-        self.queue: List[Track] = []
+        self.play_queue = HTPlayQueue()
+        self.play_queue.connect("load-failed", self._on_queue_load_failed)
+        # Whether playback waits for the page of the next track to load
+        self._next_pending = False
+        # The track lists of the recently played sources, shared by play_this
+        # and shuffle_this so a source is fetched once
+        self.track_lists: HTCacheStore[List[Track]] = HTCacheStore(8, ttl=5 * 60)
         self.current_mix_album_playlist: Union[Mix, Album, Playlist] | None = None
-        self._tracks_to_play: List[Track] = []
-        self.tracks_to_play: List[Track] = []
-        self._shuffled_tracks_to_play: List[Track] = []
-        self.played_songs: List[Track] = []
         self.playing_track: Track | None = None
         self.song_album: Album | None = None
         self.duration = self.query_duration()
@@ -149,6 +187,33 @@ class PlayerObject(GObject.GObject):
         # for not caching on metered networks
         self.monitor = Gio.NetworkMonitor.get_default()
 
+        self.download_manager = HTDownloadManager()
+        self.prefetch_to_cache = False
+        self.stream_cache = HTStreamCache()
+        self.prefetcher = HTPrefetcher(self.stream_cache, warm=self._warm_music_cache)
+        # Whether the playing track was already resolved again after an error
+        self.stream_reresolved = False
+        # The latest paths to pin in the music cache, applied in order by a
+        # single thread
+        self._pins_lock = threading.Lock()
+        self._pending_pins: List[Path] | None = None
+        self._pinning = False
+
+    @property
+    def queue(self) -> HTBlockedList[Track]:
+        """The tracks added to the queue by the user"""
+        return self.play_queue.queue
+
+    @property
+    def tracks_to_play(self) -> Sequence[Track]:
+        """The upcoming tracks of the played source, in play order"""
+        return self.play_queue.upcoming
+
+    @property
+    def played_songs(self) -> Deque[Track]:
+        """The played tracks, the most recent last"""
+        return self.play_queue.history
+
     @GObject.Property(type=bool, default=False)
     def playing(self) -> bool:
         return self._playing
@@ -181,8 +246,90 @@ class PlayerObject(GObject.GObject):
         self._repeat_type = _repeat_type
         self.notify("repeat-type")
 
+    def _create_pipeline(self) -> Tuple[Any, Any]:
+        """Create a pipeline holding a playbin3, or a playbin if unavailable.
+
+        Returns:
+            tuple: The pipeline and the playbin
+        """
+        pipeline = Gst.Pipeline.new("dash-player")
+
+        playbin = Gst.ElementFactory.make("playbin3", "playbin")
+        if playbin:
+            playbin.connect("about-to-finish", self.play_next_gapless)
+        else:
+            logger.error("Could not create playbin3 element, trying playbin...")
+            playbin = Gst.ElementFactory.make("playbin", "playbin")
+
+        pipeline.add(playbin)
+        return pipeline, playbin
+
+    def _watch_bus(self, pipeline: Any) -> Any:
+        """Connect the message handlers to the bus of a pipeline.
+
+        Both pipelines are watched, the handlers check which one is playing.
+        """
+        bus = pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message::eos", self._on_bus_eos)
+        bus.connect("message::error", self._on_bus_error)
+        bus.connect("message::buffering", self._on_buffering_message)
+        bus.connect("message::stream-start", self._on_track_start)
+        bus.connect("message::async-done", self._on_async_done)
+        bus.connect("message::state-changed", self._on_state_changed)
+        bus.connect("message::clock-lost", self._on_clock_lost)
+        bus.connect("message::latency", self._on_latency)
+        return bus
+
     def _setup_audio_sink(self, sink_type: AudioSink) -> None:
-        """Configure the audio sink using parse_launch for simplicity."""
+        """Configure the audio sink of both pipelines.
+
+        Args:
+            sink_type (int): The audio sink `AudioSink` enum
+        """
+        self.sink_type = sink_type
+        self._stop_fade_out()
+
+        self._reset_preroll()
+        self.playbin.set_property("audio-sink", self._create_audio_sink(sink_type))
+        self._spare_playbin.set_property(
+            "audio-sink", self._create_audio_sink(sink_type)
+        )
+
+    def _create_audio_sink(self, sink_type: AudioSink) -> Any:
+        """Create the audio sink bin of a playbin.
+
+        The bin holds a queue followed by a chain with the filters and the
+        sink, so the chain can be replaced while the pipeline runs.
+
+        Args:
+            sink_type (int): The audio sink `AudioSink` enum
+        """
+        audio_bin = Gst.Bin.new("audio-sink-bin")
+        queue = Gst.ElementFactory.make("queue", "sink-queue")
+        audio_bin.add(queue)
+        audio_bin.add_pad(Gst.GhostPad.new("sink", queue.get_static_pad("sink")))
+
+        chain = self._create_sink_chain(sink_type, convert=False)
+        audio_bin.add(chain)
+        queue.link(chain)
+
+        queue.get_static_pad("src").add_probe(
+            Gst.PadProbeType.EVENT_DOWNSTREAM, self._on_bit_perfect_caps, audio_bin
+        )
+        return audio_bin
+
+    def _is_bit_perfect(self, sink_type: AudioSink) -> bool:
+        return self.bit_perfect and sink_type == AudioSink.ALSA
+
+    def _create_sink_chain(self, sink_type: AudioSink, convert: bool = True) -> Any:
+        """Create the filters and the sink using parse_launch for simplicity.
+
+        Args:
+            sink_type (int): The audio sink `AudioSink` enum
+            convert (bool): Whether a bit-perfect chain converts the audio to
+                a format the device supports, otherwise it's only the sink
+        """
         sink_map = {
             AudioSink.AUTO: "autoaudiosink",
             AudioSink.PULSE: "pulsesink",
@@ -192,7 +339,15 @@ class PlayerObject(GObject.GObject):
             AudioSink.PIPEWIRE: "pipewiresink",
         }
 
-        sink_name = sink_map.get(sink_type, "autoaudiosink")
+        sink_name = f"{sink_map.get(sink_type, 'autoaudiosink')} name=output"
+
+        # the samples are sent unchanged, without normalization and crossfade
+        if self._is_bit_perfect(sink_type):
+            if convert:
+                return self._parse_sink_chain(
+                    f"audioconvert name=convert ! audioresample ! {sink_name}"
+                )
+            return self._parse_sink_chain(sink_name, unconverted=True)
 
         # add normalization to pipeline if set by settings
         normalization = ""
@@ -204,50 +359,201 @@ class PlayerObject(GObject.GObject):
                 f"rglimiter ! audioconvert !"
             )
 
+        # the fade volume is only added when crossfade is enabled
+        fade = "volume name=fade !" if self.crossfade_duration else ""
+
+        # pipewiresink stalls when the caps change between gapless tracks, the
+        # caps are pinned during a handoff, see _pin_handoff_caps
+        handoff_caps = ""
+        if sink_type == AudioSink.PIPEWIRE:
+            handoff_caps = "capsfilter name=handoff-caps !"
+
         pipeline_str = (
-            f"queue ! audioconvert ! {normalization} audioresample ! {sink_name}"
+            f"audioconvert ! {normalization} audioresample ! {fade} "
+            f"{handoff_caps} {sink_name}"
         )
+        return self._parse_sink_chain(pipeline_str)
 
-        if sink_type == AudioSink.PIPEWIRE:
-            self.gapless_enabled = False
-        else:
-            self.gapless_enabled = True
+    def _parse_sink_chain(self, pipeline_str: str, unconverted: bool = False) -> Any:
+        """Create a sink chain bin and watch the format reaching its sink.
 
+        Args:
+            pipeline_str (str): The description of the chain
+            unconverted (bool): Whether the chain has no conversion elements
+        """
         try:
-            audio_bin = Gst.parse_bin_from_description(pipeline_str, True)
-            if not audio_bin:
+            chain = Gst.parse_bin_from_description(pipeline_str, True)
+            if not chain:
                 raise RuntimeError("Failed to create audio bin")
-
-            self.playbin.set_property("audio-sink", audio_bin)
         except GLib.Error:
             logger.exception("Error creating pipeline")
-            self.playbin.set_property(
-                "audio-sink", Gst.ElementFactory.make("autoaudiosink", None)
+            chain = Gst.ElementFactory.make("autoaudiosink", None)
+
+        chain.set_name("sink-chain")
+
+        output = chain.get_by_name("output") if isinstance(chain, Gst.Bin) else chain
+        if output:
+            output.get_static_pad("sink").add_probe(
+                Gst.PadProbeType.EVENT_DOWNSTREAM, self._on_output_caps, unconverted
+            )
+        return chain
+
+    def _on_bit_perfect_caps(self, pad, info, audio_bin) -> Any:
+        """Link the conversion elements only if the device needs them.
+
+        Called from the streaming thread for the events going to the sink
+        chain. When the caps of a track change, the device is asked whether it
+        accepts them, and the chain is replaced if it has to start or stop
+        converting.
+        """
+        event = info.get_event()
+        if event.type != Gst.EventType.CAPS or not self._is_bit_perfect(
+            self.sink_type
+        ):
+            return Gst.PadProbeReturn.OK
+
+        caps = event.parse_caps()
+        output = audio_bin.get_by_name("output")
+        if output is None:
+            return Gst.PadProbeReturn.OK
+        converting = audio_bin.get_by_name("convert") is not None
+        accepted = output.get_static_pad("sink").query_accept_caps(caps)
+
+        if accepted == converting:
+            logger.info(
+                f"{'Sending' if accepted else 'Converting'} "
+                f"{caps.to_string()} {'directly to' if accepted else 'for'} "
+                f"{self.alsa_device}"
+            )
+            self._swap_sink_chain(
+                None,
+                None,
+                audio_bin,
+                self._create_sink_chain(self.sink_type, convert=not accepted),
             )
+        return Gst.PadProbeReturn.OK
+
+    def _on_output_caps(self, pad, info, unconverted: bool) -> Any:
+        """Record the format negotiated with the sink."""
+        event = info.get_event()
+        if event.type != Gst.EventType.CAPS:
+            return Gst.PadProbeReturn.OK
+
+        structure = event.parse_caps().get_structure(0)
+        _found, rate = structure.get_int("rate")
+        audio_format = structure.get_string("format")
+        GLib.idle_add(
+            self._set_output_format,
+            f"{audio_format} {rate / 1000:.1f} kHz",
+            unconverted,
+        )
+        return Gst.PadProbeReturn.OK
+
+    def _pin_handoff_caps(self, playbin: Any, pin: bool) -> None:
+        """Keep the format reaching a PipeWire sink across gapless tracks.
+
+        When pinned, the next track is converted to the format the sink
+        already plays, so it isn't renegotiated mid-stream. The pin is removed
+        when the pipeline restarts, so tracks play at their own rate again.
+
+        Args:
+            playbin: The playbin whose sink chain is changed
+            pin (bool): Whether to pin the current format or remove the pin
+        """
+        audio_bin = playbin.get_property("audio-sink")
+        capsfilter = audio_bin.get_by_name("handoff-caps") if audio_bin else None
+        if capsfilter is None:
+            return
+
+        caps = Gst.Caps.new_any()
+        if pin:
+            current = audio_bin.get_by_name("output").get_static_pad("sink")
+            caps = current.get_current_caps() or caps
+        capsfilter.set_property("caps", caps)
+
+    def _set_output_format(self, output_format: str, unconverted: bool) -> None:
+        self.output_format = output_format
+        self.output_unconverted = unconverted
+        self.emit("output-changed")
 
     def change_audio_sink(self, sink_type: AudioSink) -> None:
         """Change the audio sink while maintaining playback state.
 
+        The filters and the sink of the playing pipeline are replaced in
+        place, keeping the buffered data and the position. The spare
+        pipeline gets a new sink bin.
+
         Args:
             sink_type (int): The audio sink `AudioSink` enum
         """
-        self.use_about_to_finish = False
-        # Play the same track again after reload
-        self.next_track = self.playing_track
-        was_playing: bool = self.playing
-        position: int = self.query_position()
-        duration: int = self.query_duration()
-
-        self.pipeline.set_state(Gst.State.NULL)
-        self._setup_audio_sink(sink_type)
-
-        if was_playing and duration != 0:
-            self.pipeline.set_state(Gst.State.PLAYING)
-            self.seek_after_sink_reload = position / duration
-        self.use_about_to_finish = True
+        self.sink_type = sink_type
+        self._stop_fade_out()
 
-    def _on_bus_eos(self, *args) -> None:
+        self._reset_preroll()
+        self._spare_playbin.set_property(
+            "audio-sink", self._create_audio_sink(sink_type)
+        )
+        self._relink_sink_chain(sink_type)
+        self._preroll_next()
+
+    def _relink_sink_chain(self, sink_type: AudioSink) -> None:
+        """Replace the filters and the sink of the playing pipeline.
+
+        While playing, the chain is swapped from a probe when the queue before
+        it is idle, so no buffered data is lost and playback goes on. Otherwise
+        the stream is blocked in the prerolled sink, so the new chain is linked
+        directly and a flushing seek to the exact position prerolls it.
+
+        Args:
+            sink_type (int): The audio sink `AudioSink` enum
+        """
+        audio_bin = self.playbin.get_property("audio-sink")
+        # Like a new sink bin, a bit-perfect chain starts without conversion
+        # and gets it back if the device refuses the caps
+        new_chain = self._create_sink_chain(
+            sink_type, convert=not self._is_bit_perfect(sink_type)
+        )
+
+        _ret, state, pending = self.pipeline.get_state(0)
+        if Gst.State.PLAYING in (state, pending):
+            queue = audio_bin.get_by_name("sink-queue")
+            queue.get_static_pad("src").add_probe(
+                Gst.PadProbeType.IDLE, self._swap_sink_chain, audio_bin, new_chain
+            )
+            return
+
+        position = self.query_position(default=None)
+        self._swap_sink_chain(None, None, audio_bin, new_chain)
+        if state == Gst.State.PAUSED and position is not None:
+            self.playbin.seek_simple(
+                Gst.Format.TIME, Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE, position
+            )
+
+    def _swap_sink_chain(self, pad, info, audio_bin, new_chain) -> Any:
+        """Replace the chain after the queue of a sink bin.
+
+        Called from the streaming thread when used as a pad probe.
+        """
+        queue = audio_bin.get_by_name("sink-queue")
+        old_chain = audio_bin.get_by_name("sink-chain")
+
+        queue.unlink(old_chain)
+        # The old sink releases the device first, ALSA hw devices can only be
+        # opened once
+        old_chain.set_state(Gst.State.NULL)
+        audio_bin.remove(old_chain)
+
+        audio_bin.add(new_chain)
+        queue.link(new_chain)
+        new_chain.sync_state_with_parent()
+
+        logger.info("Replaced the audio sink chain")
+        return Gst.PadProbeReturn.REMOVE
+
+    def _on_bus_eos(self, bus: Any, message: Any) -> None:
         """Handle end of stream."""
+        if bus is not self._bus:
+            return
         if not self.gapless_enabled:
             GLib.idle_add(self.play_next)
         elif not self.tracks_to_play and not self.queue:
@@ -256,6 +562,12 @@ class PlayerObject(GObject.GObject):
     def _on_bus_error(self, bus: Any, message: Any) -> None:
         """Handle pipeline errors."""
         err, debug = message.parse_error()
+
+        if bus is not self._bus:
+            logger.warning(f"Could not preroll the next track: {err.message}")
+            self._reset_preroll()
+            return
+
         logger.error(f"Error: {err.message}")
         logger.error(f"Debug info: {debug}")
 
@@ -266,6 +578,21 @@ class PlayerObject(GObject.GObject):
             )
             self.play_track(self.playing_track)
 
+        elif (
+            self._is_refused_url_error(err, debug)
+            and self.playing_track
+            and not self.stream_reresolved
+        ):
+            logger.warning("Stream URL refused, it may have expired. Resolving again")
+            self.stream_reresolved = True
+            self.stream_cache.invalidate(self.playing_track)
+
+            position = self.query_position(default=0)
+            duration = self.query_duration()
+            if position and duration:
+                self.seek_after_sink_reload = position / duration
+            self.play_track(self.playing_track)
+
         elif (
             "Error outputting to audio device" in err.message
             and "disconnected" in err.message
@@ -274,7 +601,43 @@ class PlayerObject(GObject.GObject):
             self.pause()
             self.pipeline.set_state(Gst.State.NULL)
 
+    def _is_refused_url_error(self, err: GLib.Error, debug: str | None) -> bool:
+        """Whether an error comes from the CDN refusing a signed stream URL.
+
+        Only resource errors are considered. The HTTP status is read from the
+        debug message of souphttpsrc, an error without one counts if it is a
+        not authorized error.
+        """
+        domain = Gst.ResourceError.quark()
+        codes = (
+            Gst.ResourceError.NOT_AUTHORIZED,
+            Gst.ResourceError.NOT_FOUND,
+            Gst.ResourceError.OPEN_READ,
+            Gst.ResourceError.READ,
+        )
+        if not any(err.matches(domain, code) for code in codes):
+            return False
+
+        match = _HTTP_STATUS_RE.search(debug or "")
+        if match is None:
+            return err.matches(domain, Gst.ResourceError.NOT_AUTHORIZED)
+        return int(match.group(1)) in _REFUSED_HTTP_STATUSES
+
+    def _on_clock_lost(self, bus: Any, message: Any) -> None:
+        """Select a new clock, like when the sink providing it was replaced."""
+        if bus is not self._bus or not self.playing:
+            return
+        self.pipeline.set_state(Gst.State.PAUSED)
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def _on_latency(self, bus: Any, message: Any) -> None:
+        """Distribute the latency again, like when a new sink was linked."""
+        pipeline = self.pipeline if bus is self._bus else self._spare_pipeline
+        pipeline.recalculate_latency()
+
     def _on_buffering_message(self, bus: Any, message: Any) -> None:
+        if bus is not self._bus:
+            return
         buffer_per: int = message.parse_buffering()
         mode, avg_in, avg_out, buff_left = message.parse_buffering_stats()
 
@@ -296,7 +659,11 @@ class PlayerObject(GObject.GObject):
             self.playing_track = self.next_track
             self.next_track = None
         self.song_album = self.playing_track.album
-        self.can_go_next = len(self._tracks_to_play) > 0
+        self._update_cache_pins()
+        self._cancel_skipped_downloads()
+        self.prefetcher.prefetch(self.get_upcoming_tracks())
+        self._preroll_next()
+        self.can_go_next = len(self.tracks_to_play) > 0
         self.can_go_prev = len(self.played_songs) > 0
         self.duration = self.query_duration()
         # Should only trigger when track is enqued on start without playback
@@ -314,6 +681,8 @@ class PlayerObject(GObject.GObject):
             bus: required by Gst
             message: required by Gst
         """
+        if bus is not self._bus:
+            return
         # apply replaygain first to avoid volume clipping
         # (Idk if that will happen but its the only thing that has effect on audio in here)
         if self.stream:
@@ -328,6 +697,7 @@ class PlayerObject(GObject.GObject):
         self.update_timer = GLib.timeout_add(1000, self._update_slider_callback)
 
         self.seeked_to_end = False
+        self.stream_reresolved = False
         if self.seek_after_sink_reload:
             self.seek(self.seek_after_sink_reload)
             self.seek_after_sink_reload = None
@@ -348,30 +718,101 @@ class PlayerObject(GObject.GObject):
             index (int): The index of the track to start playing (default: 0)
         """
         self.current_mix_album_playlist = thing
-        tracks: List[Track] = self.get_track_list(thing)
+        tracks: List[Track] | HTTrackSource = self.get_track_list(thing)
 
         if not tracks:
             logger.info("No tracks found to play")
             return
 
-        self._tracks_to_play = tracks[index:] + tracks[:index]
-        if not self._tracks_to_play:
+        self._play_tracks(tracks, index)
+
+    def _play_tracks(
+        self, tracks: List[Track] | HTTrackSource, index: int, loaded: bool = False
+    ) -> None:
+        # Only the page of the first track is needed to start playing, it is
+        # loaded in background if missing
+        if (
+            isinstance(tracks, HTTrackSource)
+            and not loaded
+            and tracks.first_available(index) is None
+        ):
+            threading.Thread(
+                target=self._th_load_first_track,
+                args=(tracks, index),
+                daemon=True,
+            ).start()
             return
 
-        track: Track = self._tracks_to_play.pop(0)
+        self.play_queue.set_source(tracks, index)
+        track: Track | None = self.play_queue.pop_next(queued=False)
+        if track is None or not track.available:
+            logger.info("No available tracks found to play")
+            return
 
-        if not track.available:
-            self.play_this(thing, index + 1)
-        else:
-            self.tracks_to_play = self._tracks_to_play
-            self.played_songs = []
+        if self.shuffle:
+            self._update_shuffle_queue()
+
+        # Will result in play() call later
+        self.playing = True
+        self.play_track(track)
+
+    def load_track_list(
+        self, thing: Union[Mix, Album, Playlist, List[Track], Track], index: int = 0
+    ) -> None:
+        """Fetch the tracks of a source and the page of the track to start from.
+
+        Blocks, call it from a thread before play_this so that play_this
+        doesn't wait for the network in the main loop.
+
+        Args:
+            thing: An object (Mix, Album, Playlist, Artist, or list of Tracks)
+            index (int): The index of the track to start playing
+        """
+        tracks = self.get_track_list(thing)
+        if isinstance(tracks, HTTrackSource):
+            tracks.first_available(index, load=True)
+
+    def _th_load_first_track(self, tracks: HTTrackSource, index: int) -> None:
+        try:
+            tracks.first_available(index, load=True)
+        except Exception:
+            logger.exception("Could not load the first track to play")
+            GLib.idle_add(utils.send_toast, _("Could not load the tracks"), 5)
+            return
+        GLib.idle_add(self._play_tracks, tracks, index, True)
 
-            if self.shuffle:
-                self._update_shuffle_queue()
+    def restore_queue(
+        self,
+        thing: Union[Mix, Album, Playlist, Artist, Track] | None,
+        state: Dict[str, Any],
+        tracks: Dict[int, Track],
+        track: Track,
+        position: int,
+    ) -> None:
+        """Restore a saved queue and load its playing track without playing it.
+
+        Args:
+            thing: The object the queue was played from, None for a list
+            state (dict): The state saved with HTPlayQueue.get_state
+            tracks (dict): The tracks referenced by the state, by id
+            track: The playing track
+            position (int): The position in the playing track in nanoseconds
+        """
+        fetch = thing.tracks if isinstance(thing, (Album, Playlist)) else None
+        self.play_queue.restore_state(state, tracks, fetch)
 
-            # Will result in play() call later
-            self.playing = True
-            self.play_track(track)
+        self.current_mix_album_playlist = (
+            thing if thing is not None else list(self.play_queue.source)
+        )
+        self._shuffle = self.play_queue.shuffled
+        self.notify("shuffle")
+
+        if position and track.duration:
+            self.seek_after_sink_reload = position / (track.duration * 1_000_000_000)
+
+        # Show the track before its stream is resolved
+        GLib.idle_add(self.set_track, track)
+        self.play_track(track)
 
     def shuffle_this(
         self, thing: Union[Mix, Album, Playlist, List[Track], Track]
@@ -381,37 +822,55 @@ class PlayerObject(GObject.GObject):
         Args:
             thing: An object (Mix, Album, Playlist, Artist, or list of Tracks) to play
         """
-        tracks: List[Track] = self.get_track_list(thing)
-        self.play_this(thing, random.randint(0, len(tracks)))
+        tracks: List[Track] | HTTrackSource = self.get_track_list(thing)
+        if not tracks:
+            logger.info("No tracks found to play")
+            return
+
+        self.play_this(thing, random.randrange(len(tracks)))
         self.shuffle = True
 
     def get_track_list(
         self, thing: Union[Mix, Album, Playlist, Artist, List[Track], Track]
-    ) -> List[Track]:
+    ) -> List[Track] | HTTrackSource:
         """Convert various sources into a list of tracks.
 
+        The track lists of mixes, albums, playlists and artists are kept in
+        track_lists for a few minutes, so they are only fetched once. Albums
+        and playlists longer than a page are returned as a HTTrackSource that
+        loads its pages when they are needed.
+
         Args:
             thing: A TIDAL object (Mix, Album, Playlist, Artist, or list of Tracks)
 
         Returns:
             list: List of Track objects, or None if conversion failed
         """
-        tracks_list: List[Track] | None = None
+        if isinstance(thing, (Mix, Album, Playlist, Artist)):
+            return self.track_lists.get_or_fetch(
+                (utils.get_type(thing), thing.id),
+                lambda: self._fetch_track_list(thing),
+            )
+        elif isinstance(thing, list):
+            return thing
+        elif isinstance(thing, Track):
+            return [thing]
+        return None
+
+    def _fetch_track_list(
+        self, thing: Union[Mix, Album, Playlist, Artist]
+    ) -> List[Track] | HTTrackSource | None:
+        tracks_list: List[Track] | HTTrackSource | None = None
 
         if isinstance(thing, Mix):
             tracks_list = thing.items()
-        elif isinstance(thing, Album):
-            tracks_list = thing.tracks()
-        elif isinstance(thing, Playlist):
-            tracks_list = thing.tracks()
+        elif isinstance(thing, (Album, Playlist)):
+            if (thing.num_tracks or 0) > HTTrackSource.PAGE_SIZE:
+                tracks_list = HTTrackSource(thing.tracks, thing.num_tracks)
+            else:
+                tracks_list = thing.tracks()
         elif isinstance(thing, Artist):
             tracks_list = thing.top_tracks()
-        elif isinstance(thing, list):
-            tracks_list = thing
-        elif isinstance(thing, Track):
-            tracks_list = [thing]
-
-        self.id_list = [track.id for track in tracks_list]
 
         return tracks_list
 
@@ -431,6 +890,8 @@ class PlayerObject(GObject.GObject):
     def pause(self) -> None:
         """Pause playback of the current track."""
         self.playing = False
+        self._stop_fade_out()
+        self._release_start_time(self.pipeline)
         self.pipeline.set_state(Gst.State.PAUSED)
 
         if self.discord_rpc_enabled:
@@ -446,10 +907,20 @@ class PlayerObject(GObject.GObject):
     def play_track(self, track: Track, gapless=False) -> None:
         """Play a specific track immediately or enqueue it for gapless playback
 
+        If the track is prerolled it starts at once from the spare pipeline.
+
         Args:
             track: The Track object to play
             gapless: Whether to enqueue the track for gapless playback
         """
+        if not gapless:
+            self._skip_started = time.monotonic() if self.playing else None
+            self._skip_prerolled = False
+            if self._swap_to_preroll(track):
+                return
+            if self._preroll_track and self._preroll_track.id == track.id:
+                self._reset_preroll()
+
         threading.Thread(target=self._play_track_thread, args=(track, gapless)).start()
 
     def _play_track_thread(self, track: Track, gapless=False) -> None:
@@ -457,9 +928,7 @@ class PlayerObject(GObject.GObject):
         self.manifest = None
 
         try:
-            self.stream = track.get_stream()
-            self.manifest = self.stream.get_stream_manifest()
-            urls = self.manifest.get_urls()
+            self.stream, self.manifest = self.stream_cache.get(track)
 
             music_url = self._get_cached_or_stream_url(track, gapless)
 
@@ -467,120 +936,538 @@ class PlayerObject(GObject.GObject):
         except Exception:
             logger.exception("Error getting track URL")
 
+    def _cached_music_path(self, track) -> Path:
+        """Get the path of a track in the music cache at the current quality."""
+        return utils.MUSIC_DIR / f"{track.id}_{utils.session.audio_quality}.m4a"
+
+    def _update_cache_pins(self) -> None:
+        """Pin the cached files of the playing and upcoming tracks.
+
+        Pinned files are never evicted from the music cache. The database is
+        updated in a thread, which only applies the latest paths when the
+        queue changes again before it is done.
+        """
+        upcoming = list(self.queue) + list(
+            islice(self.tracks_to_play, self.PINNED_AHEAD)
+        )
+        if self.playing_track:
+            upcoming.append(self.playing_track)
+
+        paths = []
+        for track in upcoming:
+            path = self._cached_music_path(track)
+            # Keep the partial download of a track too
+            paths += [path, path.with_name(f"{path.name}.parts")]
+        with self._pins_lock:
+            self._pending_pins = paths
+            if self._pinning:
+                return
+            self._pinning = True
+        threading.Thread(target=self._th_apply_pins, daemon=True).start()
+
+    def _th_apply_pins(self) -> None:
+        while True:
+            with self._pins_lock:
+                paths, self._pending_pins = self._pending_pins, None
+                if paths is None:
+                    self._pinning = False
+                    return
+            try:
+                utils.music_cache_index.set_pinned(paths)
+            except Exception:
+                logger.exception("Could not pin the cached tracks")
+
+    def _cancel_skipped_downloads(self) -> None:
+        """Cancel the downloads of tracks that are not playing or upcoming."""
+        quality = utils.session.audio_quality
+        tracks = [self.playing_track]
+        if self.prefetch_to_cache:
+            tracks += self.get_upcoming_tracks()
+        self.download_manager.cancel_except(
+            (track.id, quality) for track in tracks if track
+        )
+
+    def get_upcoming_tracks(self) -> List[Track]:
+        """Get the tracks that will play next, in order.
+
+        Returns:
+            list: The queue followed by the tracks to play
+        """
+        if self._repeat_type == RepeatType.SONG and self.playing_track:
+            return [self.playing_track]
+        depth = self.prefetcher.depth
+        return list(islice(self.queue, depth)) + list(
+            islice(self.tracks_to_play, depth)
+        )
+
+    def set_prefetch(self, depth: int, to_cache: bool = False) -> None:
+        """Configure how the upcoming tracks are prepared.
+
+        Args:
+            depth (int): The number of upcoming tracks resolved in advance
+            to_cache (bool): Whether to also download them to the music cache
+        """
+        self.prefetcher.depth = depth
+        self.prefetch_to_cache = to_cache
+        self.prefetcher.prefetch(self.get_upcoming_tracks())
+
+    def set_preroll(self, buffer_size: int) -> None:
+        """Configure the preroll of the next track.
+
+        The prerolled pipeline holds an open stream to the next track, the
+        network buffer and about a second of decoded audio.
+
+        Args:
+            buffer_size (int): The bytes of the stream buffered by the prerolled
+                pipeline, 0 to disable the preroll
+        """
+        self.preroll_buffer_size = buffer_size
+        if buffer_size:
+            self._spare_playbin.set_property("buffer-size", buffer_size)
+        self._reset_preroll()
+        self._preroll_next()
+
+    def _can_preroll(self) -> bool:
+        """Whether a second stream can be opened on the audio sink.
+
+        ALSA hardware devices are opened exclusively, so the prerolled
+        pipeline couldn't open the device while a track is playing.
+        """
+        if self.sink_type == AudioSink.ALSA and self.alsa_device.startswith(
+            ("hw:", "plughw:")
+        ):
+            return False
+        return self.preroll_buffer_size > 0
+
+    def _predict_next_track(self) -> Track | None:
+        """Get the track play_next will play, if it changes track."""
+        if self._repeat_type == RepeatType.SONG:
+            return None
+        if self.next_track:
+            return self.next_track
+        if self.queue:
+            return self.queue[0]
+        return next(iter(self.tracks_to_play), None)
+
+    def _preroll_next(self) -> None:
+        """Preroll the track predicted to play next in the spare pipeline."""
+        # The spare pipeline is still fading out the previous track
+        if self._fade_out_timer:
+            return
+
+        track = self._predict_next_track() if self._can_preroll() else None
+        if track is None:
+            self._reset_preroll()
+            return
+        if self._preroll_track and self._preroll_track.id == track.id:
+            return
+
+        self._reset_preroll()
+        self._preroll_track = track
+        threading.Thread(
+            target=self._preroll_thread, args=(track,), daemon=True
+        ).start()
+
+    def _preroll_thread(self, track: Track) -> None:
+        try:
+            stream, manifest = self.stream_cache.get(track)
+            music_url = self._get_track_url(track, stream, manifest)
+        except Exception:
+            logger.exception(f"Could not preroll track {track.id}")
+            return
+        GLib.idle_add(self._start_preroll, track, stream, manifest, music_url)
+
+    def _start_preroll(self, track, stream, manifest, music_url) -> None:
+        # The prediction changed while the track was resolved
+        if self._preroll_track is not track:
+            return
+
+        self._preroll_stream = stream
+        self._preroll_manifest = manifest
+        self.apply_replaygain_tags(self._spare_playbin, stream)
+        self._pin_handoff_caps(self._spare_playbin, False)
+        self._spare_playbin.set_property("uri", music_url)
+        self._spare_pipeline.set_state(Gst.State.PAUSED)
+        logger.info(f"Prerolling track {track.id}")
+
+    def _reset_preroll(self) -> None:
+        """Stop the spare pipeline and forget the prerolled track."""
+        self._spare_pipeline.set_state(Gst.State.NULL)
+        self._release_start_time(self._spare_pipeline)
+        self._preroll_track = None
+        self._preroll_stream = None
+        self._preroll_manifest = None
+        self._preroll_ready = False
+
+    def _on_async_done(self, bus: Any, message: Any) -> None:
+        if bus is self._spare_bus and self._preroll_track:
+            self._preroll_ready = True
+            logger.info(f"Prerolled track {self._preroll_track.id}")
+
+    def _swap_to_preroll(self, track: Track) -> bool:
+        """Play a track from the spare pipeline if it is prerolled.
+
+        The playing pipeline is stopped and becomes the spare one.
+
+        Args:
+            track: The track to play
+
+        Returns:
+            bool: Whether the track was prerolled
+        """
+        if not (
+            self._preroll_ready
+            and self._preroll_track
+            and self._preroll_track.id == track.id
+        ):
+            return False
+
+        self.use_about_to_finish = False
+        volume = self.playbin.get_property("volume")
+        crossfade = self._crossfading
+        self._crossfading = False
+        if crossfade:
+            # The playing pipeline keeps fading out as the spare one
+            self._fade_out_timer = GLib.timeout_add(
+                self.crossfade_duration * 1000 + 500, self._stop_fade_out, True
+            )
+        else:
+            self.pipeline.set_state(Gst.State.NULL)
+
+        self.pipeline, self._spare_pipeline = self._spare_pipeline, self.pipeline
+        self.playbin, self._spare_playbin = self._spare_playbin, self.playbin
+        self._bus, self._spare_bus = self._spare_bus, self._bus
+        self.playbin.set_property("volume", volume)
+        self.playbin.set_property("buffer-size", -1)
+        self._spare_playbin.set_property("buffer-size", self.preroll_buffer_size)
+
+        self.stream = self._preroll_stream
+        self.manifest = self._preroll_manifest
+        self._preroll_track = None
+        self._preroll_stream = None
+        self._preroll_manifest = None
+        self._preroll_ready = False
+        self._skip_prerolled = True
+        logger.info(
+            f"{'Crossfading to' if crossfade else 'Playing'} prerolled track {track.id}"
+        )
+
+        # The stream already started, so _on_track_start won't be called
+        self.next_track = None
+        self.seeked_to_end = False
+        self.stream_reresolved = False
+        self.apply_replaygain_tags()
+        self.set_track(track)
+        if self.playing:
+            self.play()
+
+        self.use_about_to_finish = True
+        return True
+
+    def can_crossfade(self) -> bool:
+        """Whether tracks can be crossfaded with the current audio output.
+
+        The next track fades in from the prerolled pipeline, and bit-perfect
+        output has no volume element to fade.
+        """
+        return self._can_preroll() and not self._is_bit_perfect(self.sink_type)
+
+    def set_crossfade(self, duration: int) -> None:
+        """Configure the crossfade between consecutive tracks.
+
+        The next track fades in from the spare pipeline, so tracks are only
+        crossfaded when it is prerolled. When enabled the sinks get a volume
+        element driven by a control source, so the fades are applied per
+        sample, and both pipelines run on the system clock so the start of
+        the next track can be aligned on the playing one in running time.
+        Disabled, the pipelines are the same as without crossfade.
+
+        Args:
+            duration (int): The seconds the tracks overlap, 0 to disable
+        """
+        if bool(duration) == bool(self.crossfade_duration):
+            self.crossfade_duration = duration
+            return
+
+        self.crossfade_duration = duration
+        for pipeline in (self.pipeline, self._spare_pipeline):
+            if duration:
+                pipeline.use_clock(Gst.SystemClock.obtain())
+            else:
+                pipeline.auto_clock()
+        # The fade volume element is added or removed
+        if self.playing_track:
+            self.change_audio_sink(self.sink_type)
+        else:
+            self._setup_audio_sink(self.sink_type)
+            self._preroll_next()
+
+    def _schedule_crossfade(self) -> None:
+        """Start the crossfade on time if the playing track is about to end.
+
+        Called every second while playing, so seeks and pauses are followed.
+        """
+        if self._crossfade_timer:
+            GLib.source_remove(self._crossfade_timer)
+            self._crossfade_timer = None
+
+        if not self.crossfade_duration or not self.playing or self._fade_out_timer:
+            return
+
+        fade = self.crossfade_duration * Gst.SECOND
+        position = self.query_position(default=None)
+        duration = self.query_duration()
+        # Short tracks are not crossfaded
+        if position is None or not duration or duration < 3 * fade:
+            return
+
+        delay = duration - fade - position
+        if 0 <= delay <= 2 * Gst.SECOND:
+            # The timer only needs to fire before the overlap starts, its
+            # start is aligned on the clock by _start_crossfade
+            self._crossfade_timer = GLib.timeout_add(
+                max(delay - _CROSSFADE_LEAD, 0) // Gst.MSECOND, self._start_crossfade
+            )
+
+    def _start_crossfade(self) -> bool:
+        """Fade out the playing track while the prerolled one fades in."""
+        self._crossfade_timer = None
+
+        track = self._predict_next_track()
+        if not (
+            self.playing
+            and track
+            and self._preroll_ready
+            and self._preroll_track.id == track.id
+        ):
+            logger.info("Next track not prerolled, not crossfading")
+            return False
+
+        fade_out = self._get_fade_element(self.playbin)
+        fade_in = self._get_fade_element(self._spare_playbin)
+        if not fade_out or not fade_in:
+            return False
+
+        # Both pipelines need the same clock to align them, one that played
+        # since before crossfade was enabled still has the one of its sink
+        clock = self.pipeline.get_clock()
+        if clock is None or clock != Gst.SystemClock.obtain():
+            logger.info("Pipelines not on a shared clock, not crossfading")
+            return False
+
+        now = clock.get_time()
+        position = self.query_position()
+        duration = self.query_duration()
+        start = max(position, duration - self.crossfade_duration * Gst.SECOND)
+
+        # The ramps are in stream time, the outgoing one ends with the track
+        self._set_fade(fade_out, [(start, 1.0), (duration, 0.0)])
+        self._set_fade(fade_in, [(0, 0.0), (duration - start, 1.0)])
+        # The prerolled samples already went through the fade element, so the
+        # stream restarts to fade in from the first sample. Its start is
+        # already in the music cache, so this doesn't wait for the network.
+        self._spare_playbin.seek_simple(
+            Gst.Format.TIME, Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE, 0
+        )
+        # The first sample of the next track is rendered when the clock
+        # reaches its base time, set to when the playing track reaches the
+        # start of the overlap instead of when the pipeline starts playing
+        self._spare_pipeline.set_start_time(Gst.CLOCK_TIME_NONE)
+        self._spare_pipeline.set_base_time(now + start - position)
+
+        self._crossfading = True
+        self.play_next()
+        if self._crossfading:
+            # play_next didn't swap to the prerolled track
+            self._crossfading = False
+            self._release_start_time(self._spare_pipeline)
+            self._clear_fade(fade_out)
+            self._clear_fade(fade_in)
+        return False
+
+    def _release_start_time(self, pipeline: Any) -> None:
+        """Let a pipeline aligned by a crossfade choose its base time again,
+        so it plays from where it was paused or stopped."""
+        if pipeline.get_start_time() == Gst.CLOCK_TIME_NONE:
+            pipeline.set_start_time(0)
+
+    def _stop_fade_out(self, expired: bool = False) -> bool:
+        """Stop the pipeline of the faded out track and preroll in it again.
+
+        Args:
+            expired (bool): Whether the fade is over, otherwise it's cut short
+        """
+        if self._fade_out_timer is None:
+            return False
+
+        if not expired:
+            GLib.source_remove(self._fade_out_timer)
+        self._fade_out_timer = None
+
+        self._spare_pipeline.set_state(Gst.State.NULL)
+        for playbin in (self.playbin, self._spare_playbin):
+            fade = self._get_fade_element(playbin)
+            if fade:
+                self._clear_fade(fade)
+
+        self._preroll_next()
+        return False
+
+    def _get_fade_element(self, playbin: Any) -> Any | None:
+        audio_sink = playbin.get_property("audio-sink")
+        if isinstance(audio_sink, Gst.Bin):
+            return audio_sink.get_by_name("fade")
+        return None
+
+    def _set_fade(self, element: Any, points: List[Tuple[int, float]]) -> None:
+        """Drive the volume of an element with a linear ramp.
+
+        Args:
+            element: The volume element
+            points: The (stream time, volume) points of the ramp
+        """
+        self._clear_fade(element)
+        control_source = GstController.InterpolationControlSource()
+        control_source.set_property("mode", GstController.InterpolationMode.LINEAR)
+        for timestamp, value in points:
+            control_source.set(timestamp, value)
+        element.add_control_binding(
+            GstController.DirectControlBinding.new_absolute(
+                element, "volume", control_source
+            )
+        )
+
+    def _clear_fade(self, element: Any) -> None:
+        binding = element.get_control_binding("volume")
+        if binding:
+            element.remove_control_binding(binding)
+        element.set_property("volume", 1.0)
+
+    def _on_state_changed(self, bus: Any, message: Any) -> None:
+        """Measure the time from a track change request to the audio playing."""
+        if bus is not self._bus or message.src is not self.pipeline:
+            return
+
+        _old, new, _pending = message.parse_state_changed()
+        if new != Gst.State.PLAYING:
+            return
+        # The track crossfaded to is playing from its aligned base time
+        self._release_start_time(self.pipeline)
+        if self._skip_started is None:
+            return
+
+        latency = time.monotonic() - self._skip_started
+        self._skip_started = None
+        self.skip_latencies.append((latency, self._skip_prerolled))
+        logger.info(
+            f"Track change took {latency * 1000:.0f} ms"
+            f"{' (prerolled)' if self._skip_prerolled else ''}"
+        )
+
+    def skip_latency_stats(self) -> Dict[str, Any]:
+        """Get the latency of the recent track changes.
+
+        Returns:
+            dict: The number of track changes, how many were prerolled and the
+                average latency in seconds with and without preroll
+        """
+        prerolled = [latency for latency, swapped in self.skip_latencies if swapped]
+        other = [latency for latency, swapped in self.skip_latencies if not swapped]
+        return {
+            "changes": len(self.skip_latencies),
+            "prerolled": len(prerolled),
+            "prerolled_average": sum(prerolled) / len(prerolled) if prerolled else 0.0,
+            "average": sum(other) / len(other) if other else 0.0,
+        }
+
+    def _warm_music_cache(self, track, stream, manifest) -> None:
+        """Download a prefetched track to the music cache if enabled.
+
+        Called in the prefetcher thread.
+        """
+        if self.prefetch_to_cache:
+            self._cache_track(track, stream, manifest)
+
+    def _cache_track(self, track, stream, manifest) -> None:
+        """Queue the download of a track to the music cache.
+
+        Nothing is downloaded on metered networks.
+        """
+        if self.monitor.get_network_metered():
+            return
+
+        if stream.manifest_mime_type == ManifestMimeType.MPD:
+            source = stream.get_manifest_data()
+        else:
+            urls = manifest.get_urls()
+            source = urls[0] if isinstance(urls, list) else urls
+
+        self.download_manager.submit(
+            track, utils.session.audio_quality, stream.manifest_mime_type, source
+        )
+
     def _get_cached_or_stream_url(self, track, gapless=False):
         """Get URL from cache or stream, caching if not cached."""
+        if not gapless:
+            self.apply_replaygain_tags()
+
+        return self._get_track_url(track, self.stream, self.manifest)
+
+    def _get_track_url(self, track, stream, manifest) -> str:
+        """Get the URL of a track in the music cache, or of its stream."""
         if not hasattr(utils, 'MUSIC_DIR') or not utils.MUSIC_DIR:
-            return self._get_stream_url(track, gapless)
+            return self._get_stream_url(track, stream, manifest)
 
-        cached_music = utils.MUSIC_DIR / f"{track.id}_{utils.session.audio_quality}.m4a"
+        cached_music = self._cached_music_path(track)
 
         if cached_music.exists():
             logger.info(f"Playing from music cache: {track.id}")
+            utils.music_cache_index.touch(cached_music)
             return f"file://{cached_music}"
 
-        return self._get_stream_url(track, gapless)
+        return self._get_stream_url(track, stream, manifest)
 
-    def _get_stream_url(self, track, gapless=False):
-        """Get stream URL and start background caching."""
-        if not gapless:
-            self.apply_replaygain_tags()
+    def _get_stream_url(self, track, stream, manifest) -> str:
+        """Get the stream URL, proxied so the stream is also written to cache.
 
-        if self.stream.manifest_mime_type == ManifestMimeType.MPD:
-            data = self.stream.get_manifest_data()
+        If the stream can't be proxied it is downloaded again in background.
+        """
+        cached_music = self._cached_music_path(track)
+
+        if stream.manifest_mime_type == ManifestMimeType.MPD:
+            data = stream.get_manifest_data()
             if not data:
                 raise AttributeError("No MPD manifest available!")
+            if isinstance(data, bytes):
+                data = data.decode("utf-8")
 
-            major, minor, micro, nano = Gst.version()
-            if (major, minor) >= (1, 26):
-                # Write manifest to temp location for GStreamer and caching
-                mpd_path = Path(utils.CACHE_DIR, "manifest.mpd")
-                with open(mpd_path, "w") as f:
-                    f.write(data)
+            # The manifest is served from memory by the proxy
+            manifest_url, cached = utils.stream_proxy.proxy_mpd(data, cached_music)
+            if not cached:
+                self._cache_track(track, stream, manifest)
 
-                if not self.monitor.get_network_metered():
-                    threading.Thread(
-                        target=self._cache_mpd_track,
-                        args=(track, mpd_path)
-                    ).start()
+            return manifest_url
 
-                return f"file://{mpd_path}"
-            else:
-                if isinstance(data, str):
-                    mpd_bytes = data.encode("utf-8")
-                else:
-                    mpd_bytes = data
-                mpd_b64 = base64.b64encode(mpd_bytes).decode("ascii")
-                return "data:application/dash+xml;base64," + mpd_b64
-
-        elif self.stream.manifest_mime_type == ManifestMimeType.BTS:
-            urls = self.manifest.get_urls()
+        elif stream.manifest_mime_type == ManifestMimeType.BTS:
+            urls = manifest.get_urls()
             stream_url = urls[0] if isinstance(urls, list) else urls
 
-            if not self.monitor.get_network_metered():
-                threading.Thread(
-                    target=self._cache_bts_track,
-                    args=(track, stream_url)
-                ).start()
+            return utils.stream_proxy.proxy_bts(stream_url, cached_music)
 
-            return stream_url
+        raise AttributeError(f"Unhandled manifest mime type: {stream.manifest_mime_type}")
 
-        raise AttributeError(f"Unhandled manifest mime type: {self.stream.manifest_mime_type}")
-
-    def _cache_mpd_track(self, track, mpd_path):
-        """Download and cache MPD track via ffmpeg in background."""
-        cached_music = utils.MUSIC_DIR / f"{track.id}_{utils.session.audio_quality}.m4a"
-        tmp = cached_music.with_suffix(".tmp")
-
-        try:
-            import subprocess
-            logger.info(f"Caching MPD track: {track.id}")
-            result = subprocess.run(
-                [
-                    "ffmpeg",
-                    "-protocol_whitelist", "file,crypto,data,http,https,tcp,tls",
-                    "-i", str(mpd_path),
-                    "-f", "mp4",
-                    "-c", "copy",
-                    "-y", str(tmp)
-                ],
-                capture_output=True
-            )
-
-            if result.returncode == 0:
-                tmp.rename(cached_music)
-                logger.info(f"Cached MPD track: {track.id}")
-            else:
-                logger.warning(f"ffmpeg failed for {track.id}: {result.stderr.decode()}")
-                tmp.unlink(missing_ok=True)
-        except Exception as e:
-            logger.warning(f"Failed to cache MPD track {track.id}: {e}")
-            tmp.unlink(missing_ok=True)
-
-    def _cache_bts_track(self, track, stream_url):
-        """Download and cache BTS track in background."""
-        cached_music = utils.MUSIC_DIR / f"{track.id}_{utils.session.audio_quality}.m4a"
-        tmp = cached_music.with_suffix(".tmp")
-
-        try:
-            import requests
-            logger.info(f"Caching BTS track: {track.id}")
-            response = requests.get(stream_url, stream=True)
-            if response.status_code == 200:
-                with open(tmp, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                tmp.rename(cached_music)
-                logger.info(f"Cached BTS track: {track.id}")
-            else:
-                logger.warning(f"BTS download failed for {track.id}: HTTP {response.status_code}")
-        except Exception as e:
-            logger.warning(f"Failed to cache BTS track {track.id}: {e}")
-            tmp.unlink(missing_ok=True)
+    def apply_replaygain_tags(self, playbin: Any = None, stream: Any = None):
+        """Apply ReplayGain normalization tags to the current track if enabled.
 
-    def apply_replaygain_tags(self):
-        """Apply ReplayGain normalization tags to the current track if enabled."""
-        audio_sink = self.playbin.get_property("audio-sink")
+        Args:
+            playbin: The playbin to apply the tags to, the playing one by default
+            stream: The stream the tags are read from, the playing one by default
+        """
+        playbin = playbin or self.playbin
+        stream = stream or self.stream
+        audio_sink = playbin.get_property("audio-sink")
 
+        rgtags = None
         if audio_sink:
             rgtags = audio_sink.get_by_name("rgtags")
 
@@ -588,16 +1475,16 @@ class PlayerObject(GObject.GObject):
 
         # https://github.com/EbbLabs/python-tidal/issues/332
         # Rather quiet album than broken eardrums
-        if self.stream.track_replay_gain != 1.0:
+        if stream.track_replay_gain != 1.0:
             tags = (
-                f"replaygain-track-gain={self.stream.track_replay_gain},"
-                f"replaygain-track-peak={self.stream.track_peak_amplitude}"
+                f"replaygain-track-gain={stream.track_replay_gain},"
+                f"replaygain-track-peak={stream.track_peak_amplitude}"
             )
 
-        if self.stream.album_replay_gain != 1.0:
+        if stream.album_replay_gain != 1.0:
             tags = (
-                f"replaygain-album-gain={self.stream.album_replay_gain},"
-                f"replaygain-album-peak={self.stream.album_peak_amplitude}"
+                f"replaygain-album-gain={stream.album_replay_gain},"
+                f"replaygain-album-peak={stream.album_peak_amplitude}"
             )
 
         if rgtags:
@@ -605,14 +1492,17 @@ class PlayerObject(GObject.GObject):
             logger.info("Applied RG Tags")
         # Save replaygain tags for every song to avoid missing tags when
         # toggling the option
-        self.most_recent_rg_tags = f"tags={tags}"
+        if playbin is self.playbin:
+            self.most_recent_rg_tags = f"tags={tags}"
 
     def _play_track_url(self, track, music_url, gapless=False):
         """Set up and play track from URL."""
         if not gapless:
             self.use_about_to_finish = False
             self.pipeline.set_state(Gst.State.NULL)
+            self._release_start_time(self.pipeline)
             self.playbin.set_property("volume", self.playbin.get_property("volume"))
+        self._pin_handoff_caps(self.playbin, gapless)
         self.playbin.set_property("uri", music_url)
 
         logger.info(music_url)
@@ -635,6 +1525,8 @@ class PlayerObject(GObject.GObject):
             playbin: required by Gst
         """
         # playbin is need as arg but we access it later over self
+        if playbin is not self.playbin:
+            return
         if self.gapless_enabled and self.use_about_to_finish and self.tracks_to_play:
             GLib.idle_add(self.play_next, True)
             logger.info("Trying gapless playbck")
@@ -665,31 +1557,39 @@ class PlayerObject(GObject.GObject):
             return
 
         if self.playing_track:
-            self.played_songs.append(self.playing_track)
+            self.play_queue.add_played(self.playing_track)
 
-        if self.queue:
-            track = self.queue.pop(0)
-            self.play_track(track, gapless=gapless)
-            return
+        if (
+            not self.queue
+            and not self.tracks_to_play
+            and self._repeat_type == RepeatType.LIST
+        ):
+            self.play_queue.restart()
 
-        if not self._tracks_to_play and self._repeat_type == RepeatType.LIST:
-            self._tracks_to_play = self.played_songs
-            self.tracks_to_play = self._tracks_to_play
-            self.played_songs = []
+        self._play_next_loaded(gapless)
 
-        if not self._tracks_to_play:
+    def _play_next_loaded(self, gapless: bool = False) -> None:
+        """Play the next track once its page of the source is loaded."""
+        if not self.play_queue.next_loaded():
+            self._next_pending = True
+            self.play_queue.load_next(self._play_next_loaded, gapless)
+            return
+
+        self._next_pending = False
+        track = self.play_queue.pop_next()
+        if track is None:
             self.pause()
             return
 
-        track_list = []
-        if self.shuffle:
-            track_list = self._shuffled_tracks_to_play
-        else:
-            track_list = self._tracks_to_play
+        self.play_track(track, gapless=gapless)
 
-        if track_list and len(track_list) > 0:
-            track = track_list.pop(0)
-            self.play_track(track, gapless=gapless)
+    def _on_queue_load_failed(self, play_queue: HTPlayQueue) -> None:
+        # Stop waiting for a page that won't load instead of stalling
+        if not self._next_pending:
+            return
+        self._next_pending = False
+        utils.send_toast(_("Could not load the next track"), 5)
+        self.pause()
 
     def play_previous(self):
         """Play the previous track or restart current track if near beginning."""
@@ -703,13 +1603,12 @@ class PlayerObject(GObject.GObject):
                 GLib.timeout_add(2000, self.previous_timer_callback)
             return
 
-        if not self.played_songs:
+        track = self.play_queue.pop_played()
+        if track is None:
             return
 
-        last_index = len(self.played_songs) - 1
-        track = self.played_songs.pop(last_index)
         if self.playing_track:
-            self._tracks_to_play.insert(0, self.playing_track)
+            self.play_queue.push_front(self.playing_track)
         self.play_track(track)
 
     def previous_timer_callback(self):
@@ -718,12 +1617,18 @@ class PlayerObject(GObject.GObject):
         self.notify("can-go-prev")
 
     def _update_shuffle_queue(self):
-        if self.shuffle:
-            self._shuffled_tracks_to_play = self._tracks_to_play.copy()
-            random.shuffle(self._shuffled_tracks_to_play)
-            self.tracks_to_play = self._shuffled_tracks_to_play
-        else:
-            self.tracks_to_play = self._tracks_to_play
+        self.play_queue.set_shuffle(self.shuffle)
+
+    def restore_shuffle(self, seed: int, anchor: int) -> None:
+        """Turn shuffle on with the order saved from a previous session.
+
+        Args:
+            seed (int): The seed of the shuffled order
+            anchor (int): The source position the shuffled order starts from
+        """
+        self._shuffle = True
+        self.notify("shuffle")
+        self.play_queue.set_shuffle(True, seed, anchor)
 
     def add_to_queue(self, track):
         """Add a track to the end of the play queue.
@@ -731,7 +1636,10 @@ class PlayerObject(GObject.GObject):
         Args:
             track: The Track object to add to the queue
         """
-        self.queue.append(track)
+        self.play_queue.add(track)
+        self._update_cache_pins()
+        self.prefetcher.prefetch(self.get_upcoming_tracks())
+        self._preroll_next()
         self.emit("song-added-to-queue")
 
     def add_next(self, track):
@@ -740,7 +1648,10 @@ class PlayerObject(GObject.GObject):
         Args:
             track: The Track object to play next
         """
-        self.queue.insert(0, track)
+        self.play_queue.add_next(track)
+        self._update_cache_pins()
+        self.prefetcher.prefetch(self.get_upcoming_tracks())
+        self._preroll_next()
         self.emit("song-added-to-queue")
 
     def query_volume(self):
@@ -773,6 +1684,7 @@ class PlayerObject(GObject.GObject):
         if not self.duration:
             logger.warning("Duration missing, trying again")
             self.duration = self.query_duration()
+        self._schedule_crossfade()
         self.emit("update-slider")
         return self.playing
 
@@ -842,7 +1754,6 @@ class PlayerObject(GObject.GObject):
         Returns:
             int: Index of current track, or 0 if not found
         """
-        for index, track_id in enumerate(self.id_list):
-            if track_id == self.playing_track.id:
-                return index
-        return 0
+        if not self.playing_track:
+            return 0
+        return self.play_queue.index_of(self.playing_track.id) or 0
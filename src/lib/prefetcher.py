@@ -0,0 +1,103 @@
+# prefetcher.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+import queue
+import threading
+from typing import Callable, Dict, List
+
+from tidalapi.media import Stream, StreamManifest, Track
+
+from .stream_cache import HTStreamCache
+
+logger = logging.getLogger(__name__)
+
+
+class HTPrefetcher:
+    """Resolves the streams of the upcoming tracks before they play.
+
+    The stream of a track holds its ReplayGain data and its manifest, so once it
+    is resolved in the stream cache the track can start without any API
+    request. Playing a track that is being prefetched waits for that request
+    instead of sending another one.
+    """
+
+    def __init__(
+        self,
+        stream_cache: HTStreamCache,
+        depth: int = 2,
+        warm: Callable[[Track, Stream, StreamManifest], None] | None = None,
+    ) -> None:
+        """
+        Args:
+            stream_cache: The cache the resolved streams are stored in
+            depth (int): The number of upcoming tracks to resolve, 0 to disable
+            warm: Called in the worker thread after a track is resolved, used
+                to start downloading it to the music cache
+        """
+        self.stream_cache = stream_cache
+        self.depth = depth
+        self.warm = warm
+
+        self._queue: queue.Queue = queue.Queue()
+        self._generation = 0
+        self._worker: threading.Thread | None = None
+
+        self.prefetched = 0
+        self.failed = 0
+
+    def prefetch(self, tracks: List[Track]) -> None:
+        """Resolve the first tracks of a list in background.
+
+        Replaces the tracks requested by the previous call that are not
+        resolved yet.
+
+        Args:
+            tracks: The upcoming tracks, in play order
+        """
+        self._generation += 1
+        for track in tracks[: self.depth]:
+            self._queue.put((self._generation, track))
+
+        if tracks and self.depth and self._worker is None:
+            self._worker = threading.Thread(target=self._work, daemon=True)
+            self._worker.start()
+
+    def _work(self) -> None:
+        while True:
+            generation, track = self._queue.get()
+            if generation != self._generation:
+                continue
+
+            try:
+                stream, manifest = self.stream_cache.get(track)
+                self.prefetched += 1
+                if self.warm:
+                    self.warm(track, stream, manifest)
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Could not prefetch track {track.id}")
+
+    def stats(self) -> Dict[str, int]:
+        """Get the prefetcher counters.
+
+        Returns:
+            dict: The number of tracks prefetched and failed
+        """
+        return {"prefetched": self.prefetched, "failed": self.failed}
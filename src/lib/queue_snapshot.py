@@ -0,0 +1,277 @@
+# queue_snapshot.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import gzip
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict
+
+from gi.repository import GLib
+
+from tidalapi.media import Track, Video
+
+from . import utils
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of the snapshot changes
+SNAPSHOT_VERSION = 1
+
+
+def encode_track(track: Track | Video) -> Dict[str, Any]:
+    """Get the metadata of a track the player and the queue show.
+
+    Videos, which mixes can hold, are saved with the fields they have.
+
+    Args:
+        track: The track or video
+
+    Returns:
+        dict: JSON serializable metadata, see decode_track
+    """
+    album = getattr(track, "album", None)
+    return {
+        "id": track.id,
+        "video": isinstance(track, Video),
+        "name": track.name,
+        "full_name": getattr(track, "full_name", track.name),
+        "version": getattr(track, "version", None),
+        "duration": getattr(track, "duration", None),
+        "available": getattr(track, "available", True),
+        "explicit": getattr(track, "explicit", False),
+        "artists": [
+            [artist.id, artist.name] for artist in getattr(track, "artists", None) or []
+        ],
+        "album": (
+            [
+                album.id,
+                getattr(album, "name", None),
+                getattr(album, "cover", None),
+                getattr(album, "video_cover", None),
+            ]
+            if album is not None and getattr(album, "id", None) is not None
+            else None
+        ),
+    }
+
+
+def decode_track(session: Any, data: Dict[str, Any]) -> Track | Video:
+    """Create a track from the metadata saved with encode_track.
+
+    No request is made, the track only has the saved metadata.
+
+    Args:
+        session: The TIDAL session
+        data (dict): The saved metadata
+
+    Returns:
+        Track: The track, or a Video if a video was saved
+    """
+    track = session.video() if data.get("video") else session.track()
+    track.id = data["id"]
+    track.name = data["name"]
+    track.full_name = data["full_name"]
+    track.version = data["version"]
+    track.duration = data["duration"]
+    track.available = data["available"]
+    track.explicit = data["explicit"]
+
+    track.artists = []
+    for artist_id, name in data["artists"]:
+        artist = session.artist()
+        artist.id = artist_id
+        artist.name = name
+        track.artists.append(artist)
+    track.artist = track.artists[0] if track.artists else None
+
+    if data["album"] is not None:
+        album = session.album()
+        album.id, album.name, album.cover, album.video_cover = data["album"]
+        track.album = album
+
+    return track
+
+
+class HTQueueSnapshot:
+    """Saves the play queue to a file to restore it at startup.
+
+    The snapshot holds the source, the ids of the tracks of the queue with the
+    metadata needed to show them, the shuffled order, the history and the
+    position in the playing track. It is written to a gzipped JSON file a few
+    seconds after the last change, so a burst of changes is written once.
+    """
+
+    # Milliseconds between a change and the write of the snapshot
+    WRITE_DELAY: int = 3000
+
+    def __init__(self, path: Path | str, player: Any) -> None:
+        """
+        Args:
+            path: The file the snapshot is written to
+            player: The PlayerObject whose queue is saved
+        """
+        self.path = Path(path)
+        self.player = player
+
+        self._timeout: int | None = None
+        self._lock = threading.Lock()
+
+    def schedule(self, *args) -> None:
+        """Write the snapshot after WRITE_DELAY, unless a write is pending."""
+        if self._timeout is None:
+            self._timeout = GLib.timeout_add(self.WRITE_DELAY, self._on_timeout)
+
+    def _on_timeout(self) -> bool:
+        self._timeout = None
+        self.save(background=True)
+        return False
+
+    def save(self, background: bool = False) -> None:
+        """Write the snapshot now. Must be called from the main thread.
+
+        Args:
+            background (bool): Whether to compress and write it in a thread
+        """
+        if self._timeout is not None:
+            GLib.source_remove(self._timeout)
+            self._timeout = None
+
+        snapshot = self._capture()
+        if snapshot is None:
+            return
+
+        if background:
+            threading.Thread(target=self._write, args=(snapshot,)).start()
+        else:
+            self._write(snapshot)
+
+    def _capture(self) -> Dict[str, Any] | None:
+        player = self.player
+        if player.playing_track is None:
+            return None
+
+        thing = player.current_mix_album_playlist
+        source = None
+        if thing is not None and not isinstance(thing, list):
+            source = {"type": utils.get_type(thing), "id": str(thing.id)}
+
+        state, tracks = player.play_queue.get_state()
+        tracks[player.playing_track.id] = player.playing_track
+
+        return {
+            "version": SNAPSHOT_VERSION,
+            "source": source,
+            "queue": state,
+            "playing": player.playing_track.id,
+            "position": player.query_position(),
+            "tracks": [encode_track(track) for track in tracks.values()],
+        }
+
+    def _write(self, snapshot: Dict[str, Any]) -> None:
+        data = json.dumps(snapshot, separators=(",", ":")).encode()
+        tmp_path = self.path.with_suffix(".tmp")
+        with self._lock:
+            try:
+                with gzip.open(tmp_path, "wb", compresslevel=6) as file:
+                    file.write(data)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                logger.exception("Could not save the play queue")
+
+    def load(self) -> Dict[str, Any] | None:
+        """Read the saved snapshot.
+
+        Returns:
+            dict: The snapshot, None if missing, corrupted or outdated
+        """
+        try:
+            with gzip.open(self.path, "rb") as file:
+                snapshot = json.loads(file.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.exception("Could not read the saved play queue")
+            return None
+
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return None
+        return snapshot
+
+    def restore(self) -> bool:
+        """Restore the saved queue in the player without any network request.
+
+        The snapshot is read where this is called, usually a thread, and the
+        queue is restored paused in the main loop.
+
+        Returns:
+            bool: Whether a saved queue was found and will be restored
+        """
+        snapshot = self.load()
+        if snapshot is None:
+            return False
+
+        session = utils.session
+        try:
+            tracks = {
+                data["id"]: decode_track(session, data)
+                for data in snapshot["tracks"]
+            }
+            thing = self._source_thing(session, snapshot["source"])
+            track = tracks[snapshot["playing"]]
+        except Exception:
+            logger.exception("Could not read the saved play queue")
+            return False
+
+        GLib.idle_add(self._apply, snapshot, thing, tracks, track)
+        return True
+
+    def _apply(
+        self,
+        snapshot: Dict[str, Any],
+        thing: Any,
+        tracks: Dict[int, Track],
+        track: Track,
+    ) -> None:
+        try:
+            self.player.restore_queue(
+                thing, snapshot["queue"], tracks, track, snapshot["position"]
+            )
+        except Exception:
+            logger.exception("Could not restore the saved play queue")
+            return
+
+        self.player.pause()
+        logger.info(f"Restored a play queue of {len(tracks)} tracks")
+
+    def _source_thing(self, session: Any, source: Dict[str, str] | None) -> Any:
+        """Get the object a queue was played from, without fetching it."""
+        if source is None:
+            return None
+
+        kind, item_id = source["type"], source["id"]
+        thing = None
+        if kind in ("artist", "album", "track", "playlist"):
+            thing = utils.cache.get_cached(kind, item_id)
+        if thing is None:
+            thing = getattr(session, kind)()
+            thing.id = item_id
+        return thing
@@ -0,0 +1,156 @@
+# stream_cache.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+import re
+import time
+from typing import Any, Dict, Hashable, List, Tuple
+
+from tidalapi.media import ManifestMimeType, Stream, StreamManifest, Track
+
+from . import utils
+from .cache import HTCacheStore
+from .dash import parse_mpd
+
+logger = logging.getLogger(__name__)
+
+# Expiry timestamps of signed CDN URLs, like __token__=exp=...~hmac=... or
+# Expires=...
+_EXPIRY_RE = re.compile(r"(?:\bexp=|[?&]Expires=)(\d{9,})")
+
+
+class _ResolvedStream:
+    def __init__(
+        self, stream: Stream, manifest: StreamManifest, expires_at: float
+    ) -> None:
+        self.stream = stream
+        self.manifest = manifest
+        self.expires_at = expires_at
+
+
+class HTStreamCache:
+    """Caches the resolved streams and manifests of tracks until their URLs expire.
+
+    Entries are keyed by track id and audio quality. The expiry is read from
+    the signed URLs of the stream, or a default lifetime is used when they
+    don't carry one. Concurrent resolutions of the same track share a single
+    request.
+    """
+
+    # Seconds an entry is kept when the URLs have no expiry
+    DEFAULT_TTL: float = 10 * 60
+
+    # Seconds before the expiry at which an entry isn't used anymore, so a
+    # track doesn't start with a URL about to expire
+    EXPIRY_MARGIN: float = 2 * 60
+
+    def __init__(self, max_size: int = 32) -> None:
+        """
+        Args:
+            max_size (int): The maximum number of resolved streams kept
+        """
+        self._store: HTCacheStore[_ResolvedStream] = HTCacheStore(max_size)
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    def _key(self, track: Track) -> Hashable:
+        return (track.id, utils.session.audio_quality)
+
+    def _urls(self, stream: Stream, manifest: StreamManifest) -> List[str]:
+        if stream.manifest_mime_type == ManifestMimeType.MPD:
+            return parse_mpd(stream.get_manifest_data())
+        urls = manifest.get_urls()
+        return urls if isinstance(urls, list) else [urls]
+
+    def _expires_at(self, stream: Stream, manifest: StreamManifest) -> float:
+        now = time.time()
+        try:
+            expiries = [
+                int(match.group(1))
+                for url in self._urls(stream, manifest)
+                for match in _EXPIRY_RE.finditer(url)
+            ]
+        except Exception:
+            logger.exception("Could not read the expiry of the stream URLs")
+            expiries = []
+
+        if not expiries:
+            return now + self.DEFAULT_TTL
+        return min(expiries) - self.EXPIRY_MARGIN
+
+    def _resolve(self, track: Track) -> _ResolvedStream:
+        stream = track.get_stream()
+        manifest = stream.get_stream_manifest()
+        return _ResolvedStream(stream, manifest, self._expires_at(stream, manifest))
+
+    def get(self, track: Track) -> Tuple[Stream, StreamManifest]:
+        """Get the stream and manifest of a track, resolving them if needed.
+
+        Blocks, call it from a thread.
+
+        Args:
+            track: The track
+
+        Returns:
+            tuple: The stream and its manifest
+        """
+        key = self._key(track)
+
+        entry = self._store.get(key)
+        if entry is not None and time.time() < entry.expires_at:
+            self.hits += 1
+            return entry.stream, entry.manifest
+
+        if entry is not None:
+            self.expired += 1
+            self._store.invalidate(key)
+
+        self.misses += 1
+        entry = self._store.get_or_fetch(key, lambda: self._resolve(track))
+        return entry.stream, entry.manifest
+
+    def invalidate(self, track: Track) -> None:
+        """Forget the resolved stream of a track, like when its URL was refused.
+
+        Args:
+            track: The track
+        """
+        self.invalidated += 1
+        self._store.invalidate(self._key(track))
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the cache counters.
+
+        Returns:
+            dict: The number of hits, misses, expired and invalidated entries,
+                the hit rate and the counters of the underlying store
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "invalidated": self.invalidated,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._store),
+            "coalesced": self._store.stats()["coalesced"],
+        }
@@ -0,0 +1,586 @@
+# stream_proxy.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Iterator, List, Set, Tuple
+
+from .cache import HTCacheStore
+from .dash import parse_mpd, rewrite_mpd
+from .http_client import HTHttpClient
+
+logger = logging.getLogger(__name__)
+
+# Headers of the upstream response passed to the player
+_FORWARDED_HEADERS = (
+    "Content-Type",
+    "Content-Length",
+    "Content-Range",
+    "Accept-Ranges",
+)
+
+_RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)")
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-\d+/(\d+)")
+
+# Bytes received between two saves of the downloaded ranges
+_SAVE_INTERVAL = 1024 * 1024
+
+
+class _ByteRanges:
+    """A sorted list of disjoint [start, end) byte ranges."""
+
+    def __init__(self, ranges: List[List[int]] | None = None) -> None:
+        self.ranges: List[List[int]] = []
+        for start, end in ranges or []:
+            self.add(start, end)
+
+    def add(self, start: int, end: int) -> None:
+        merged = [start, end]
+        ranges = []
+        for current in self.ranges:
+            if current[1] < merged[0] or current[0] > merged[1]:
+                ranges.append(current)
+            else:
+                merged = [min(current[0], merged[0]), max(current[1], merged[1])]
+        ranges.append(merged)
+        self.ranges = sorted(ranges)
+
+    def covered_end(self, position: int) -> int:
+        """Get the end of the range containing position, or position"""
+        for start, end in self.ranges:
+            if start <= position < end:
+                return end
+        return position
+
+    def next_start(self, position: int) -> int | None:
+        """Get the start of the first range after position"""
+        for start, _end in self.ranges:
+            if start > position:
+                return start
+        return None
+
+    def covers(self, size: int) -> bool:
+        return self.ranges == [[0, size]]
+
+
+class _ProxiedStream:
+    """A stream registered in the proxy and the cache file it is written to."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.url = ""
+        self.segments: List[str] = []
+        self.start_number = 1
+        self.manifest: str | None = None
+        self.lock = threading.Lock()
+        self.committed = False
+
+        # Partially downloaded data: the segments of a DASH stream, or a sparse
+        # file and the ranges it contains for a BTS stream
+        self.parts_dir = path.with_name(f"{path.name}.parts")
+        self.parts: Set[int] = set()
+        self.data_path = self.parts_dir / "data"
+        self.ranges_path = self.parts_dir / "ranges"
+        self.ranges = _ByteRanges()
+        self.size: int | None = None
+        self.content_type = "audio/mp4"
+        self._unsaved = 0
+
+        if not self.parts_dir.is_dir():
+            return
+
+        self.parts = {int(p.name) for p in self.parts_dir.iterdir() if p.name.isdigit()}
+        if self.ranges_path.exists():
+            try:
+                with open(self.ranges_path) as f:
+                    saved = json.load(f)
+                self.size = saved["size"]
+                self.content_type = saved["content_type"]
+                self.ranges = _ByteRanges(saved["ranges"])
+            except (OSError, ValueError, KeyError):
+                self.ranges = _ByteRanges()
+
+    def save_ranges(self) -> None:
+        """Persist the downloaded ranges. Needs self.lock"""
+        tmp = self.parts_dir / "ranges.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "size": self.size,
+                    "content_type": self.content_type,
+                    "ranges": self.ranges.ranges,
+                },
+                f,
+            )
+        os.replace(tmp, self.ranges_path)
+        self._unsaved = 0
+
+    def add_range(self, start: int, end: int) -> None:
+        with self.lock:
+            self.ranges.add(start, end)
+            self._unsaved += end - start
+            # Once committed the parts directory is gone
+            if self._unsaved >= _SAVE_INTERVAL and not self.committed:
+                self.save_ranges()
+
+
+class _UpstreamError(Exception):
+    """The CDN answered with an error status."""
+
+    def __init__(self, status: int) -> None:
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class _ProxyRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    responded = False
+
+    def send_response(self, code, message=None) -> None:
+        self.responded = True
+        super().send_response(code, message)
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(format % args)
+
+    def do_GET(self) -> None:
+        self.server.proxy._handle(self)
+
+
+class HTStreamProxy:
+    """A loopback HTTP proxy that writes the streams it serves to the music cache.
+
+    The player is given a local URL instead of the CDN one. The bytes the
+    player reads are written to a temporary file at the same time, and the file
+    is moved into the cache only when the whole stream was received with the
+    expected size. A track is therefore downloaded once on its first play.
+
+    Streams are registered per cache file, so per track and quality. DASH
+    manifests are kept with their stream and served from memory.
+
+    Partial downloads are kept in a parts directory next to the cache file, so
+    a track that was skipped or seeked resumes without downloading again what
+    was already received. BTS streams are written to a sparse file with the
+    list of byte ranges it holds, requested ranges are served from it and only
+    the gaps are fetched from the CDN. DASH segments are stored one per file
+    and concatenated once all of them were received.
+    """
+
+    # Number of registered streams and manifests kept
+    MAX_STREAMS = 8
+
+    def __init__(
+        self,
+        http_client: HTHttpClient,
+        on_commit: Callable[[Path], None] | None = None,
+        on_partial: Callable[[Path], None] | None = None,
+    ) -> None:
+        """
+        Args:
+            http_client: The client used for the upstream requests
+            on_commit: Called with the path of every file added to the cache,
+                its parts directory is deleted at that point
+            on_partial: Called with the parts directory of a stream when data
+                was written to it
+        """
+        self.http_client = http_client
+        self.on_commit = on_commit
+        self.on_partial = on_partial
+
+        # Streams by cache file name, so (track id, quality)
+        self._streams: HTCacheStore[_ProxiedStream] = HTCacheStore(
+            max_size=self.MAX_STREAMS
+        )
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+
+    def _start(self) -> None:
+        if self._server:
+            return
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _ProxyRequestHandler)
+        self._server.daemon_threads = True
+        self._server.proxy = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.info(f"Stream proxy listening on port {self._server.server_port}")
+
+    def _get_stream(self, path: Path) -> Tuple[_ProxiedStream, str]:
+        """Get the stream writing to a cache file, registering it if needed.
+
+        Returns:
+            tuple: The stream and its local base URL
+        """
+        with self._lock:
+            self._start()
+            stream = self._streams.get(path.stem)
+            if stream is None or stream.committed:
+                stream = _ProxiedStream(path)
+                self._streams.put(path.stem, stream)
+        return stream, f"http://127.0.0.1:{self._server.server_port}/{path.stem}"
+
+    def proxy_bts(self, url: str, path: Path) -> str:
+        """Register a BTS stream.
+
+        Args:
+            url (str): The URL of the stream
+            path (Path): The cache file to write
+
+        Returns:
+            str: The local URL to play
+        """
+        stream, base_url = self._get_stream(path)
+        with stream.lock:
+            stream.url = url
+        return base_url
+
+    def proxy_mpd(self, manifest: str, path: Path) -> Tuple[str, bool]:
+        """Register a DASH stream and serve its manifest from memory.
+
+        The manifest is served by the proxy with its segments pointing to the
+        proxy, or unchanged if it can't be rewritten.
+
+        Args:
+            manifest (str): The MPD manifest
+            path (Path): The cache file to write
+
+        Returns:
+            tuple: The local URL of the manifest and whether the stream will
+                be written to the cache file
+        """
+        stream, base_url = self._get_stream(path)
+
+        rewritten = None
+        try:
+            segments = parse_mpd(manifest)
+            rewritten = rewrite_mpd(
+                manifest, f"{base_url}/init", f"{base_url}/$Number$"
+            )
+        except Exception:
+            logger.exception("Could not parse the manifest to proxy")
+
+        with stream.lock:
+            if rewritten is None:
+                stream.segments = []
+                stream.manifest = manifest
+            else:
+                stream.segments = segments
+                stream.manifest, stream.start_number = rewritten
+
+        return f"{base_url}/manifest.mpd", rewritten is not None
+
+    def _handle(self, request: _ProxyRequestHandler) -> None:
+        name, _sep, segment = request.path.lstrip("/").partition("/")
+        stream = self._streams.get(name)
+
+        if stream is None:
+            request.send_error(404)
+            return
+
+        try:
+            if segment == "manifest.mpd" and stream.manifest:
+                self._serve_manifest(request, stream)
+            elif stream.segments:
+                self._serve_segment(request, stream, segment)
+            elif stream.url:
+                self._serve_bts(request, stream)
+            else:
+                request.send_error(404)
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("Player closed the proxied stream")
+        except _UpstreamError as e:
+            logger.warning(f"Upstream error for {name}: {e}")
+            if not request.responded:
+                request.send_error(e.status)
+        except Exception:
+            logger.exception("Error serving proxied stream")
+
+    def _serve_manifest(
+        self, request: _ProxyRequestHandler, stream: _ProxiedStream
+    ) -> None:
+        data = stream.manifest.encode("utf-8")
+        request.send_response(200)
+        request.send_header("Content-Type", "application/dash+xml")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def _send_headers(
+        self,
+        request: _ProxyRequestHandler,
+        response,
+        content_length: int | None = None,
+    ) -> None:
+        request.send_response(response.status_code)
+        headers = {
+            header: response.headers[header]
+            for header in _FORWARDED_HEADERS
+            if header in response.headers
+        }
+        if content_length is not None:
+            headers["Content-Length"] = str(content_length)
+        if content_length is None and (
+            "Content-Length" not in headers or "Content-Encoding" in response.headers
+        ):
+            # The body is decoded, so its length is only known at the end
+            headers.pop("Content-Length", None)
+            headers["Connection"] = "close"
+            request.close_connection = True
+        for header, value in headers.items():
+            request.send_header(header, value)
+        request.end_headers()
+
+    def _open_upstream(
+        self, stream: _ProxiedStream, start: int, end: int | None
+    ) -> Tuple[object, int]:
+        """Request a byte range of a BTS stream, learning its size.
+
+        Returns:
+            tuple: The response and the offset of its first byte
+        """
+        range_header = f"bytes={start}-{'' if end is None else end - 1}"
+        response = self.http_client.get(
+            stream.url, stream=True, headers={"Range": range_header}
+        )
+
+        if response.status_code == 206:
+            content_range = response.headers.get("Content-Range", "")
+            match = _CONTENT_RANGE_RE.match(content_range)
+            offset, size = start, None
+            if match:
+                offset, size = int(match.group(1)), int(match.group(2))
+        elif response.status_code == 200:
+            offset = 0
+            size = int(response.headers.get("Content-Length") or 0) or None
+        else:
+            response.close()
+            raise _UpstreamError(response.status_code)
+
+        if stream.size is None and size is not None:
+            stream.size = size
+            stream.content_type = response.headers.get(
+                "Content-Type", stream.content_type
+            )
+        return response, offset
+
+    def _read_local(
+        self, stream: _ProxiedStream, start: int, end: int
+    ) -> Iterator[bytes]:
+        with open(stream.data_path, "rb") as f:
+            f.seek(start)
+            while start < end:
+                chunk = f.read(min(65536, end - start))
+                if not chunk:
+                    raise RuntimeError("Partial data file is shorter than expected")
+                start += len(chunk)
+                yield chunk
+
+    def _serve_bts(self, request: _ProxyRequestHandler, stream: _ProxiedStream) -> None:
+        match = _RANGE_RE.match(request.headers.get("Range", ""))
+        start = int(match.group(1)) if match else 0
+
+        response = None
+        if stream.size is None:
+            response, offset = self._open_upstream(stream, start, None)
+            if stream.size is None:
+                # Without a size the ranges can't be tracked, only forward
+                with response:
+                    self._send_headers(request, response)
+                    for chunk in response.iter_content(chunk_size=65536):
+                        request.wfile.write(chunk)
+                return
+
+        size = stream.size
+        end = size
+        if match and match.group(2):
+            end = min(int(match.group(2)) + 1, size)
+
+        if start >= size:
+            request.send_response(416)
+            request.send_header("Content-Range", f"bytes */{size}")
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+
+        # Open the first missing range before answering, so an upstream error
+        # like an expired URL reaches the player with its status
+        with stream.lock:
+            covered = stream.ranges.covered_end(start) > start
+            gap_end = min(stream.ranges.next_start(start) or end, end)
+        if response is None and not covered:
+            response, offset = self._open_upstream(stream, start, gap_end)
+
+        request.send_response(206 if match else 200)
+        request.send_header("Content-Type", stream.content_type)
+        request.send_header("Content-Length", str(end - start))
+        request.send_header("Accept-Ranges", "bytes")
+        if match:
+            request.send_header("Content-Range", f"bytes {start}-{end - 1}/{size}")
+        request.end_headers()
+
+        with stream.lock:
+            if not stream.committed:
+                stream.parts_dir.mkdir(exist_ok=True)
+                with open(stream.data_path, "ab"):
+                    pass
+
+        try:
+            with open(stream.data_path, "r+b") as data_file:
+                position = start
+                while position < end:
+                    with stream.lock:
+                        local_end = min(stream.ranges.covered_end(position), end)
+                        gap_end = min(stream.ranges.next_start(position) or end, end)
+
+                    if local_end > position:
+                        for chunk in self._read_local(stream, position, local_end):
+                            request.wfile.write(chunk)
+                        position = local_end
+                        continue
+
+                    if response is None:
+                        response, offset = self._open_upstream(
+                            stream, position, gap_end
+                        )
+                    position = self._fill_gap(
+                        request, stream, data_file, response, offset, position, gap_end
+                    )
+                    response = None
+        finally:
+            if response is not None:
+                response.close()
+            with stream.lock:
+                partial = not stream.committed and stream.parts_dir.is_dir()
+                if partial:
+                    stream.save_ranges()
+                if stream.ranges.covers(size) and not stream.committed:
+                    partial = False
+                    self._commit(stream, stream.data_path)
+                    shutil.rmtree(stream.parts_dir, ignore_errors=True)
+                    # Later requests read the committed file
+                    stream.data_path = stream.path
+            if partial and self.on_partial:
+                self.on_partial(stream.parts_dir)
+
+    def _fill_gap(
+        self,
+        request: _ProxyRequestHandler,
+        stream: _ProxiedStream,
+        data_file,
+        response,
+        offset: int,
+        position: int,
+        gap_end: int,
+    ) -> int:
+        """Send a missing range to the player from upstream, writing it to disk.
+
+        Returns:
+            int: The position reached
+        """
+        with response:
+            for chunk in response.iter_content(chunk_size=65536):
+                chunk_end = offset + len(chunk)
+                os.pwrite(data_file.fileno(), chunk, offset)
+                stream.add_range(offset, chunk_end)
+
+                low, high = max(offset, position), min(chunk_end, gap_end)
+                if high > low:
+                    request.wfile.write(chunk[low - offset : high - offset])
+                    position = high
+
+                offset = chunk_end
+                if offset >= gap_end:
+                    break
+
+        if position < gap_end:
+            raise RuntimeError(f"Upstream closed at {position} of {gap_end}")
+        return position
+
+    def _serve_segment(
+        self, request: _ProxyRequestHandler, stream: _ProxiedStream, segment: str
+    ) -> None:
+        if segment == "init":
+            index = 0
+        elif segment.isdigit():
+            index = int(segment) - stream.start_number + 1
+        else:
+            index = -1
+        if not 0 <= index < len(stream.segments):
+            request.send_error(404)
+            return
+
+        part = stream.parts_dir / str(index)
+        if index in stream.parts and not stream.committed:
+            data = part.read_bytes()
+            request.send_response(200)
+            request.send_header("Content-Type", "audio/mp4")
+            request.send_header("Content-Length", str(len(data)))
+            request.end_headers()
+            request.wfile.write(data)
+            return
+
+        response = self.http_client.get(stream.segments[index])
+        data = response.content
+        expected = len(data)
+        if "Content-Encoding" not in response.headers:
+            expected = int(response.headers.get("Content-Length") or len(data))
+
+        self._send_headers(request, response, len(data))
+        request.wfile.write(data)
+
+        if response.status_code != 200 or len(data) != expected:
+            return
+
+        with stream.lock:
+            # Once committed the parts directory is gone
+            if stream.committed:
+                return
+            stream.parts_dir.mkdir(exist_ok=True)
+            tmp = stream.parts_dir / f"{index}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, part)
+
+            stream.parts.add(index)
+            if len(stream.parts) < len(stream.segments):
+                if self.on_partial:
+                    self.on_partial(stream.parts_dir)
+                return
+
+            tmp = stream.path.with_name(f".{stream.path.name}.proxy.tmp")
+            try:
+                with open(tmp, "wb") as f:
+                    for i in range(len(stream.segments)):
+                        with open(stream.parts_dir / str(i), "rb") as part_file:
+                            shutil.copyfileobj(part_file, f)
+                self._commit(stream, tmp)
+                shutil.rmtree(stream.parts_dir, ignore_errors=True)
+            finally:
+                tmp.unlink(missing_ok=True)
+
+    def _commit(self, stream: _ProxiedStream, tmp: Path) -> None:
+        os.replace(tmp, stream.path)
+        stream.committed = True
+        logger.info(f"Cached streamed track: {stream.path.name}")
+        if self.on_commit:
+            self.on_commit(stream.path)
@@ -0,0 +1,269 @@
+# track_source.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from gi.repository import GLib, GObject
+
+from tidalapi.media import Track
+
+from .cache import HTSingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class HTTrackSource(GObject.GObject):
+    """The tracks of a large playlist or album, loaded page by page.
+
+    The number of tracks is known up front, so the source can be played and
+    shuffled as a whole while only the pages that are needed get loaded.
+    Indexing an unloaded track loads its page and blocks, get returns None
+    instead. Pages are usually loaded in background with prefetch before they
+    are needed.
+
+    The page-loaded signal is emitted in the main loop with the offset of
+    every page loaded, load-failed with the offset of a page prefetch could
+    not load. The number of tracks can be smaller than announced, like when
+    tracks were removed since it was fetched: when a page comes back short,
+    the source shrinks to the tracks it really has and size-changed is
+    emitted with the new size.
+    """
+
+    __gsignals__ = {
+        "page-loaded": (GObject.SignalFlags.RUN_FIRST, None, (int,)),
+        "load-failed": (GObject.SignalFlags.RUN_FIRST, None, (int,)),
+        "size-changed": (GObject.SignalFlags.RUN_FIRST, None, (int,)),
+    }
+
+    PAGE_SIZE: int = 100
+
+    def __init__(
+        self,
+        fetch: Callable[..., List[Track]],
+        size: int,
+        page_size: int = PAGE_SIZE,
+    ) -> None:
+        """
+        Args:
+            fetch: The function returning the tracks of a page, it needs to
+                support limit and offset arguments
+            size (int): The number of tracks of the source
+            page_size (int): The number of tracks loaded at once
+        """
+        GObject.GObject.__init__(self)
+
+        self._fetch = fetch
+        self._size = size
+        self.page_size = page_size
+
+        self._pages: Dict[int, List[Track]] = {}
+        self._flight = HTSingleFlight()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> Track:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("track index out of range")
+
+        track = self.get(index)
+        if track is None:
+            self.load(index)
+            track = self.get(index)
+        if track is None:
+            raise IndexError(f"track {index} is missing from its page")
+        return track
+
+    def __iter__(self) -> Iterator[Track]:
+        for index in range(self._size):
+            yield self[index]
+
+    def get(self, index: int) -> Track | None:
+        """Get a track if its page is loaded, without blocking.
+
+        Args:
+            index (int): The position of the track
+
+        Returns:
+            Track: The track, None if its page isn't loaded
+        """
+        offset = index - index % self.page_size
+        page = self._pages.get(offset)
+        if page is None or index - offset >= len(page):
+            return None
+        return page[index - offset]
+
+    def is_missing(self, index: int) -> bool:
+        """Whether a track turned out not to exist, its page being loaded
+        without it.
+
+        Args:
+            index (int): The position of the track
+
+        Returns:
+            bool: True if the track is past the end of the source or of its
+                loaded page
+        """
+        if index >= self._size:
+            return True
+        offset = index - index % self.page_size
+        page = self._pages.get(offset)
+        return page is not None and index - offset >= len(page)
+
+    def get_page(self, offset: int) -> List[Track]:
+        """Get the tracks of a loaded page.
+
+        Args:
+            offset (int): The position of the first track of the page
+
+        Returns:
+            list: The tracks, empty if the page isn't loaded
+        """
+        return self._pages.get(offset, [])
+
+    def add_page(self, offset: int, tracks: List[Track]) -> None:
+        """Add a page loaded elsewhere, like from a saved queue.
+
+        Args:
+            offset (int): The position of the first track of the page
+            tracks: The tracks of the page
+        """
+        self._pages[offset] = tracks
+
+    def loaded_pages(self) -> List[Tuple[int, List[Track]]]:
+        """Get the pages loaded so far.
+
+        Returns:
+            list: The offset and the tracks of every loaded page
+        """
+        return list(self._pages.items())
+
+    def load(self, index: int) -> None:
+        """Load the page of a track if it isn't loaded. Blocks, call it from a
+        thread when possible.
+
+        Args:
+            index (int): The position of the track
+        """
+        offset = index - index % self.page_size
+        if offset in self._pages:
+            return
+        self._flight.do(offset, lambda: self._load_page(offset))
+
+    def prefetch(
+        self,
+        indexes: Iterable[int],
+        callback: Callable[..., Any] | None = None,
+        *args: Any,
+    ) -> None:
+        """Load the pages of some tracks in background.
+
+        Args:
+            indexes: The positions of the tracks
+            callback: Called with args in the main loop once every page is
+                loaded, not called if one could not be loaded
+            *args: The arguments of callback
+        """
+        offsets = sorted(
+            {index - index % self.page_size for index in indexes} - self._pages.keys()
+        )
+        if offsets:
+            threading.Thread(
+                target=self._th_load_pages,
+                args=(offsets, callback, args),
+                daemon=True,
+            ).start()
+        elif callback is not None:
+            GLib.idle_add(callback, *args)
+
+    def _th_load_pages(
+        self,
+        offsets: List[int],
+        callback: Callable[..., Any] | None = None,
+        args: Tuple = (),
+    ) -> None:
+        loaded = True
+        for offset in offsets:
+            try:
+                self.load(offset)
+            except Exception:
+                logger.exception(f"Could not load the tracks from {offset}")
+                GLib.idle_add(self.emit, "load-failed", offset)
+                loaded = False
+        if loaded and callback is not None:
+            GLib.idle_add(callback, *args)
+
+    def first_available(self, index: int, load: bool = False) -> int | None:
+        """Get the position of the first available track from a position.
+
+        The pages are searched in order from the one of index, wrapping around
+        to the first page after the last one.
+
+        Args:
+            index (int): The position to start from
+            load (bool): Whether to load the missing pages, which blocks.
+                Otherwise the search stops at the first page that isn't
+                loaded and that page is loaded in background
+
+        Returns:
+            int: The position of the track, None if there is none or the
+                search stopped at a page that isn't loaded
+        """
+        if not self._size:
+            return None
+
+        position = index % self._size
+        for _i in range(self._size // self.page_size + 2):
+            offset = position - position % self.page_size
+            if offset not in self._pages:
+                if not load:
+                    self.prefetch([offset])
+                    return None
+                self.load(offset)
+
+            page = self._pages[offset]
+            for page_index in range(position - offset, len(page)):
+                if page[page_index].available:
+                    return offset + page_index
+
+            position = offset + self.page_size
+            if position >= self._size:
+                position = 0
+        return None
+
+    def _load_page(self, offset: int) -> None:
+        if offset in self._pages:
+            return
+        tracks = list(self._fetch(limit=self.page_size, offset=offset))
+        logger.info(f"Loaded {len(tracks)} tracks from {offset}")
+        self._pages[offset] = tracks
+        GLib.idle_add(self.emit, "page-loaded", offset)
+
+        size = offset + len(tracks)
+        if len(tracks) < self.page_size and size < self._size:
+            logger.info(f"Only {size} of {self._size} tracks exist")
+            self._size = size
+            for other in list(self._pages):
+                if other > offset:
+                    self._pages.pop(other, None)
+            GLib.idle_add(self.emit, "size-changed", size)
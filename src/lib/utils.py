@@ -17,20 +17,20 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import hashlib
 import html
 import os
 import re
+import shutil
 import subprocess
 import threading
+import time
 import uuid
 import logging
 from gettext import gettext as _
 from pathlib import Path
-from typing import Any, List
+from typing import Any, Dict, List, Set
 
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 from gi.repository import Adw, Gdk, Gio, GLib
 
 import tidalapi
@@ -39,10 +39,14 @@ from tidalapi.artist import Artist
 from tidalapi.mix import Mix
 from tidalapi.playlist import Playlist
 from tidalapi.media import Track
-from tidalapi.types import ItemOrder, OrderDirection
 
 from ..pages import HTAlbumPage, HTArtistPage, HTMixPage, HTPlaylistPage
-from .cache import HTCache
+from .cache import HTCache, HTSingleFlight
+from .cache_index import HTCacheIndex
+from .http_client import HTHttpClient
+from .image_loader import HTImageLoader, ImagePriority
+from .metadata_store import HTMetadataStore
+from .stream_proxy import HTStreamProxy
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +57,14 @@ favourite_albums: List[Album] = []
 favourite_playlists: List[Playlist] = []
 playlist_and_favorite_playlists: List[Playlist] = []
 user_playlists: List[Playlist] = []
+favourite_ids: Dict[str, Set[str]] = {}
+
+# Downloads to the media cache in progress, keyed by destination path
+in_flight_downloads = HTSingleFlight()
+
+# Seconds between two passes of cache_maintenance()
+CACHE_MAINTENANCE_INTERVAL = 30 * 60
+_cache_maintenance_lock = threading.Lock()
 
 
 def init() -> None:
@@ -79,8 +91,28 @@ def init() -> None:
     global player_object
     global toast_overlay
     global cache
+    global metadata_store
+    global image_loader
+    global http_client
+    global image_cache_index
+    global music_cache_index
+    global stream_proxy
     session = None
-    cache = HTCache(session)
+    http_client = HTHttpClient()
+    metadata_store = HTMetadataStore(Path(CACHE_DIR, "metadata.sqlite"))
+    cache = HTCache(session, metadata_store)
+    image_loader = HTImageLoader(get_image_url)
+    image_cache_index = HTCacheIndex(Path(CACHE_DIR, "image_index.sqlite"), IMG_DIR)
+    music_cache_index = HTCacheIndex(Path(CACHE_DIR, "music_index.sqlite"), MUSIC_DIR)
+    stream_proxy = HTStreamProxy(
+        http_client, _on_stream_cached, on_partial=music_cache_index.add
+    )
+
+
+def _on_stream_cached(path: Path) -> None:
+    music_cache_index.add(path)
+    # The parts directory was deleted once the stream was complete
+    music_cache_index.remove(path.with_name(f"{path.name}.parts"))
 
 
 def get_alsa_devices() -> List[dict]:
@@ -246,40 +278,14 @@ def get_favourites() -> None:
 
     Retrieves and caches the user's favorite mixes, tracks, artists, albums,
     playlists, and user-created playlists for quick access throughout the app.
+    The lists are saved in the metadata store for load_cached_favourites().
     """
-    global favourite_mixes
-    global favourite_tracks
-    global favourite_artists
-    global favourite_albums
-    global favourite_playlists
-    global playlist_and_favorite_playlists
-    global user_playlists
-
-    user = session.user
-
     try:
-        favourite_artists = user.favorites.artists()
-        favourite_tracks = user.favorites.tracks(
-            order=ItemOrder.Date, 
-            order_direction=OrderDirection.Descending
-        )
-        favourite_albums = user.favorites.albums()
-        favourite_playlists = user.favorites.playlists()
-        favourite_mixes = user.favorites.mixes()
-        user_playlists = user.playlists()
-
-        count = user.favorites.get_playlists_count()
-        limit = 50
-        offset = 0
-        pages = []
-
-        while offset < count:
-            pages += user.playlist_and_favorite_playlists(offset=offset)
-            offset += limit
-
-        playlist_and_favorite_playlists = pages
+        favourites = cache.fetch_favourites(session.user)
     except Exception:
         logger.exception("Error while getting Favourites")
+    else:
+        _set_favourites(favourites)
 
     logger.info(f"Favorite Artists: {len(favourite_artists)}")
     logger.info(f"Favorite Tracks: {len(favourite_tracks)}")
@@ -292,43 +298,62 @@ def get_favourites() -> None:
     logger.info(f"User Playlists: {len(user_playlists)}")
 
 
-def is_favourited(item: Any) -> bool:
-    """Check if a TIDAL item is in the user's favorites.
+def load_cached_favourites() -> bool:
+    """Restore the favorites saved by the last get_favourites() call.
 
-    Args:
-        item: A TIDAL object (Track, Mix, Album, Artist, or Playlist)
+    The lists saved in the metadata store are parsed again, so this never
+    makes a network request. get_favourites() should still be called afterwards
+    to refresh them.
 
     Returns:
-        bool: True if the item is favorited, False otherwise
+        bool: True if saved favorites were found, False otherwise
     """
+    favourites = cache.get_cached_favourites(str(session.user.id))
+    if favourites is None:
+        return False
+
+    _set_favourites(favourites)
+
+    logger.info(f"Restored {sum(map(len, favourite_ids.values()))} favourites")
+    return True
+
+
+def _set_favourites(favourites: Dict[str, List[Any]]) -> None:
     global favourite_mixes
     global favourite_tracks
     global favourite_artists
     global favourite_albums
     global favourite_playlists
+    global playlist_and_favorite_playlists
+    global user_playlists
+    global favourite_ids
 
-    if isinstance(item, Track):
-        for fav in favourite_tracks:
-            if fav.id == item.id:
-                return True
-    elif isinstance(item, Mix):
-        for fav in favourite_mixes:
-            if fav.id == item.id:
-                return True
-    elif isinstance(item, Album):
-        for fav in favourite_albums:
-            if fav.id == item.id:
-                return True
-    elif isinstance(item, Artist):
-        for fav in favourite_artists:
-            if fav.id == item.id:
-                return True
-    elif isinstance(item, Playlist):
-        for fav in favourite_playlists:
-            if fav.id == item.id:
-                return True
+    favourite_artists = favourites["artists"]
+    favourite_tracks = favourites["tracks"]
+    favourite_albums = favourites["albums"]
+    favourite_playlists = favourites["playlists"]
+    favourite_mixes = favourites["mixes"]
+    user_playlists = favourites["user_playlists"]
+    playlist_and_favorite_playlists = favourites["playlist_and_favorite_playlists"]
+    favourite_ids = {
+        kind: set(ids) for kind, ids in HTCache.favourite_ids(favourites).items()
+    }
 
-    return False
+
+def is_favourited(item: Any) -> bool:
+    """Check if a TIDAL item is in the user's favorites.
+
+    Args:
+        item: A TIDAL object (Track, Mix, Album, Artist, or Playlist)
+
+    Returns:
+        bool: True if the item is favorited, False otherwise
+    """
+    kind = get_type(item)
+    if kind is None:
+        return False
+
+    return str(item.id) in favourite_ids.get(kind, ())
 
 
 def send_toast(toast_title: str, timeout: int) -> None:
@@ -573,87 +598,148 @@ def get_best_dimensions(widget: Any) -> int:
     return next((x for x in dimensions if x > (edge * scale)), dimensions[-1])
 
 
-def get_image_url(item: Any, dimensions: int = 320) -> str | None:
-    """Get the local file path for an item's image, downloading if necessary.
+def _download_file(url: str, file_path: Path) -> bool:
+    """Download a file atomically.
+
+    The data is written to a temporary file in the same directory which is
+    renamed once complete, so readers never see a partially written file.
 
     Args:
-        item: A TIDAL object with image data
-        dimensions (int): The desired image dimensions (default: 320)
+        url (str): The URL to download
+        file_path (Path): The destination
 
     Returns:
-        str: Path to the local image file, or None if download failed
+        bool: True if the file was downloaded, False otherwise
     """
-    if hasattr(item, "id"):
-        file_path = IMG_DIR / f"{item.id}_{dimensions}.jpg"
-    else:
-        file_path = IMG_DIR / f"{uuid.uuid4()}_{dimensions}.jpg"
+    tmp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with http_client.get(url, stream=True) as response:
+            if response.status_code != 200:
+                logger.warning(f"Could not download {url}: HTTP {response.status_code}")
+                return False
+            with open(tmp_path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=65536):
+                    file.write(chunk)
+        os.replace(tmp_path, file_path)
+        return True
+    except Exception:
+        logger.exception(f"Could not download {url}")
+        return False
+    finally:
+        tmp_path.unlink(missing_ok=True)
 
-    if file_path.is_file():
-        return str(file_path)
+
+def _get_cached_file(
+    item: Any, dimensions: int, suffix: str, url_method: str
+) -> str | None:
+    """Get the local path of an item's media, downloading it if necessary.
+
+    Files are named after the item id, or after a hash of the URL for items
+    without an id. Concurrent calls for the same file share one download.
+
+    Args:
+        item: A TIDAL object
+        dimensions (int): The media dimensions
+        suffix (str): The file extension
+        url_method (str): The name of the item method returning the URL
+
+    Returns:
+        str: Path to the local file, or None if the download failed
+    """
+    file_path = None
+    if getattr(item, "id", None) is not None:
+        file_path = IMG_DIR / f"{item.id}_{dimensions}{suffix}"
+        if file_path.is_file():
+            image_cache_index.touch(file_path)
+            return str(file_path)
 
     try:
-        picture_url = item.image(dimensions=dimensions)
-        response = requests.get(picture_url)
+        url = getattr(item, url_method)(dimensions=dimensions)
     except Exception:
-        logger.exception("Could not get image")
+        logger.exception("Could not get media url")
         return None
-    if response.status_code == 200:
-        picture_data = response.content
 
-        with open(file_path, "wb") as file:
-            file.write(picture_data)
+    if file_path is None:
+        digest = hashlib.sha256(url.encode()).hexdigest()[:32]
+        file_path = IMG_DIR / f"{digest}_{dimensions}{suffix}"
+        if file_path.is_file():
+            image_cache_index.touch(file_path)
+            return str(file_path)
+
+    def _download() -> bool:
+        # A download that just finished may have written the file
+        if file_path.is_file():
+            return True
+        if not _download_file(url, file_path):
+            return False
+        image_cache_index.add(file_path)
+        return True
+
+    if in_flight_downloads.do(file_path, _download):
+        return str(file_path)
+    return None
+
+
+def get_image_url(item: Any, dimensions: int = 320) -> str | None:
+    """Get the local file path for an item's image, downloading if necessary.
+
+    Args:
+        item: A TIDAL object with image data
+        dimensions (int): The desired image dimensions (default: 320)
 
-    return str(file_path)
+    Returns:
+        str: Path to the local image file, or None if download failed
+    """
+    return _get_cached_file(item, dimensions, ".jpg", "image")
 
 
 def add_picture(
-    widget: Any, item: Any, cancellable: Gio.Cancellable = Gio.Cancellable.new()
+    widget: Any,
+    item: Any,
+    cancellable: Gio.Cancellable | None = None,
+    priority: ImagePriority | None = None,
 ) -> None:
-    """Retrieve and set an image for a widget from a TIDAL item.
+    """Request an image for a widget from a TIDAL item.
 
-    Downloads the image if necessary and sets it on the widget using set_filename().
+    The image is downloaded by the image loader if necessary and set on the
+    widget using set_filename(). Must be called from the main thread.
 
     Args:
         widget: A GTK widget that supports set_filename()
         item: A TIDAL object with image data
         cancellable: Optional GCancellable for canceling the operation
+        priority: Optional loading priority, computed from the widget if unset
     """
-
-    if cancellable is None:
-        cancellable = Gio.Cancellable.new()
-
-    def _add_picture(widget, file_path, cancellable):
-        if not cancellable.is_cancelled():
-            widget.set_filename(file_path)
-
-    GLib.idle_add(
-        _add_picture,
-        widget,
-        get_image_url(item, get_best_dimensions(widget)),
+    image_loader.request(
+        item,
+        get_best_dimensions(widget),
+        widget.set_filename,
         cancellable,
+        widget,
+        priority,
     )
 
 
 def add_image(
-    widget: Any, item: Any, cancellable: Gio.Cancellable = Gio.Cancellable.new()
+    widget: Any,
+    item: Any,
+    cancellable: Gio.Cancellable | None = None,
+    priority: ImagePriority | None = None,
 ) -> None:
-    """Retrieve and set an image for a widget from a TIDAL item.
+    """Request an image for a widget from a TIDAL item.
 
-    Downloads the image if necessary and sets it on the widget using set_from_file().
+    The image is downloaded by the image loader if necessary and set on the
+    widget using set_from_file(). Must be called from the main thread.
 
     Args:
         widget: A GTK widget that supports set_from_file()
         item: A TIDAL object with image data
         cancellable: Optional GCancellable for canceling the operation
+        priority: Optional loading priority, computed from the widget if unset
     """
-
-    def _add_image(
-        widget: Any, file_path: str | None, cancellable: Gio.Cancellable
-    ) -> None:
-        if not cancellable.is_cancelled():
-            widget.set_from_file(file_path)
-
-    GLib.idle_add(_add_image, widget, get_image_url(item), cancellable)
+    image_loader.request(
+        item, 320, widget.set_from_file, cancellable, widget, priority
+    )
 
 
 def get_video_cover_url(item: Any, dimensions: int = 320) -> str | None:
@@ -666,27 +752,7 @@ def get_video_cover_url(item: Any, dimensions: int = 320) -> str | None:
     Returns:
         str: Path to the local video file, or None if download failed
     """
-    if hasattr(item, "id"):
-        file_path = IMG_DIR / f"{item.id}_{dimensions}.mp4"
-    else:
-        file_path = IMG_DIR / f"{uuid.uuid4()}_{dimensions}.mp4"
-
-    if file_path.is_file():
-        return str(file_path)
-
-    try:
-        video_url = item.video(dimensions=dimensions)
-        response = requests.get(video_url)
-    except Exception:
-        logger.exception("Could not get video")
-        return None
-    if response.status_code == 200:
-        picture_data = response.content
-
-        with open(file_path, "wb") as file:
-            file.write(picture_data)
-
-    return str(file_path)
+    return _get_cached_file(item, dimensions, ".mp4", "video")
 
 
 def add_video_cover(
@@ -736,9 +802,11 @@ def add_video_cover(
 
 
 def add_image_to_avatar(
-    widget: Any, item: Any, cancellable: Gio.Cancellable = Gio.Cancellable.new()
+    widget: Any, item: Any, cancellable: Gio.Cancellable | None = None
 ) -> None:
-    """Retrieve and set an image for an Adwaita Avatar widget from a TIDAL item.
+    """Request an image for an Adwaita Avatar widget from a TIDAL item.
+
+    Must be called from the main thread.
 
     Args:
         widget: An Adw.Avatar widget
@@ -746,15 +814,12 @@ def add_image_to_avatar(
         cancellable: Optional GCancellable for canceling the operation
     """
 
-    def _add_image_to_avatar(
-        avatar_widget: Any, file_path: str | None, cancellable: Gio.Cancellable
-    ) -> None:
-        if not cancellable.is_cancelled():
-            file = Gio.File.new_for_path(file_path)
-            image = Gdk.Texture.new_from_file(file)
-            widget.set_custom_image(image)
+    def _add_image_to_avatar(file_path: str) -> None:
+        file = Gio.File.new_for_path(file_path)
+        image = Gdk.Texture.new_from_file(file)
+        widget.set_custom_image(image)
 
-    GLib.idle_add(_add_image_to_avatar, widget, get_image_url(item), cancellable)
+    image_loader.request(item, 320, _add_image_to_avatar, cancellable, widget)
 
 
 def replace_links(text: str) -> str:
@@ -799,9 +864,8 @@ def replace_links(text: str) -> str:
 
 def create_tidal_session():
     tidal_session = tidalapi.Session()
-    retry = Retry(connect=3, backoff_factor=0.5)
-    adapter = HTTPAdapter(max_retries=retry)
-    tidal_session.request_session.mount("https://", adapter)
+    # Share the connection pools and the retry policy of the downloads
+    http_client.mount(tidal_session.request_session)
     return tidal_session
 
 
@@ -822,19 +886,70 @@ def setup_logging():
         handlers=handlers,
     )
 
-def evict_cache(cache_dir, max_gb):
+
+def remove_stale_temp_files(
+    cache_dir: Path, max_age: float = 60 * 60, partial_max_age: float = 24 * 60 * 60
+) -> List[Path]:
+    """Delete temporary files left behind by interrupted downloads.
+
+    Also deletes the segments of partially streamed tracks that were not played
+    again for a while.
+
+    Args:
+        cache_dir (Path): The cache directory
+        max_age (float): Seconds since the last write after which a temporary
+            file is considered abandoned
+        partial_max_age (float): Seconds after which the segments of a partially
+            streamed track are deleted
+
+    Returns:
+        list: The deleted parts directories
+    """
+    removed: List[Path] = []
     if not cache_dir or not cache_dir.exists():
+        return removed
+
+    now = time.time()
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            try:
+                if entry.name.endswith(".tmp"):
+                    if now - entry.stat().st_mtime > max_age:
+                        os.unlink(entry.path)
+                        logger.info(f"Removed stale temporary file: {entry.name}")
+                elif entry.name.endswith(".parts") and entry.is_dir():
+                    if now - entry.stat().st_mtime > partial_max_age:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        removed.append(Path(entry.path))
+                        logger.info(f"Removed partial track: {entry.name}")
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def cache_maintenance(image_cache_bytes: int, music_cache_bytes: int) -> None:
+    """Clean up the image and music caches, meant to run in a thread.
+
+    Removes abandoned temporary files and evicts the least recently used files
+    of each cache above its quota. Both caches are evicted through their index,
+    which records the accesses itself and keeps pinned tracks. Partially
+    streamed tracks count towards the music quota. Does nothing if a pass is
+    already running.
+
+    Args:
+        image_cache_bytes (int): The quota of the image and video cover cache
+        music_cache_bytes (int): The quota of the music cache
+    """
+    if not _cache_maintenance_lock.acquire(blocking=False):
         return
 
-    max_bytes = max_gb * 1024 ** 3
-    files = sorted(
-        cache_dir.iterdir(),
-        key=lambda f: f.stat().st_atime
-    )
-    total = sum(f.stat().st_size for f in files)
-    for f in files:
-        if total <= max_bytes:
-            break
-        total -= f.stat().st_size
-        f.unlink()
-        logger.info(f"Evicted from cache: {f.name}")
+    try:
+        remove_stale_temp_files(IMG_DIR)
+        for parts_dir in remove_stale_temp_files(MUSIC_DIR):
+            music_cache_index.remove(parts_dir)
+        image_cache_index.evict(image_cache_bytes)
+        music_cache_index.evict(music_cache_bytes)
+    except Exception:
+        logger.exception("Error during cache maintenance")
+    finally:
+        _cache_maintenance_lock.release()
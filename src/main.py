@@ -17,6 +17,7 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import logging
 import sys
 from gettext import gettext as _
 from typing import Any, Callable, List
@@ -27,6 +28,8 @@ from .lib import utils
 from .lib.player_object import AudioSink
 from .window import HighTideWindow
 
+logger = logging.getLogger(__name__)
+
 
 class HighTideApplication(Adw.Application):
     """The main application singleton class.
@@ -85,6 +88,26 @@ class HighTideApplication(Adw.Application):
 
         self.win.present()
 
+    def do_shutdown(self) -> None:
+        """Save the play queue and the cache accesses before the application
+        exits."""
+        win: HighTideWindow | None = getattr(self, "win", None)
+        if win is not None:
+            # Shutting down must go on even if the queue can't be saved
+            try:
+                win.queue_snapshot.save()
+            except Exception:
+                logger.exception("Could not save the play queue")
+
+        # The access times are buffered, eviction needs them next session
+        try:
+            utils.image_cache_index.flush()
+            utils.music_cache_index.flush()
+        except Exception:
+            logger.exception("Could not save the cache access times")
+
+        Adw.Application.do_shutdown(self)
+
     def on_about_action(self, widget: Any, *args) -> None:
         """Display the about dialog with application information"""
         about = Adw.AboutDialog(
@@ -139,6 +162,14 @@ class HighTideApplication(Adw.Application):
                 "run-background", bg_row, "active", Gio.SettingsBindFlags.DEFAULT
             )
 
+            cache_size_row: Gtk.Widget = builder.get_object("_image_cache_size_row")
+            self.settings.bind(
+                "image-cache-size",
+                cache_size_row,
+                "value",
+                Gio.SettingsBindFlags.DEFAULT,
+            )
+
             builder.get_object("_normalize_row").set_active(
                 self.settings.get_boolean("normalize")
             )
@@ -146,6 +177,14 @@ class HighTideApplication(Adw.Application):
                 "notify::active", self.on_normalize_changed
             )
 
+            self.bit_perfect_row = builder.get_object("_bit_perfect_row")
+            self.bit_perfect_row.set_active(self.settings.get_boolean("bit-perfect"))
+            self.bit_perfect_row.connect("notify::active", self.on_bit_perfect_changed)
+
+            self.crossfade_row = builder.get_object("_crossfade_row")
+            self.crossfade_row.set_value(self.settings.get_int("crossfade-duration"))
+            self.crossfade_row.connect("notify::value", self.on_crossfade_changed)
+
             builder.get_object("_quadratic_volume_row").set_active(
                 self.settings.get_boolean("quadratic-volume")
             )
@@ -207,8 +246,10 @@ class HighTideApplication(Adw.Application):
 
             alsa_used = AudioSink.ALSA == self.settings.get_int("preferred-sink")
             self.alsa_row.set_sensitive(alsa_used)
+            self.bit_perfect_row.set_sensitive(alsa_used)
             if not alsa_used:
                 self.alsa_row.set_selected(0)
+            self.update_crossfade_row()
 
             builder.get_object("_sink_row").connect(
                 "notify::selected-item", self.deactive_alsa_device_row
@@ -223,15 +264,29 @@ class HighTideApplication(Adw.Application):
 
     def on_sink_changed(self, widget: Any, *args) -> None:
         self.win.change_audio_sink(widget.get_selected())
+        self.update_crossfade_row()
 
     def on_alsa_device_changed(self, widget: Any, *args) -> None:
         index = widget.get_selected()
         device_string = self.alsa_devices[index]["hw_device"]
         self.win.change_alsa_device(device_string)
+        self.update_crossfade_row()
 
     def on_normalize_changed(self, widget: Any, *args) -> None:
         self.win.change_normalization(widget.get_active())
 
+    def on_bit_perfect_changed(self, widget: Any, *args) -> None:
+        self.win.change_bit_perfect(widget.get_active())
+        self.update_crossfade_row()
+
+    def on_crossfade_changed(self, widget: Any, *args) -> None:
+        self.win.change_crossfade(int(widget.get_value()))
+
+    def update_crossfade_row(self) -> None:
+        """Make the crossfade row insensitive when the audio output can't
+        crossfade, like in bit-perfect mode or on an ALSA hardware device."""
+        self.crossfade_row.set_sensitive(self.win.player_object.can_crossfade())
+
     def on_quadratic_volume_changed(self, widget: Any, *args) -> None:
         self.win.change_quadratic_volume(widget.get_active())
 
@@ -244,6 +299,7 @@ class HighTideApplication(Adw.Application):
     def deactive_alsa_device_row(self, widget: Any, *args) -> None:
         alsa_used = widget.get_selected() == AudioSink.ALSA
         self.alsa_row.set_sensitive(alsa_used)
+        self.bit_perfect_row.set_sensitive(alsa_used)
         if not alsa_used:
             self.alsa_row.set_selected(0)
 
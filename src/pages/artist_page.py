@@ -18,7 +18,6 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import logging
-import threading
 from gettext import gettext as _
 from typing import List
 
@@ -142,9 +141,7 @@ class HTArtistPage(Page):
 
         artist_picture = builder.get_object("_avatar")
 
-        threading.Thread(
-            target=utils.add_image_to_avatar, args=(artist_picture, self.artist)
-        ).start()
+        utils.add_image_to_avatar(artist_picture, self.artist, self.cancellable)
 
         builder.get_object("_first_subtitle_label").set_label(_("Artist"))
 
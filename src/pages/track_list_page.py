@@ -17,7 +17,6 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import threading
 from gettext import gettext as _
 from ..lib import utils
 from .page import Page
@@ -41,7 +40,9 @@ class TrackListPage(Page):
         self.auto_load.set_scrolled_window(self.scrolled_window)
         self.auto_load.set_items(tracks)
         if reload_function:
-            self.auto_load.set_function(reload_function)
+            self.auto_load.set_function(
+                reload_function, source=getattr(self, "item", None)
+            )
 
         self.set_title(title)
         builder.get_object("_title_label").set_label(title)
@@ -99,7 +100,7 @@ class TrackListPage(Page):
 
         image = builder.get_object("_image")
         if getattr(self, "item", None):
-            threading.Thread(target=utils.add_image, args=(image, self.item)).start()
+            utils.add_image(image, self.item, self.cancellable)
 
         sort_dropdown = builder.get_object("_sort_by_dropdown")
         sort_dropdown.connect("notify::selected", self.on_sort_changed)
@@ -133,7 +134,9 @@ class TrackListPage(Page):
         sorted_tracks = sort_map.get(selected, lambda t: t.copy())(valid_tracks)
 
         if selected == 0 and hasattr(self.item, "tracks"):
-            self.auto_load.set_function(getattr(self.item, "tracks", None))
+            self.auto_load.set_function(
+                getattr(self.item, "tracks", None), source=self.item
+            )
         else:
             self.auto_load.set_function(None)
 
@@ -45,6 +45,7 @@ class HTAutoLoadWidget(Gtk.Box, IDisconnectable):
         IDisconnectable.__init__(self)
 
         self.function = None
+        self.source = None
         self.type = None
 
         self.parent = None
@@ -72,15 +73,18 @@ class HTAutoLoadWidget(Gtk.Box, IDisconnectable):
                 self.parent.remove(child)
                 child = self.parent.get_first_child()
 
-    def set_function(self, function: callable) -> None:
+    def set_function(self, function: callable, source=None) -> None:
         """
         Set the function to use to fetch new items, it needs to support limit and
             offset arguments
 
         Args:
             function (callable): the function to call
+            source: the album, playlist or mix the items are from, played
+                instead of the loaded items when a track is selected
         """
         self.function = function
+        self.source = source
 
     def set_items(self, items: list) -> None:
         """
@@ -186,4 +190,18 @@ class HTAutoLoadWidget(Gtk.Box, IDisconnectable):
             self.parent.append(card)
 
     def _on_tracks_row_selected(self, list_box, row):
-        utils.player_object.play_this(self.items, row.index)
+        if self.source is None:
+            utils.player_object.play_this(self.items, row.index)
+            return
+
+        threading.Thread(
+            target=self.th_play_source, args=(self.source, row.index)
+        ).start()
+
+    def th_play_source(self, source, index):
+        try:
+            utils.player_object.load_track_list(source, index)
+        except Exception:
+            logger.exception("Could not get the tracks to play")
+            return
+        GLib.idle_add(utils.player_object.play_this, source, index)
@@ -110,9 +110,7 @@ class HTCardWidget(Adw.BreakpointBin, IDisconnectable):
         )
         self.detail_label.set_visible(False)
 
-        threading.Thread(
-            target=utils.add_image, args=(self.image, self.item.album)
-        ).start()
+        utils.add_image(self.image, self.item.album, self.cancellable)
 
     def _make_mix_card(self) -> None:
         """Configure the card to display a Mix item"""
@@ -121,7 +119,7 @@ class HTCardWidget(Adw.BreakpointBin, IDisconnectable):
         self.detail_label.set_label(self.item.sub_title)
         self.track_artist_label.set_visible(False)
 
-        threading.Thread(target=utils.add_image, args=(self.image, self.item)).start()
+        utils.add_image(self.image, self.item, self.cancellable)
 
     def _make_album_card(self) -> None:
         """Configure the card to display an Album item"""
@@ -130,7 +128,7 @@ class HTCardWidget(Adw.BreakpointBin, IDisconnectable):
         self.track_artist_label.set_artists(self.item.artists)
         self.detail_label.set_visible(False)
 
-        threading.Thread(target=utils.add_image, args=(self.image, self.item)).start()
+        utils.add_image(self.image, self.item, self.cancellable)
 
     def _make_playlist_card(self) -> None:
         """Configure the card to display a Playlist item"""
@@ -143,7 +141,7 @@ class HTCardWidget(Adw.BreakpointBin, IDisconnectable):
             creator_name = self.item.creator.name
         self.detail_label.set_label(_("By {}").format(creator_name))
 
-        threading.Thread(target=utils.add_image, args=(self.image, self.item)).start()
+        utils.add_image(self.image, self.item, self.cancellable)
 
     def _make_artist_card(self) -> None:
         """Configure the card to display an Artist item"""
@@ -152,7 +150,7 @@ class HTCardWidget(Adw.BreakpointBin, IDisconnectable):
         self.detail_label.set_label(_("Artist"))
         self.track_artist_label.set_visible(False)
 
-        threading.Thread(target=utils.add_image, args=(self.image, self.item)).start()
+        utils.add_image(self.image, self.item, self.cancellable)
 
     def _make_page_item_card(self) -> None:
         """Configure the card to display a PageItem"""
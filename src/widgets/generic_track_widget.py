@@ -124,9 +124,7 @@ class HTGenericTrackWidget(Gtk.ListBoxRow, IDisconnectable):
             ),
         ))
 
-        threading.Thread(
-            target=utils.add_image, args=(self.image, self.track.album)
-        ).start()
+        utils.add_image(self.image, self.track.album, self.cancellable)
 
         self.action_group = Gio.SimpleActionGroup()
         self.insert_action_group("trackwidget", self.action_group)
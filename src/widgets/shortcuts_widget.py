@@ -17,7 +17,6 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import threading
 from gettext import gettext as _
 from typing import List, Union
 
@@ -79,7 +78,7 @@ class HTShorcutWidget(Gtk.FlowBoxChild, IDisconnectable):
             self.subtitle_label.set_label(_("By {}").format(creator_name))
             self.action = "win.push-playlist-page"
 
-        threading.Thread(target=utils.add_image, args=(self.image, self.item)).start()
+        utils.add_image(self.image, self.item, self.cancellable)
 
     def _on_click(self, *args) -> None:
         if self.action is None:
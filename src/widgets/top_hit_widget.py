@@ -17,7 +17,6 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import threading
 from gettext import gettext as _
 
 from gi.repository import GLib, Gtk
@@ -105,9 +104,7 @@ class HTTopHitWidget(Gtk.Box, IDisconnectable):
             )
         )
 
-        threading.Thread(
-            target=utils.add_image, args=(self.image, self.item.album)
-        ).start()
+        utils.add_image(self.image, self.item.album, self.cancellable)
 
     def _make_mix(self) -> None:
         self.primary_label.set_label(self.item.title)
@@ -134,7 +131,7 @@ class HTTopHitWidget(Gtk.Box, IDisconnectable):
             )
         )
 
-        threading.Thread(target=utils.add_image, args=(self.image, self.item)).start()
+        utils.add_image(self.image, self.item, self.cancellable)
 
     def _make_album(self) -> None:
         self.primary_label.set_label(self.item.name)
@@ -161,7 +158,7 @@ class HTTopHitWidget(Gtk.Box, IDisconnectable):
             )
         )
 
-        threading.Thread(target=utils.add_image, args=(self.image, self.item)).start()
+        utils.add_image(self.image, self.item, self.cancellable)
 
     def _make_playlist(self) -> None:
         self.primary_label.set_label(self.item.name)
@@ -189,7 +186,7 @@ class HTTopHitWidget(Gtk.Box, IDisconnectable):
             )
         )
 
-        threading.Thread(target=utils.add_image, args=(self.image, self.item)).start()
+        utils.add_image(self.image, self.item, self.cancellable)
 
     def _make_artist(self) -> None:
         self.primary_label.set_label(self.item.name)
@@ -198,4 +195,4 @@ class HTTopHitWidget(Gtk.Box, IDisconnectable):
         self.play_button.set_visible(False)
         self.shuffle_button.set_visible(False)
 
-        threading.Thread(target=utils.add_image, args=(self.image, self.item)).start()
+        utils.add_image(self.image, self.item, self.cancellable)
@@ -19,13 +19,15 @@
 
 import threading
 from gettext import gettext as _
+from pathlib import Path
 from typing import Callable
 
 import tidalapi
 from gi.repository import Adw, Gio, GLib, GObject, Gst, Gtk, Xdp
 from tidalapi.media import Quality
 
-from .lib import HTCache, PlayerObject, RepeatType, SecretStore, utils
+from .lib import (HTCache, HTQueueSnapshot, PlayerObject, RepeatType, SecretStore,
+                  utils)
 from .login import LoginDialog
 from .mpris import MPRIS
 from .pages import (HTAlbumPage, HTArtistPage, HTCollectionPage, HTExplorePage,
@@ -138,9 +140,24 @@ class HighTideWindow(Adw.ApplicationWindow):
             self.settings.get_string("alsa-device"),
             self.settings.get_boolean("normalize"),
             self.settings.get_boolean("quadratic-volume"),
+            self.settings.get_boolean("bit-perfect"),
         )
         utils.player_object = self.player_object
         self.player_object.set_discord_rpc(self.settings.get_boolean("discord-rpc"))
+        self.player_object.set_prefetch(
+            self.settings.get_int("prefetch-count"),
+            self.settings.get_boolean("prefetch-music-cache"),
+        )
+        self.player_object.set_preroll(
+            self.settings.get_int("preroll-buffer-size") * 1024
+        )
+        self.player_object.set_crossfade(self.settings.get_int("crossfade-duration"))
+
+        self.queue_snapshot = HTQueueSnapshot(
+            Path(utils.CACHE_DIR, "queue.json.gz"), self.player_object
+        )
+        self.player_object.play_queue.connect("changed", self.queue_snapshot.schedule)
+        self.player_object.connect("notify::playing", self.queue_snapshot.schedule)
 
         self.volume_button.get_adjustment().set_value(
             self.settings.get_int("last-volume") / 10
@@ -152,6 +169,7 @@ class HighTideWindow(Adw.ApplicationWindow):
         self.player_object.connect("song-added-to-queue", self.on_song_added_to_queue)
         self.player_object.connect("notify::playing", self.update_controls)
         self.player_object.connect("buffering", self.on_song_buffering)
+        self.player_object.connect("output-changed", self.set_quality_label)
         self.player_object.connect("notify::repeat-type", self.update_repeat_button)
         self.player_object.connect(
             "notify::can-go-next",
@@ -182,7 +200,7 @@ class HighTideWindow(Adw.ApplicationWindow):
         utils.session = self.session
         utils.navigation_view = self.navigation_view
         utils.toast_overlay = self.toast_overlay
-        utils.cache = HTCache(self.session)
+        utils.cache = HTCache(self.session, utils.metadata_store)
 
         self.user = self.session.user
 
@@ -221,7 +239,18 @@ class HighTideWindow(Adw.ApplicationWindow):
         if not self.settings.get_boolean("app-id-change-understood"):
             self.app_id_dialog.present(self)
 
-        threading.Thread(target=utils.evict_cache, args=(utils.MUSIC_DIR, 5)).start()
+        self.start_cache_maintenance()
+        GLib.timeout_add_seconds(
+            utils.CACHE_MAINTENANCE_INTERVAL, self.start_cache_maintenance
+        )
+
+    def start_cache_maintenance(self):
+        """Start a cache maintenance pass in background, also used as timeout"""
+        threading.Thread(
+            target=utils.cache_maintenance,
+            args=(self.settings.get_int("image-cache-size") * 1024**2, 5 * 1024**3),
+        ).start()
+        return True
 
     @Gtk.Template.Callback("on_app_id_response_cb")
     def on_app_id_response_cb(self, dialog, response):
@@ -265,8 +294,10 @@ class HighTideWindow(Adw.ApplicationWindow):
             logger.exception("Error while logging in!")
             GLib.idle_add(self.on_login_failed)
         else:
-            utils.get_favourites()
+            # Show the saved favourites right away and refresh them afterwards
+            utils.load_cached_favourites()
             GLib.idle_add(self.on_logged_in)
+            utils.get_favourites()
 
     def logout(self):
         """Log out the current user and return to login screen.
@@ -275,6 +306,7 @@ class HighTideWindow(Adw.ApplicationWindow):
         not logged in page.
         """
         self.secret_store.clear()
+        utils.metadata_store.clear("favourites")
 
         page = HTNotLoggedInPage().load()
         self.navigation_view.replace([page])
@@ -305,9 +337,14 @@ class HighTideWindow(Adw.ApplicationWindow):
         self.navigation_view.replace([page])
 
     def th_set_last_playing_song(self):
+        if self.queue_snapshot.restore():
+            return
+
         index = self.settings.get_int("last-playing-index")
         thing_id = self.settings.get_string("last-playing-thing-id")
         thing_type = self.settings.get_string("last-playing-thing-type")
+        seed = self.settings.get_int("last-shuffle-seed")
+        anchor = self.settings.get_int("last-shuffle-anchor")
 
         logger.info(f"Last playing: {thing_id} of type {thing_type} index: {index}")
 
@@ -322,11 +359,18 @@ class HighTideWindow(Adw.ApplicationWindow):
                 thing = self.session.playlist(thing_id)
             elif thing_type == "track":
                 thing = self.session.track(thing_id)
+            self.player_object.load_track_list(thing, index)
         except Exception:
             logger.exception("Error while setting last played song")
 
+        GLib.idle_add(self.play_last_playing_song, thing, index, seed, anchor)
+
+    def play_last_playing_song(self, thing, index, seed, anchor):
         self.player_object.play_this(thing, index)
 
+        if seed >= 0:
+            self.player_object.restore_shuffle(seed, anchor)
+
         self.player_object.pause()
 
     #
@@ -387,14 +431,16 @@ class HighTideWindow(Adw.ApplicationWindow):
                 ),
             ).start()
         else:
-            threading.Thread(
-                target=utils.add_picture,
-                args=(self.playing_track_picture, album, self.image_canc),
-            ).start()
+            utils.add_picture(
+                self.playing_track_picture,
+                album,
+                self.image_canc,
+                utils.ImagePriority.PLAYER,
+            )
 
-        threading.Thread(
-            target=utils.add_image, args=(self.playing_track_image, album)
-        ).start()
+        utils.add_image(
+            self.playing_track_image, album, priority=utils.ImagePriority.PLAYER
+        )
 
         threading.Thread(target=self.th_add_lyrics_to_page, args=()).start()
 
@@ -426,6 +472,11 @@ class HighTideWindow(Adw.ApplicationWindow):
         if track is not None:
             self.settings.set_int("last-playing-index", self.player_object.get_index())
 
+        shuffle_state = self.player_object.play_queue.shuffle_state()
+        seed, anchor = shuffle_state if shuffle_state is not None else (-1, 0)
+        self.settings.set_int("last-shuffle-seed", seed)
+        self.settings.set_int("last-shuffle-anchor", anchor)
+
     def stop_video_in_background(self, window, param):
         self.in_background = not self.is_active()
         album = self.player_object.song_album
@@ -437,11 +488,12 @@ class HighTideWindow(Adw.ApplicationWindow):
         else:
             self.videoplayer.pause()
 
-    def set_quality_label(self):
+    def set_quality_label(self, *args):
         """Update the quality label with current track's audio information.
 
         Displays information about the current track's codec, bit depth,
-        sample rate, and audio quality in the UI.
+        sample rate, and audio quality in the UI, and the format negotiated
+        with the audio output.
         """
         codec = None
         bit_depth = None
@@ -484,6 +536,11 @@ class HighTideWindow(Adw.ApplicationWindow):
             if quality_details:
                 quality_text += f" ({' / '.join(quality_details)})"
 
+        if self.player_object.output_unconverted:
+            quality_text += f" · {_('Bit-perfect')}"
+        elif self.player_object.output_format:
+            quality_text += f" → {self.player_object.output_format}"
+
         self.quality_label.set_label(quality_text)
         self.quality_label.set_visible(True)
 
@@ -644,6 +701,7 @@ class HighTideWindow(Adw.ApplicationWindow):
 
     def on_shuffle_changed(self, *args):
         self.shuffle_button.set_active(self.player_object.shuffle)
+        self.save_last_playing_thing()
 
     def update_slider(self, *args):
         """Update the progress bar and playback information.
@@ -720,6 +778,19 @@ class HighTideWindow(Adw.ApplicationWindow):
                 self.settings.get_int("preferred-sink")
             )
 
+    def change_bit_perfect(self, state):
+        if self.player_object.bit_perfect != state:
+            self.player_object.bit_perfect = state
+            self.settings.set_boolean("bit-perfect", state)
+            self.player_object.change_audio_sink(
+                self.settings.get_int("preferred-sink")
+            )
+
+    def change_crossfade(self, duration: int):
+        if self.settings.get_int("crossfade-duration") != duration:
+            self.settings.set_int("crossfade-duration", duration)
+            self.player_object.set_crossfade(duration)
+
     def change_quadratic_volume(self, state):
         if self.settings.get_boolean("quadratic-volume") != state:
             self.player_object.quadratic_volume = state
@@ -748,10 +819,12 @@ class HighTideWindow(Adw.ApplicationWindow):
                     ),
                 ).start()
             else:
-                threading.Thread(
-                    target=utils.add_picture,
-                    args=(self.playing_track_picture, album, self.image_canc),
-                ).start()
+                utils.add_picture(
+                    self.playing_track_picture,
+                    album,
+                    self.image_canc,
+                    utils.ImagePriority.PLAYER,
+                )
 
     def change_discord_rpc_enabled(self, state):
         if self.settings.get_boolean("discord-rpc") != state:
@@ -0,0 +1,142 @@
+# benchmark_play_queue.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+"""Micro-benchmarks of the play queue at 100k entries.
+
+Run with: python tests/benchmark_play_queue.py [entries]
+
+The HTPlayQueue benchmarks need PyGObject, the HTBlockedList ones always run.
+"""
+
+import random
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict
+
+sys.path.insert(0, str(Path(__file__).parent))
+import conftest  # noqa: F401  registers the lib package
+
+from lib.blocked_list import HTBlockedList
+
+ENTRIES = 100_000
+
+
+def _time(function: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def bench_blocked_list(entries: int) -> Dict[str, float]:
+    rng = random.Random(0)
+    positions = [rng.randrange(entries) for _ in range(entries)]
+    results = {}
+
+    def insert_random(sequence):
+        for i, position in enumerate(positions):
+            sequence.insert(position % (i + 1), i)
+
+    def remove_random(sequence):
+        for position in positions:
+            del sequence[position % len(sequence)]
+
+    def bench_sequence(name, sequence):
+        results[f"{name} insert random"] = _time(lambda: insert_random(sequence))
+        results[f"{name} get random"] = _time(
+            lambda: [sequence[position] for position in positions]
+        )
+        results[f"{name} remove random"] = _time(lambda: remove_random(sequence))
+
+    for name, factory in (
+        ("HTBlockedList", HTBlockedList),
+        ("list", list),
+        ("deque", deque),
+    ):
+        bench_sequence(name, factory())
+
+    blocked = HTBlockedList()
+    results["HTBlockedList append"] = _time(
+        lambda: [blocked.append(i) for i in range(entries)]
+    )
+    results["HTBlockedList popleft"] = _time(
+        lambda: [blocked.popleft() for _ in range(entries)]
+    )
+    return results
+
+
+def bench_play_queue(entries: int) -> Dict[str, float]:
+    from lib.play_queue import HTPlayQueue
+
+    tracks = [SimpleNamespace(id=i, available=True) for i in range(entries)]
+    play_queue = HTPlayQueue()
+    results = {}
+
+    results["set_source"] = _time(lambda: play_queue.set_source(tracks))
+
+    def next_all():
+        for _ in range(entries):
+            play_queue.add_played(play_queue.pop_next())
+
+    def previous_all():
+        for _ in range(entries):
+            play_queue.push_front(play_queue.pop_played())
+
+    results["next"] = _time(next_all)
+    results["previous"] = _time(previous_all)
+    results["index_of"] = _time(
+        lambda: [play_queue.index_of(track.id) for track in tracks]
+    )
+
+    rng = random.Random(0)
+
+    def queue_insert():
+        for i, track in enumerate(tracks):
+            play_queue.insert(rng.randrange(i + 1), track)
+
+    def queue_remove():
+        for i in range(entries, 0, -1):
+            play_queue.remove(rng.randrange(i))
+
+    results["queue insert random"] = _time(queue_insert)
+    results["queue remove random"] = _time(queue_remove)
+
+    play_queue.set_source(tracks)
+    results["shuffle"] = _time(lambda: play_queue.set_shuffle(True))
+    results["next shuffled"] = _time(next_all)
+    return results
+
+
+def main(entries: int = ENTRIES) -> None:
+    results = bench_blocked_list(entries)
+    try:
+        results.update(bench_play_queue(entries))
+    except ImportError as e:
+        print(f"Skipping the HTPlayQueue benchmarks: {e}")
+
+    print(f"{entries} entries")
+    for name, seconds in results.items():
+        print(f"{name:32} {seconds * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ENTRIES)
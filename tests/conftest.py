@@ -0,0 +1,31 @@
+# conftest.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import sys
+import types
+from pathlib import Path
+
+# Import the modules of src/lib as the "lib" package, without running the
+# __init__ of the application packages, which load GTK and the player
+LIB_DIR = Path(__file__).resolve().parent.parent / "src" / "lib"
+
+if "lib" not in sys.modules:
+    lib = types.ModuleType("lib")
+    lib.__path__ = [str(LIB_DIR)]
+    sys.modules["lib"] = lib
@@ -0,0 +1,80 @@
+# test_blocked_list.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+import random
+
+import pytest
+
+from lib.blocked_list import HTBlockedList
+
+
+class SmallBlocks(HTBlockedList):
+    # Splits and drops blocks often
+    LOAD = 2
+
+
+@pytest.mark.parametrize("cls", [HTBlockedList, SmallBlocks])
+def test_matches_a_list(cls):
+    rng = random.Random(0)
+    expected = list(range(50))
+    blocked = cls(expected)
+
+    for value in range(1000):
+        operation = rng.randrange(4)
+        if operation == 0 or not expected:
+            index = rng.randint(-len(expected) - 2, len(expected) + 2)
+            expected.insert(index, value)
+            blocked.insert(index, value)
+        elif operation == 1:
+            index = rng.randrange(-len(expected), len(expected))
+            assert blocked.pop(index) == expected.pop(index)
+        elif operation == 2:
+            expected.insert(0, value)
+            blocked.appendleft(value)
+        else:
+            assert blocked.popleft() == expected.pop(0)
+
+        assert len(blocked) == len(expected)
+        index = rng.randrange(len(expected)) if expected else None
+        if index is not None:
+            assert blocked[index] == expected[index]
+
+    assert list(blocked) == expected
+    assert list(reversed(blocked)) == expected[::-1]
+
+
+def test_index_errors():
+    blocked = HTBlockedList([1, 2, 3])
+
+    assert blocked[-1] == 3
+    with pytest.raises(IndexError):
+        blocked[3]
+    with pytest.raises(IndexError):
+        del blocked[-4]
+    blocked.clear()
+    with pytest.raises(IndexError):
+        blocked.popleft()
+    assert not blocked
+
+
+def test_benchmark_runs():
+    from benchmark_play_queue import bench_blocked_list
+
+    assert bench_blocked_list(1000)
@@ -0,0 +1,181 @@
+# test_cache.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("tidalapi")
+
+from tidalapi.request import Requests
+
+from lib.cache import HTCache
+from lib.metadata_store import HTMetadataStore
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+        self.headers = {"etag": f"etag-{payload.get('title')}"}
+
+    def json(self):
+        return self.payload
+
+
+class FakeRequest(Requests):
+    """Answers the requests of HTCache from a dict of JSON by path, mapped
+    like tidalapi does."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.paths = []
+
+    def request(self, method, path, params=None):
+        self.paths.append(path)
+        return FakeResponse(self.responses[path])
+
+
+def _parse(kind):
+    return lambda payload: SimpleNamespace(kind=kind, **payload)
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.request = FakeRequest(responses)
+        self.config = SimpleNamespace(api_v2_location="https://v2/")
+        self.parse_artist = _parse("artist")
+        self.parse_album = _parse("album")
+        self.parse_track = _parse("track")
+        self.parse_playlist = _parse("playlist")
+        self.parse_v2_mix = _parse("mix")
+
+    def playlist(self):
+        return SimpleNamespace(parse_factory=_parse("playlist"))
+
+    def folder(self):
+        return SimpleNamespace()
+
+
+class OfflineSession(FakeSession):
+    """A session failing on any request."""
+
+    def __init__(self):
+        super().__init__({})
+        self.request = SimpleNamespace(
+            request=self._offline, map_request=self._offline
+        )
+
+    def _offline(self, *args, **kwargs):
+        raise AssertionError("No request expected")
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        time.sleep(0.01)
+
+
+def test_stale_payload_is_served_and_refreshed():
+    store = HTMetadataStore(":memory:", ttls={"album": 0})
+    store.put("album", "1", {"id": 1, "title": "old"})
+
+    session = FakeSession({"albums/1": {"id": 1, "title": "new"}})
+    cache = HTCache(session, store)
+
+    assert cache.get_album("1").title == "old"
+
+    _wait_for(lambda: cache.albums.get("1").title == "new")
+    assert session.request.paths == ["albums/1"]
+    assert store.get("album", "1")[0]["title"] == "new"
+
+
+def test_refresh_finishing_first_is_kept():
+    store = HTMetadataStore(":memory:", ttls={"album": 0})
+    store.put("album", "1", {"id": 1, "title": "old"})
+
+    session = FakeSession({"albums/1": {"id": 1, "title": "new"}})
+    cache = HTCache(session, store)
+    load = cache._load
+
+    def slow_load(kind, item_id):
+        item = load(kind, item_id)
+        # The background refresh stores its result before the caller
+        _wait_for(lambda: cache.albums.get(item_id) is not None)
+        return item
+
+    cache._load = slow_load
+
+    cache.get_album("1")
+    assert cache.albums.get("1").title == "new"
+
+
+def test_fresh_payload_is_not_refreshed():
+    store = HTMetadataStore(":memory:")
+    store.put("album", "1", {"id": 1, "title": "stored"})
+
+    session = FakeSession({})
+    cache = HTCache(session, store)
+
+    assert cache.get_album("1").title == "stored"
+    time.sleep(0.05)
+    assert session.request.paths == []
+
+
+def _favourites_responses(user_id):
+    return {
+        f"users/{user_id}/favorites/artists": {"items": [{"id": 1, "title": "a"}]},
+        f"users/{user_id}/favorites/tracks": {
+            "items": [{"created": "2025", "item": {"id": 2, "title": "t"}}]
+        },
+        f"users/{user_id}/favorites/albums": {"items": [{"id": 3, "title": "al"}]},
+        "https://v2/my-collection/playlists/folders": {
+            "items": [{"id": "p", "title": "p"}],
+            "totalNumberOfItems": 1,
+        },
+        "https://v2/favorites/mixes": {"items": [{"id": "m", "title": "m"}]},
+        f"users/{user_id}/playlists": {"items": [{"id": "u", "title": "u"}]},
+        f"users/{user_id}/playlistsAndFavoritePlaylists": {
+            "items": [{"created": "2025", "playlist": {"id": "p", "title": "p"}}]
+        },
+    }
+
+
+def test_favourites_are_restored_offline():
+    store = HTMetadataStore(":memory:")
+    user = SimpleNamespace(id=42)
+
+    fetched = HTCache(FakeSession(_favourites_responses(42)), store)
+    favourites = fetched.fetch_favourites(user)
+
+    restored = HTCache(OfflineSession(), store).get_cached_favourites("42")
+
+    assert restored is not None
+    assert HTCache.favourite_ids(restored) == HTCache.favourite_ids(favourites)
+    assert [mix.id for mix in restored["mixes"]] == ["m"]
+    assert restored["tracks"][0].dateAdded == "2025"
+    assert [p.id for p in restored["playlist_and_favorite_playlists"]] == ["p"]
+    assert [p.id for p in restored["user_playlists"]] == ["u"]
+
+
+def test_no_saved_favourites():
+    cache = HTCache(OfflineSession(), HTMetadataStore(":memory:"))
+    assert cache.get_cached_favourites("42") is None
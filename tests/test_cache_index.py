@@ -0,0 +1,100 @@
+# test_cache_index.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+import os
+
+from lib.cache_index import HTCacheIndex
+
+
+def _write(cache_dir, name, size):
+    path = cache_dir / name
+    path.write_bytes(b"x" * size)
+    return path
+
+
+def test_evicts_least_recently_touched(tmp_path):
+    index = HTCacheIndex(":memory:", tmp_path)
+    old = _write(tmp_path, "old.jpg", 10)
+    index.add(old)
+    new = _write(tmp_path, "new.jpg", 10)
+    index.add(new)
+
+    # The filesystem atime is ignored, only the recorded accesses count
+    os.utime(new, (0, 0))
+    index.touch(old)
+
+    assert index.evict(10) == ["new.jpg"]
+    assert old.exists() and not new.exists()
+    assert index.total_size() == 10
+
+
+def test_existing_files_are_indexed(tmp_path):
+    cache_dir = tmp_path / "images"
+    cache_dir.mkdir()
+    _write(cache_dir, "a.jpg", 10)
+    _write(cache_dir, ".a.jpg.tmp", 10)
+
+    index = HTCacheIndex(tmp_path / "index.sqlite", cache_dir)
+
+    assert index.total_size() == 10
+    assert index.evict(0) == ["a.jpg"]
+
+
+def test_parts_directories_are_evicted_whole(tmp_path):
+    cache_dir = tmp_path / "music"
+    parts_dir = cache_dir / "1_LOSSLESS.m4a.parts"
+    parts_dir.mkdir(parents=True)
+    _write(parts_dir, "0", 10)
+    _write(parts_dir, "1", 10)
+
+    index = HTCacheIndex(tmp_path / "index.sqlite", cache_dir)
+    assert index.total_size() == 20
+
+    _write(parts_dir, "2", 10)
+    index.add(parts_dir)
+    assert index.total_size() == 30
+
+    assert index.evict(0) == [parts_dir.name]
+    assert not parts_dir.exists()
+
+
+def test_remove_forgets_a_file(tmp_path):
+    index = HTCacheIndex(":memory:", tmp_path)
+    path = _write(tmp_path, "a.m4a", 10)
+    index.add(path)
+
+    index.remove(path)
+
+    assert index.total_size() == 0
+    assert index.evict(0) == []
+
+
+def test_pinned_before_being_added(tmp_path):
+    index = HTCacheIndex(":memory:", tmp_path)
+    parts_dir = tmp_path / "1_LOSSLESS.m4a.parts"
+    # The parts directory of the playing track is created after the pins
+    index.set_pinned([parts_dir])
+
+    parts_dir.mkdir()
+    _write(parts_dir, "0", 10)
+    index.add(parts_dir)
+
+    assert index.evict(0) == []
+    assert parts_dir.exists()
@@ -0,0 +1,178 @@
+# test_dash.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from lib.dash import HTDashFetcher, parse_mpd, rewrite_mpd
+from lib.http_client import HTHttpClient
+
+MPD = """<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" mediaPresentationDuration="PT10S">
+  <Period>
+    <AdaptationSet contentType="audio">
+      <Representation id="low" bandwidth="96000" codecs="mp4a.40.2">
+        <SegmentTemplate timescale="1000" initialization="low/init.mp4"
+            media="low/$Number$.m4s" startNumber="1">
+          <SegmentTimeline><S d="2000" r="-1"/></SegmentTimeline>
+        </SegmentTemplate>
+      </Representation>
+      <Representation id="flac" bandwidth="1000000" codecs="flac">
+        <SegmentTemplate timescale="1000" initialization="flac/init.mp4"
+            media="flac/$Number$.m4s" startNumber="1">
+          <SegmentTimeline><S d="2000" r="-1"/></SegmentTimeline>
+        </SegmentTemplate>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+SINGLE_TEMPLATE_MPD = """<MPD mediaPresentationDuration="PT6S">
+  <Period>
+    <AdaptationSet>
+      <Representation id="flac" bandwidth="1000000">
+        <SegmentTemplate timescale="1000" initialization="init.mp4"
+            media="$Number$.m4s" startNumber="1">
+          <SegmentTimeline><S d="2000" r="2"/></SegmentTimeline>
+        </SegmentTemplate>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves the MPD and its segments, a segment body is its path."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requested.append(self.path)
+        if self.path == "/manifest.mpd":
+            body = server.manifest.encode()
+        else:
+            gate = server.gates.get(self.path)
+            if gate is not None:
+                gate.wait(5)
+            body = self.path.encode()
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requested = []
+    server.gates = {}
+    server.manifest = MPD
+    server.url = f"http://127.0.0.1:{server.server_port}/"
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_mpd_picks_best_representation(server):
+    manifest = HTHttpClient().get(server.url + "manifest.mpd").text
+
+    urls = parse_mpd(manifest, server.url + "manifest.mpd")
+
+    assert urls == [server.url + "flac/init.mp4"] + [
+        f"{server.url}flac/{number}.m4s" for number in range(1, 6)
+    ]
+
+
+def test_rewrite_mpd_points_to_new_urls(server):
+    manifest, start = rewrite_mpd(
+        SINGLE_TEMPLATE_MPD, server.url + "init", server.url + "seg/$Number$"
+    )
+
+    assert start == 1
+    assert parse_mpd(manifest) == [server.url + "init"] + [
+        f"{server.url}seg/{number}" for number in range(1, 4)
+    ]
+
+
+def test_rewrite_mpd_needs_a_single_template():
+    assert rewrite_mpd(MPD, "init", "$Number$") is None
+
+
+def test_fetcher_writes_segments_in_order(server, tmp_path):
+    urls = parse_mpd(MPD, server.url)
+    path = tmp_path / "track.mp4"
+    progress = []
+
+    fetcher = HTDashFetcher(HTHttpClient(), workers=4)
+    assert fetcher.fetch(urls, path, progress.append)
+
+    expected = b"".join(re.sub(r"^http://[^/]+", "", url).encode() for url in urls)
+    assert path.read_bytes() == expected
+    assert progress[-1] == 1.0
+    assert fetcher.stats()["segments"] == len(urls)
+
+
+def test_fetcher_bounds_segments_in_flight(server, tmp_path):
+    urls = parse_mpd(MPD, server.url)
+    workers = 2
+    window = workers * 2
+    gate = threading.Event()
+    server.gates["/flac/1.m4s"] = gate
+
+    fetcher = HTDashFetcher(HTHttpClient(), workers=workers)
+    thread = threading.Thread(
+        target=fetcher.fetch, args=(urls, tmp_path / "track.mp4")
+    )
+    thread.start()
+
+    # While the first media segment is stalled only a window ahead is fetched
+    time.sleep(0.3)
+    with server.lock:
+        requested = list(server.requested)
+    gate.set()
+    thread.join(5)
+
+    assert len(requested) == window + 1
+    assert len(server.requested) == len(urls)
+
+
+def test_fetcher_can_be_cancelled(server, tmp_path):
+    cancelled = threading.Event()
+    cancelled.set()
+
+    urls = parse_mpd(MPD, server.url)
+    fetcher = HTDashFetcher(HTHttpClient())
+    assert not fetcher.fetch(urls, tmp_path / "track.mp4", None, cancelled)
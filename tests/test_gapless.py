@@ -0,0 +1,138 @@
+# test_gapless.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+import wave
+
+import pytest
+
+gi = pytest.importorskip("gi")
+gi.require_version("Gst", "1.0")
+
+from gi.repository import GLib, Gst  # noqa: E402
+
+Gst.init(None)
+
+if Gst.ElementFactory.find("playbin3") is None:
+    pytest.skip("playbin3 is not available", allow_module_level=True)
+
+# Half a sample at the lowest rate, the tolerance of the gap check
+TOLERANCE = Gst.SECOND // 88200
+
+
+def _write_wav(path, rate, seconds):
+    with wave.open(str(path), "wb") as file:
+        file.setnchannels(2)
+        file.setsampwidth(2)
+        file.setframerate(rate)
+        file.writeframes(b"\x01\x00" * 2 * int(rate * seconds))
+    return Gst.filename_to_uri(str(path))
+
+
+def _play_gapless(uris):
+    """Play files one after the other like the player does for gapless
+    playback with the PipeWire sink, but through a fakesink.
+
+    Returns:
+        tuple: The running time and duration of every buffer reaching the
+            sink, and the formats it received
+    """
+    playbin = Gst.ElementFactory.make("playbin3", None)
+    audio_bin = Gst.parse_bin_from_description(
+        "audioconvert ! audioresample ! capsfilter name=handoff-caps !"
+        " fakesink name=output sync=false signal-handoffs=true",
+        True,
+    )
+    playbin.set_property("audio-sink", audio_bin)
+    capsfilter = audio_bin.get_by_name("handoff-caps")
+    output = audio_bin.get_by_name("output")
+
+    buffers = []
+    formats = []
+
+    def on_handoff(sink, buffer, pad):
+        segment = pad.get_sticky_event(Gst.EventType.SEGMENT, 0).parse_segment()
+        start = segment.to_running_time(Gst.Format.TIME, buffer.pts)
+        buffers.append((start, buffer.duration))
+        caps = pad.get_current_caps().to_string()
+        if not formats or formats[-1] != caps:
+            formats.append(caps)
+
+    pending = list(uris[1:])
+
+    def on_about_to_finish(playbin):
+        if pending:
+            # Pinned like PlayerObject._pin_handoff_caps
+            sink_pad = output.get_static_pad("sink")
+            capsfilter.set_property("caps", sink_pad.get_current_caps())
+            playbin.set_property("uri", pending.pop(0))
+
+    output.connect("handoff", on_handoff)
+    playbin.connect("about-to-finish", on_about_to_finish)
+    playbin.set_property("uri", uris[0])
+
+    loop = GLib.MainLoop()
+    errors = []
+    bus = playbin.get_bus()
+    bus.add_signal_watch()
+    bus.connect("message::eos", lambda *args: loop.quit())
+    bus.connect(
+        "message::error",
+        lambda bus, message: (errors.append(message.parse_error()), loop.quit()),
+    )
+    GLib.timeout_add_seconds(10, loop.quit)
+
+    playbin.set_state(Gst.State.PLAYING)
+    loop.run()
+    playbin.set_state(Gst.State.NULL)
+    bus.remove_signal_watch()
+
+    assert not errors
+    return buffers, formats
+
+
+def _assert_no_gap(buffers, total):
+    position = 0
+    for start, duration in buffers:
+        assert abs(start - position) <= TOLERANCE
+        position = start + duration
+    assert abs(position - total) <= len(buffers) * TOLERANCE
+
+
+def test_same_format_plays_without_gap(tmp_path):
+    uris = [_write_wav(tmp_path / f"{i}.wav", 44100, 0.5) for i in range(2)]
+
+    buffers, formats = _play_gapless(uris)
+
+    _assert_no_gap(buffers, Gst.SECOND)
+    assert len(formats) == 1
+
+
+def test_format_change_is_converted_without_gap(tmp_path):
+    uris = [
+        _write_wav(tmp_path / "first.wav", 44100, 0.5),
+        _write_wav(tmp_path / "second.wav", 48000, 0.5),
+    ]
+
+    buffers, formats = _play_gapless(uris)
+
+    # The sink keeps the format of the first track
+    _assert_no_gap(buffers, Gst.SECOND)
+    assert len(formats) == 1
+    assert "rate=(int)44100" in formats[0]
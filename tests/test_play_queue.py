@@ -0,0 +1,198 @@
+# test_play_queue.py
+#
+# Copyright 2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("gi")
+pytest.importorskip("tidalapi")
+
+from gi.repository import GLib
+
+from lib.play_queue import HTPlayQueue, _ShuffleOrder
+from lib.track_source import HTTrackSource
+
+
+def _tracks(size, unavailable=()):
+    return [
+        SimpleNamespace(id=i, available=i not in unavailable) for i in range(size)
+    ]
+
+
+def _flush_idle():
+    context = GLib.MainContext.default()
+    while context.iteration(False):
+        pass
+
+
+class FakeFetch:
+    def __init__(self, tracks):
+        self.tracks = tracks
+        self.offsets = []
+        # Cleared to hold the pages in flight, like a slow network
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, limit, offset):
+        self.gate.wait(5)
+        self.offsets.append(offset)
+        return self.tracks[offset : offset + limit]
+
+
+def test_first_available_loads_the_next_pages():
+    fetch = FakeFetch(_tracks(30, unavailable=range(5, 20)))
+    source = HTTrackSource(fetch, 30, page_size=10)
+
+    assert source.first_available(5, load=True) == 20
+    assert fetch.offsets == [0, 10, 20]
+
+
+def test_first_available_wraps_around():
+    fetch = FakeFetch(_tracks(30, unavailable=range(5, 30)))
+    source = HTTrackSource(fetch, 30, page_size=10)
+
+    assert source.first_available(5, load=True) == 0
+
+
+def test_next_available_does_not_wrap_over_a_missing_page():
+    tracks = _tracks(30, unavailable=range(5, 10))
+    fetch = FakeFetch(tracks)
+    fetch.gate.clear()
+    source = HTTrackSource(fetch, 30, page_size=10)
+    source.add_page(0, tracks[:10])
+
+    play_queue = HTPlayQueue()
+    play_queue.set_source(source, 5)
+
+    # The next available track is on the second page, which is loading
+    assert play_queue.next_available(5) is None
+
+    fetch.gate.set()
+    source.load(10)
+    assert play_queue.next_available(5) == 10
+
+
+def test_next_track_waits_for_its_page():
+    fetch = FakeFetch(_tracks(30))
+    fetch.gate.clear()
+    source = HTTrackSource(fetch, 30, page_size=10)
+
+    play_queue = HTPlayQueue()
+    play_queue.set_source(source, 15)
+    assert not play_queue.next_loaded()
+
+    fetch.gate.set()
+    source.load(15)
+    assert play_queue.next_loaded()
+    assert play_queue.pop_next().id == 15
+
+
+def test_short_page_shrinks_the_source():
+    # The source announces more tracks than the pages really have
+    tracks = _tracks(25)
+    source = HTTrackSource(FakeFetch(tracks), 30, page_size=10)
+    source.add_page(0, tracks[:10])
+    source.add_page(10, tracks[10:20])
+
+    play_queue = HTPlayQueue()
+    play_queue.set_source(source, 20)
+    source.load(20)
+    assert len(source) == 25
+    assert source.is_missing(27)
+    with pytest.raises(IndexError):
+        source[27]
+
+    # The missing tracks are skipped before the queue knows the new size
+    ids = []
+    for _i in range(6):
+        assert play_queue.next_loaded()
+        ids.append(play_queue.pop_next().id)
+    assert ids == [20, 21, 22, 23, 24, 0]
+
+    _flush_idle()
+    assert len(play_queue.upcoming) == 19
+    assert play_queue.pop_next().id == 1
+
+
+def test_queue_insert_and_remove():
+    play_queue = HTPlayQueue()
+    play_queue.set_source(_tracks(3))
+    for track in _tracks(3):
+        play_queue.add(track)
+
+    extra = SimpleNamespace(id=10, available=True)
+    play_queue.insert(1, extra)
+
+    assert [track.id for track in play_queue.queue] == [0, 10, 1, 2]
+    assert play_queue.remove(1) is extra
+    assert [track.id for track in play_queue.queue] == [0, 1, 2]
+
+
+def test_shuffle_order_is_a_permutation_from_the_anchor():
+    order = _ShuffleOrder(50, 17, seed=3)
+    positions = [order.position(step) for step in range(50)]
+
+    assert positions[0] == 17
+    assert sorted(positions) == list(range(50))
+    for step, position in enumerate(positions):
+        assert order.step_of(position) == step
+
+
+def test_shuffle_order_is_reproducible():
+    first = _ShuffleOrder(50, 17, seed=3)
+    second = _ShuffleOrder(50, 17, seed=3)
+    # Looked up out of order, the lazy generation gives the same result
+    assert second.step_of(first.position(40)) == 40
+
+    assert [first.position(step) for step in range(50)] == [
+        second.position(step) for step in range(50)
+    ]
+
+
+def test_unshuffle_continues_from_the_playing_track():
+    play_queue = HTPlayQueue()
+    play_queue.set_source(_tracks(10))
+    play_queue.pop_next()
+
+    play_queue.set_shuffle(True, seed=5)
+    playing = play_queue.pop_next()
+
+    play_queue.set_shuffle(False)
+    assert play_queue.pop_next().id == (playing.id + 1) % 10
+
+
+def test_shuffled_queue_is_restored():
+    tracks = _tracks(10)
+    play_queue = HTPlayQueue()
+    play_queue.set_source(tracks)
+    play_queue.set_shuffle(True, seed=5)
+    for _i in range(3):
+        play_queue.pop_next()
+
+    state, saved = play_queue.get_state()
+    restored = HTPlayQueue()
+    restored.restore_state(state, saved)
+
+    assert restored.shuffle_state() == play_queue.shuffle_state()
+    assert [track.id for track in restored.upcoming] == [
+        track.id for track in play_queue.upcoming
+    ]